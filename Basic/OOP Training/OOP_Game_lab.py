@@ -1,17 +1,54 @@
 #!/usr/bin/python3
 
+# Started from the command line the game asks for the hero's name before this file and the game's
+# modules have finished loading, see startup.py. startup.run() plays the whole game and exits.
+if __name__ == "__main__":
+    import startup
+    startup.run()
+
 #from typing_extensions import final
 import utils
+import catalog
+import commands
+import dice
+import horde
+import journal
+import lazy_dungeon
+import room_state
+import savegame
+import tuning
+import threading
 import time
 import os
 
 class scenario():
-    def __init__(self, name):
+    # name=None leaves the hero to be made later with nameHero(), see WorldLoader
+    def __init__(self, name, dungeon=None, hero_file=utils.HERO_FILE, hero=None, seed=None, rng=None):
         self.realm_name = "Kingdom of Derp"
         self.hero_name = name
         self.dungeon_boss_key_captured = False
-        self.instantiateWorld()
-        self.createHero()
+        self.location = 1
+        # Every roll in this world comes from here, the same seed plays the same game
+        if rng is None:
+            rng = dice.GameRng(seed)
+        self.rng = rng
+        if dungeon is None:
+            self.instantiateWorld()
+        else:
+            # A pre-generated dungeon, e.g. a dungeon_gen.DungeonView
+            self.dungeon = dungeon
+        if hero is not None:
+            self.hero = hero
+        elif name is not None:
+            self.createHero(hero_file)
+
+    @classmethod
+    def fromSave(cls, path=savegame.SAVE_FILE, hero_file=utils.HERO_FILE):
+        saved = savegame.load_world(path, hero_file=hero_file)
+        world = cls(saved["hero"].name, dungeon=saved["dungeon"], hero=saved["hero"])
+        world.location = saved["location"]
+        world.dungeon_boss_key_captured = saved["boss_key_captured"]
+        return world
 
     def instantiateWorld(self):
         # The util.py will contain the template for each dungeon room
@@ -20,7 +57,7 @@ class scenario():
         counter = 6
         while counter > 0:
             counter -= 1
-            self.dungeon.append(utils.produce_room_template(counter))
+            self.dungeon.append(utils.produce_room_template(counter, self.rng))
         if len(self.dungeon) != 6:
             print("[!] ERROR! world construction failure...")
             exit(-3)
@@ -28,41 +65,97 @@ class scenario():
 
         return
 
-    def createHero(self):
-        self.hero = utils.Hero(self.hero_name)
+    def createHero(self, hero_file=utils.HERO_FILE):
+        self.hero = utils.Hero(self.hero_name, hero_file=hero_file, rng=self.rng)
         return
 
+    def nameHero(self, name, hero_file=utils.HERO_FILE):
+        self.hero_name = name
+        self.createHero(hero_file)
+
+    def save(self, path=savegame.SAVE_FILE):
+        return savegame.save_world(self, path)
+
+
+
+class TerminalIO():
+    # Everything main() does to talk to the player's terminal. replay.py swaps in a scripted version
+    # with no delays, no screen clears, no HUD and no files on disk.
+    hero_file = utils.HERO_FILE
+    save_file = savegame.SAVE_FILE
+
+    def __init__(self, record=None):
+        # record: an open text file that gets a copy of every line the player types
+        self.record = record
+
+    def input(self, prompt=''):
+        line = input(prompt)
+        if self.record is not None:
+            self.record.write(line + "\n")
+            self.record.flush()
+        return line
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def clear(self):
+        os.system("cls")
+
+    def launch_hud(self):
+        utils.LaunchHud()
+
+
+class WorldLoader():
+    # Builds the world on a thread while main() asks for the hero's name and tells the intro: the
+    # dungeon right away, the hero (and his first save to HeroObject.json) once name() gives his name.
+    # world() waits for it. The dice are drawn in the same order as building it in one go, so a seed
+    # plays the same game either way.
+    def __init__(self, hero_file=utils.HERO_FILE, seed=None, rooms=None, horde_size=None):
+        self.hero_file = hero_file
+        self.seed = seed
+        self.rooms = rooms
+        self.horde_size = horde_size
+        self.hero_name = None
+        self.named = threading.Event()
+        self.result = None
+        self.error = None
+        # How long world() had to wait for the thread
+        self.waited = 0.0
+        self.thread = threading.Thread(target=self.build, name="world-loader", daemon=True)
+        self.thread.start()
+
+    def build(self):
+        try:
+            dungeon = None
+            if self.rooms is not None:
+                dungeon = lazy_dungeon.LazyDungeon(self.rooms, self.seed)
+            world = scenario(None, dungeon=dungeon, seed=self.seed)
+            self.named.wait()
+            world.nameHero(self.hero_name, self.hero_file)
+            if self.horde_size is not None:
+                world.dungeon[world.location]['enemies'] = horde.make_horde(self.horde_size, world.rng)
+            # utils.LaunchHud() needs it next, better loaded here than while the player waits
+            import subprocess
+            self.result = world
+        except BaseException as ex:
+            # exit() included, the main thread raises it again in world()
+            self.error = ex
+
+    def name(self, name):
+        self.hero_name = name
+        self.named.set()
 
+    def world(self):
+        start = time.perf_counter()
+        self.thread.join()
+        self.waited = time.perf_counter() - start
+        if self.error is not None:
+            raise self.error
+        return self.result
 
-def main():
-    print("\tWelcome to Meh! An ok dungeon crawler game designed to exist.\n\n")
-
-    name = ''
-    try:
-        name = input("What's your name great warrior? ")
-    except:
-        print("Since you can't get your name figured out You shouldn't embark on this quest. Bye.")
-        exit(-1)
-
-    # intantiate scenario object here
-    world = scenario(name)
-    # I need to build a dictionary that can be saved to disk with all the important HUD related details via json.
-    
-    print("Old man -- Welcome {0}! The land is in great danger!".format(name))
-    time.sleep(1)
-    print("Old man -- I've set aside what armor and weapons I could. I hope it helps!")
-    time.sleep(1)
-
-    input("[!] When ready hit enter.")
-    os.system("cls")
-
-    utils.LaunchHud()
-    
-    print("Narration - At the entrance of the frightful dungeon you see a piece of parchment on the ground.")
-    time.sleep(2)
-    print("Narration - You pick it up and read it.")
 
-    print('''
+# The note at the dungeon's entrance
+PARCHMENT = '''
        ____________________________________________________________
      / \                                                           \.
     |   |                                                           |.
@@ -81,299 +174,601 @@ def main():
         |   ________________________________________________________|___
         |  /                                                           /.
         \_/___________________________________________________________/.
-    \n''')
-
-    location = 1
-    while True:         
-        # display game options
-        # I still need to build out the dictionary of choices and the below checks for what's going on and how to track it.
-        
-        if location == 0:
-            print('')
-        elif (location >= 1) and (location <= 5):
-            space = world.dungeon[location]
-            enemies = space['enemies']
-            treasure = space['treasure']
-
-            print(" [-] Current room location: {0}".format(location))
-            print(" [-] Enemies Present: ")
-            for num, enemy in enumerate(enemies):
-                print("\t [-] Enemy number: {0}".format(num + 1))
-                print("\t [-] Enemy health: {0}".format(enemy.stats['health']))
-                print("\t [-] Enemy weapons: {0}".format(enemy.stats['weapons']))
-                print("\t [-] Enemy armor: {0}".format(enemy.stats['armor']))
+    \n'''
+
+def main(resume_path=None, console=None, seed=None, stats=None, rooms=None, horde_size=None, name=None, loader=None,
+         events=None):
+    # stats: an instrument.Stats to record the session in, rooms: play a lazy_dungeon.LazyDungeon that long,
+    # horde_size: start in a room with that many enemies
+    # name and loader: startup.run() already asked for the name and started the WorldLoader
+    # events: a journal.Journal to log the session's events in, closed when the game ends
+    if console is None:
+        console = TerminalIO()
+    if resume_path is not None:
+        return play(resume(resume_path, console), console, stats, events)
+
+    # intantiate scenario object here, it's built while the player reads and types
+    if loader is None:
+        loader = WorldLoader(console.hero_file, seed, rooms, horde_size)
+
+    if name is None:
+        print("\tWelcome to Meh! An ok dungeon crawler game designed to exist.\n\n")
+        try:
+            name = console.input("What's your name great warrior? ")
+        except:
+            print("Since you can't get your name figured out You shouldn't embark on this quest. Bye.")
+            exit(-1)
+    loader.name(name)
+
+    if rooms is not None:
+        # Only the stock dungeon goes in SaveGame.bin
+        console.save_file = None
+        print(" [-] A dungeon {0:,} rooms deep awaits. Saving is turned off for dungeons this deep.".format(rooms))
+    if horde_size is not None:
+        # SaveGame.bin counts a room's enemies in 16 bits
+        console.save_file = None
+        print(" [-] A horde of {0:,} awaits. Saving is turned off for horde games.".format(horde_size))
+
+    # I need to build a dictionary that can be saved to disk with all the important HUD related details via json.
+    
+    print("Old man -- Welcome {0}! The land is in great danger!".format(name))
+    console.sleep(1)
+    print("Old man -- I've set aside what armor and weapons I could. I hope it helps!")
+    console.sleep(1)
+
+    console.input("[!] When ready hit enter.")
+    console.clear()
+
+    # The HUD reads HeroObject.json as soon as it starts, the world has to be ready from here on
+    world = loader.world()
+    console.launch_hud()
+    
+    print("Narration - At the entrance of the frightful dungeon you see a piece of parchment on the ground.")
+    console.sleep(2)
+    print("Narration - You pick it up and read it.")
 
-            # The decision options will be displayed here.
+    print(PARCHMENT)
 
+    return play(world, console, stats, events)
+
+def resume(path, console):
+    try:
+        world = scenario.fromSave(path, hero_file=console.hero_file)
+    except (OSError, savegame.SaveError) as ex:
+        print("[!] Couldn't resume the saved game: {0}".format(ex))
+        exit(-4)
+    print("Old man -- Welcome back {0}! The dungeon is just as you left it.".format(world.hero_name))
+    console.launch_hud()
+    return world
+
+def play(world, console, stats=None, events=None):
+    try:
+        session = GameSession(world, save_file=console.save_file, stats=stats, journal=events)
+        while session.over is None:
+            session.handle(console.input(session.prompt()))
+    finally:
+        if stats is not None and stats.path is not None:
+            stats.dump()
+        if events is not None:
+            events.close()
+    exit(0)
+
+
+class GameSession():
+    # One player's game, a typed line at a time. handle() plays out a command and the enemies' turn
+    # that follows it and passes everything the game has to say to say(), so the same game runs
+    # from the terminal (play() above, say=print) or from a socket (server.py). Commands are compiled
+    # by commands.py and played by the do_ methods in HANDLERS, a line of ';' separated commands is
+    # played as one batch.
+    # over is None while the game is on, then "died" or "won". stats is an instrument.Stats that
+    # times every command, None (the default) to skip all that. journal is a journal.Journal that
+    # gets every event of the game, also None by default.
+    def __init__(self, world, say=print, save_file=None, stats=None, journal=None):
+        self.world = world
+        self.say = say
+        self.save_file = save_file
+        self.over = None
+        self.stats = stats
+        self.journal = journal
+        # The commands.Batch of the batch that's running, None between batches
+        self.batch = None
+        # Rooms with this many enemies take their turn as a horde, see horde.py
+        self.horde_size = horde.HORDE_SIZE
+        if stats is not None:
+            stats.attach(world)
+            # Printing and saving are booked to phases of their own
+            self.say = stats.timed("output", say)
+            self.save_hero = stats.timed("hero_save", self.save_hero)
+            self.save_game = stats.timed("game_save", self.save_game)
+        self.enter_room(world.location)
+        if journal is not None:
+            self.journal_start()
+
+    def prompt(self):
+        return "[{}]> ".format(self.world.hero_name)
+
+    def enter_room(self, location):
+        world = self.world
+        say = self.say
+        self.location = location
+        # Autosave every time a room is entered so a crash or restart can pick up from here,
+        # once at the end of a batch
+        world.location = location
+        if self.batch is not None:
+            self.batch.game = True
+        elif self.save_file is not None:
+            self.save_game()
+
+        self.space = world.dungeon[location]
+        self.enemies = self.space['enemies']
+        self.treasure = self.space['treasure']
+        # Living enemies, threat and treasure, kept up to date below instead of rescanning the room
+        self.state = room_state.of(self.space)
+
+        say(" [-] Current room location: {0}".format(location))
+        if len(self.enemies) >= self.horde_size:
+            say(" [-] Enemies Present: a horde of {0}, {1} still standing (threat {2})".format(
+                len(self.enemies), self.state.alive, self.state.threat))
+            return
+        say(" [-] Enemies Present: ")
+        for num, enemy in enumerate(self.enemies):
+            say("\t [-] Enemy number: {0}".format(num + 1))
+            say("\t [-] Enemy health: {0}".format(enemy.stats['health']))
+            say("\t [-] Enemy weapons: {0}".format(enemy.stats['weapons']))
+            say("\t [-] Enemy armor: {0}".format(enemy.stats['armor']))
+
+    @property
+    def enemies_defeated(self):
+        return self.state.cleared()
+
+    def save_game(self):
+        written = self.world.save(self.save_file)
+        if self.stats is not None:
+            self.stats.game_saved(written)
+
+    def save_hero(self):
+        self.world.hero.write_hero_object_to_disk()
+
+    def handle(self, usr_input):
+        # Plays a typed line: one command, or a batch of ';' separated ones (see commands.py)
+        if self.over is not None:
+            return
+        ops = commands.compile_line(usr_input)
+        if len(ops) == 1:
+            self.run_op(ops[0])
+        elif ops:
+            self.run_batch(ops)
+
+    def run_batch(self, ops):
+        # Nothing runs when a command in the batch makes no sense. Otherwise the commands run back to
+        # back until the game is over, the output goes to say() in one piece at the end, and the hero
+        # and the autosave are written once, if anything asked for them.
+        turned_down = [op for op in ops if op.kind == commands.REJECTED]
+        if turned_down:
+            for op in turned_down:
+                self.say(" [!] '{0}': {1}".format(op.text, op.label))
+            self.say(" [!] None of the {0} commands were played.".format(len(ops)))
+            return
+        say = self.say
+        batch = self.batch = commands.Batch()
+        self.say = batch.say
+        try:
+            for op in ops:
+                if self.over is not None:
+                    break
+                self.run_op(op)
+        finally:
+            self.say = say
+            self.batch = None
+            if batch.lines:
+                say(batch.text())
+            if batch.hero:
+                self.save_hero()
+            if batch.game and self.save_file is not None:
+                self.save_game()
+
+    def run_op(self, op):
+        if self.journal is not None:
+            self.journal.begin_command()
+        if self.stats is None:
+            self.dispatch(op)
+        else:
+            self.stats.begin()
+            try:
+                self.dispatch(op)
+            finally:
+                self.stats.end(op.text)
+        if self.journal is not None:
+            self.journal.end_command()
+
+    def run_command(self, usr_input):
+        # One command, compiled and played
+        self.dispatch(commands.compile(usr_input))
+
+    def dispatch(self, op):
+        # A handler returns True when the enemies get their turn after the command
+        if self.HANDLERS[op.kind](self, op):
+            if self.stats is not None:
+                self.stats.switch("enemy_turn")
+            self.enemy_turn()
+
+    def hero_changed(self):
+        # The hero needs writing, at the end of the batch when one is running
+        if self.batch is None:
+            self.save_hero()
+        else:
+            self.batch.hero = True
+
+    def do_help(self, op):
+        rules(self.say)
+        return True
+
+    def do_heal(self, op):
+        world = self.world
+        world.hero.hero_attribs['health'] = tuning.HERO_HEALTH
+        self.say(" [!] Your health is now {0}".format(world.hero.hero_attribs['health']))
+        if self.journal is not None:
+            self.journal.event(journal.HEAL, self.location, b=world.hero.health)
+        return True
+
+    def do_nothing(self, op):
+        return False
+
+    def do_save(self, op):
+        self.world.location = self.location
+        if self.save_file is None:
+            self.say(" [-] Saving is turned off.")
         else:
-            # Boss Battle
-            # Location tracked
-            space = world.dungeon[location]
-            enemies = space.room['enemies']
-            treasure = space.room['treasure']
-
-        living_enemies = []
-        enemies_defeated = False
-        num_of_enemies = 0
-        for num, enemy in enumerate(enemies):
-            num_of_enemies += 1
-            if enemy.stats['health'] <= 0 :
-                living_enemies.append(False)
+            self.save_game()
+            self.say(" [-] Game saved. Run 'python OOP_Game_lab.py --resume' to pick it back up.")
+            if self.journal is not None:
+                self.journal.event(journal.SAVE, self.location)
+        return False
+
+    def do_look(self, op):
+        # Look at the current room's details
+        say = self.say
+        enemies = self.enemies
+        say("Current room location: {0}".format(self.location))
+        if len(enemies) >= self.horde_size:
+            say("Enemies Present: a horde of {0}, {1} still standing (threat {2})".format(
+                len(enemies), self.state.alive, self.state.threat))
+        else:
+            say("Enemies Present: ")
+            for num, enemy in enumerate(enemies):
+                say("\tEnemy number: {0}".format(num + 1))
+                say("\tEnemy health: {0}".format(enemy.stats['health']))
+                say("\tEnemy weapons: {0}".format(enemy.stats['weapons']))
+                say("\tEnemy armor: {0}".format(enemy.stats['armor']))
+        say()
+        say("Treasure: {0}".format(self.space['treasure']))
+        say("")
+        say("")
+        say("")
+        say("")
+        return True
+
+    def do_chill(self, op):
+        say = self.say
+        if len(self.enemies) >= self.horde_size and self.state.alive:
+            say("That's a bold move cotton... times {0}".format(self.state.alive))
+        else:
+            for __ in range(self.state.alive):
+                say("That's a bold move cotton...")
+        say("There is no time to waste... Quit sitting around...")
+        return True
+
+    def do_move_forward(self, op):
+        world = self.world
+        say = self.say
+        location = self.location
+        # The last room is behind the boss battle door, however long the dungeon is
+        last = len(world.dungeon) - 1
+        if (location == last - 1) and (world.dungeon_boss_key_captured == False):
+            say(" [-] You cannot open the boss battle door because you don't have the key...")
+        elif self.enemies_defeated == False:
+            say(" [-] You tried to slip past the enemies, but they've blocked the door.")
+        elif location == last:
+                say(" [-] You're in the final room. There is no next room to move into.")
+        else:
+            say(" [-] You moved forward to the next room")
+            self.enter_room(location + 1)
+            if self.journal is not None:
+                self.journal.event(journal.MOVE, location + 1, location)
+            return False
+        return True
+
+    def do_move_back(self, op):
+        world = self.world
+        location = self.location
+        if location == 1:
+            # If location 1 and the final room shows the boss is dead you can exit the dungeon
+            # Show congratulations when you beat the game.
+            dungeon_cleared = room_state.of(world.dungeon[len(world.dungeon) - 1]).cleared()
+
+            if  dungeon_cleared:
+                self.say(" [!] Congradulations! You won!")
+                self.over = "won"
+                if self.journal is not None:
+                    self.journal.event(journal.END, location, journal.WON)
             else:
-                living_enemies.append(True)
-        if True not in living_enemies:
-            enemies_defeated = True
-            
-        while True:
-            # Get Player command input
-            usr_input = input("[{}]> ".format(name))
-            if (usr_input == '?') or (usr_input.lower() == 'help'):
-                rules()
-            elif usr_input.lower() == 'heal':
-                world.hero.hero_attribs['health'] = 100
-                print(" [!] Your health is now {0}".format(world.hero.hero_attribs['health']))
-            elif (usr_input.lower() == ''):
-                continue
-            # Look at the current room's details
-            elif usr_input.lower() == 'look':
-                print("Current room location: {0}".format(location))
-                print("Enemies Present: ")
-                for num, enemy in enumerate(enemies):
-                    print("\tEnemy number: {0}".format(num + 1))
-                    print("\tEnemy health: {0}".format(enemy.stats['health']))
-                    print("\tEnemy weapons: {0}".format(enemy.stats['weapons']))
-                    print("\tEnemy armor: {0}".format(enemy.stats['armor']))
-                print()
-                print("Treasure: {0}".format(space['treasure']))
-                print("")
-                print("")
-                print("")
-                print("")
-
-            elif (usr_input.lower() == 'chill'):
-                for num, enemy in enumerate(enemies):
-                    if enemy.stats['health'] > 0 :
-                        print("That's a bold move cotton...")
-                print("There is no time to waste... Quit sitting around...")
-            elif (len(usr_input.split(" ")) > 1):
-                split_input = usr_input.split(" ")
-                # MOVE
-                if split_input[0].lower() == 'move':
-                    # Move FOWARD
-                    if split_input[1].lower() == "forward":
-                        if (location == 4) and (world.dungeon_boss_key_captured == False):
-                            print(" [-] You cannot open the boss battle door because you don't have the key...")
-                        elif enemies_defeated == False:
-                            print(" [-] You tried to slip past the enemies, but they've blocked the door.")
-                        elif location == 5:
-                                print(" [-] You're in the final room. There is no next room to move into.")
-                        else:
-                            location += 1
-                            print(" [-] You moved forward to the next room")
-                            break
-
-                    # Move BACKWARD
-                    elif (split_input[1].lower() == "back") or (split_input[1].lower() == "backward"):
-                        if location == 1:
-                            dungeon_cleared = False
-                            final_enemies = []
-                            final_boss = world.dungeon[5]['enemies']
-                            for __,boss in enumerate(final_boss):
-                                if boss.stats['health'] <= 0:
-                                    final_enemies.append(True)
-                                else:
-                                    final_enemies.append(False)
-                            if True not in final_enemies:
-                                dungeon_cleared = False
-
-                            if  dungeon_cleared:
-                                print(" [!] Congradulations! You won!")
-                                exit(0)
-                            else:
-                                print(" [-] Don't be a coward. You can't leave now; you're already in it.")
-                                continue
-                        else:
-                            # If location 1 and the final room shows the boss is dead you can exit the dungeon
-                            # Show congratulations when you beat the game.
-                            location -= 1
-                            break
-                    else:
-                        print("Invalid Movement...")
-                        continue
-                # ATTACK
-                elif split_input[0].lower() == 'attack':
-                    # check for living enemies
-                    if enemies_defeated == True:
-                        print(" [-] There are no living enemies in this room.")
-                        continue
-                    # Attack specific enemy
-                    if enemies[int(split_input[1])-1].stats['health'] == 0:
-                        print(" [-] Enemey is already dead. You don't have time to stand around smacking dead enemies.")
-                        continue
-                    try:
-                        # Calculate attack damage
-                        # attack_results = [die1, die2, die1+die2]
-                        roll_result =  utils.roll_dice()
-                        weapons = world.hero.hero_attribs['weapons']
-                        weapon_damage = 0
-
-                        #for index,weapon in enumerate([weapons]):
-                            #weapon_damage += weapons[index][1]
-                        weapon_damage += weapons[1]
-                            # attack_damage is the final attack value
-                        attack_damage = weapon_damage + roll_result[2]
-
-                        # Calculate defensive block value of enemy
-                        armor = enemies[int(split_input[1])-1].stats['armor']
-                        defensive_value = 0
-                        #for index,value in enumerate(armor):
-                                #defensive_value = armor[value]
-                        if armor == []:
-                            pass
-                        else:
-                            defensive_value = armor[1]
-                        
-                        final_damage = attack_damage - defensive_value
-                        if final_damage < 0:
-                            final_damage = 0
-                        # subtract attack damage from enemy's health
-                        print(" [-] You did {0} of damage to enemy # {1}".format(final_damage,split_input[1]))
-                        enemies[int(split_input[1])-1].stats['health'] = enemies[int(split_input[1])-1].stats['health'] - final_damage
-                        # Repleace negative health value with 0 
-                        if enemies[int(split_input[1])-1].stats['health'] < 0:
-                            enemies[int(split_input[1])-1].stats['health'] = 0
-
-                        print(" [-] Enemy {0}'s health is down to {1}".format(split_input[1],enemies[int(split_input[1])-1].stats['health']))
-
-                    # check for enemy death and perform item drop function that should be standardized between treasure chests and enemies.
-
-                    except Exception as ex:
-                        print(ex)
-                        continue
-                # TAKE
-                elif split_input[0].lower() == 'take':
-                    if split_input[1].lower() == 'treasure':
-                        if (split_input[2].lower() == 'key') and ('boss_key' in treasure[0]):
-                            world.dungeon_boss_key_captured = True
-                            world.hero.hero_attribs["boss_key"] = True
-                            print(" [-] You have retrieved the boss key!")
-                            treasure = []
-                            space['treasure'] = []
-                            world.dungeon[location]['treasure'] = []
-                        elif (split_input[2].lower() == treasure[0][0]):
-                            pass
-                        else:
-                            print(" [*] Not yet implemented.")
-                    elif split_input[1].lower() == 'enemy':
-                        if split_input[3] == 'weapon':
-                            # Current logic will allow you to steal a weapon from a living enemy. 
-                            for index, item in enumerate(enemies[int(split_input[2]) - 1].stats['weapons']):
-                                try:
-                                    if item[0] == split_input[4]:
-                                        world.hero.hero_attribs['weapons'] = enemies[int(split_input[2]) - 1].stats['weapons'][index]
-                                        print(world.hero.hero_attribs['weapons'])
-                                        enemies[int(split_input[2]) - 1].stats['weapons'][index] = []
-                                except:
-                                    pass
-                                    # This is for when the itteration hits an empty sublist. 
-
-                        elif split_input[3] == 'armor':
-                            #if split_input[3] in enemies[int(split_input[2]) - 1].stats['armor']:
-                                #world.hero.hero_attribs['armor'] = enemies[int(split_input[2]) - 1].stats['armor']
-                                #print(world.hero.hero_attribs['armor'])
-                            #for index, item in enumerate(enemies[int(split_input[2]) - 1].stats['armor']):
-                            if split_input[4] in enemies[int(split_input[2]) - 1].stats['armor']:
-                                world.hero.hero_attribs['armor'] = enemies[int(split_input[2]) - 1].stats['armor']
-                                print(world.hero.hero_attribs['armor'])
-                                enemies[int(split_input[2]) - 1].stats['armor'] = []
-
-                    else:
-                        print(" [!] Invalid option.")
-                else:
-                    continue
-
+                self.say(" [-] Don't be a coward. You can't leave now; you're already in it.")
+        else:
+            self.enter_room(location - 1)
+            if self.journal is not None:
+                self.journal.event(journal.MOVE, location - 1, location)
+        return False
+
+    def do_bad_move(self, op):
+        self.say("Invalid Movement...")
+        return False
+
+    def enemy_numbered(self, op):
+        # The enemy op names, None (and a word about it) when the room has no such enemy
+        if op.number > len(self.enemies):
+            self.say(" [!] There is no enemy {0} in this room.".format(op.label))
+            return None
+        return self.enemies[op.number - 1]
+
+    def do_attack(self, op):
+        world = self.world
+        say = self.say
+        # check for living enemies
+        if self.enemies_defeated == True:
+            say(" [-] There are no living enemies in this room.")
+            return False
+        # Attack specific enemy
+        target = self.enemy_numbered(op)
+        if target is None:
+            return False
+        if target.health == 0:
+            say(" [-] Enemey is already dead. You don't have time to stand around smacking dead enemies.")
+            return False
+        try:
+            # Calculate attack damage: weapon + 2d6 - the enemy's armor
+            health_before = target.health
+            final_damage = utils.hero_attack(world.hero.hero_attribs, target, world.rng)
+            self.state.damaged(target, health_before)
+            say(" [-] You did {0} of damage to enemy # {1}".format(final_damage, op.label))
+            say(" [-] Enemy {0}'s health is down to {1}".format(op.label, target.health))
+            if self.journal is not None:
+                self.journal.event(journal.ATTACK, self.location, op.number, final_damage, target.health,
+                                   journal.KILLED if target.health <= 0 else 0)
+            if health_before > 0 and target.health <= 0:
+                self.drop_loot(op.number)
+
+        except Exception as ex:
+            say(ex)
+            return False
+        return True
+
+    def do_take_treasure(self, op):
+        # Takes the first thing in the room's treasure called op.item ('key' for the boss key), the
+        # rest of the treasure stays where it is
+        world = self.world
+        treasure = self.treasure
+        if not treasure:
+            self.say(" [-] There is no treasure in this room.")
+            return False
+        name = "boss_key" if op.item == "key" else op.item
+        index = None
+        for num, item in enumerate(treasure):
+            if item[0] == name:
+                index = num
+                break
+        if index is None:
+            self.say(" [-] There is no {0} in this room's treasure.".format(op.item))
+            return True
+        item = treasure.pop(index)
+        self.state.treasure_taken(self.space)
+        if name == "boss_key":
+            world.dungeon_boss_key_captured = True
+            world.hero.hero_attribs["boss_key"] = True
+            self.say(" [-] You have retrieved the boss key!")
+            if self.journal is not None:
+                self.journal.event(journal.TAKE, self.location, journal.KEY)
+        elif name in utils.WEAPON_IDS:
+            world.hero.hero_attribs['weapons'] = item
+            self.say(world.hero.hero_attribs['weapons'])
+            if self.journal is not None:
+                self.journal.event(journal.TAKE, self.location, journal.WEAPON, world.hero.weapon_id,
+                                   world.hero.weapon_damage)
+        elif name in utils.ARMOR_IDS:
+            world.hero.hero_attribs['armor'] = item
+            self.say(world.hero.hero_attribs['armor'])
+            if self.journal is not None:
+                self.journal.event(journal.TAKE, self.location, journal.ARMOR, world.hero.armor_id,
+                                   world.hero.armor_value)
+        else:
+            # A heart heals by what it's worth, up to full health
+            world.hero.hero_attribs['health'] = min(tuning.HERO_HEALTH, world.hero.health + item[1])
+            self.say(" [!] Your health is now {0}".format(world.hero.hero_attribs['health']))
+            if self.journal is not None:
+                self.journal.event(journal.TAKE, self.location, journal.HEART, -1, item[1])
+        return True
+
+    def do_take_weapon(self, op):
+        world = self.world
+        enemy = self.enemy_numbered(op)
+        if enemy is None:
+            return False
+        # Current logic will allow you to steal a weapon from a living enemy.
+        item = catalog.CATALOG.find(op.item, catalog.WEAPON)
+        if item is not None:
+            index = enemy.weapon_index(item.id)
+            if index is not None:
+                world.hero.hero_attribs['weapons'] = enemy.weapon(index)
+                self.say(world.hero.hero_attribs['weapons'])
+                damage_before = enemy.attack_damage()
+                enemy.set_weapon(index, [])
+                self.state.weapon_taken(enemy, damage_before)
+                if self.journal is not None:
+                    self.journal.event(journal.TAKE, self.location, journal.WEAPON, world.hero.weapon_id,
+                                       world.hero.weapon_damage, journal.FROM_ENEMY)
+        return True
+
+    def do_take_armor(self, op):
+        world = self.world
+        enemy = self.enemy_numbered(op)
+        if enemy is None:
+            return False
+        item = catalog.CATALOG.find(op.item, catalog.ARMOR)
+        if item is not None and enemy.armor_id == item.id:
+            world.hero.hero_attribs['armor'] = enemy.armor()
+            self.say(world.hero.hero_attribs['armor'])
+            enemy.set_armor([])
+            self.state.armor_taken()
+            if self.journal is not None:
+                self.journal.event(journal.TAKE, self.location, journal.ARMOR, world.hero.armor_id,
+                                   world.hero.armor_value, journal.FROM_ENEMY)
+        return True
+
+    def do_take_other(self, op):
+        return self.enemy_numbered(op) is not None
+
+    def do_bad_take(self, op):
+        self.say(" [!] Invalid option.")
+        return True
+
+    def do_ignored(self, op):
+        return False
+
+    def do_invalid(self, op):
+        self.say("Invalid option submitted.....")
+        return True
+
+    def do_rejected(self, op):
+        self.say(" [!] {0}".format(op.label))
+        return False
+
+    # commands.py op kind -> handler
+    HANDLERS = {
+        commands.HELP: do_help,
+        commands.HEAL: do_heal,
+        commands.NOTHING: do_nothing,
+        commands.SAVE: do_save,
+        commands.LOOK: do_look,
+        commands.CHILL: do_chill,
+        commands.MOVE_FORWARD: do_move_forward,
+        commands.MOVE_BACK: do_move_back,
+        commands.BAD_MOVE: do_bad_move,
+        commands.ATTACK: do_attack,
+        commands.TAKE_TREASURE: do_take_treasure,
+        commands.TAKE_WEAPON: do_take_weapon,
+        commands.TAKE_ARMOR: do_take_armor,
+        commands.TAKE_OTHER: do_take_other,
+        commands.BAD_TAKE: do_bad_take,
+        commands.IGNORED: do_ignored,
+        commands.INVALID: do_invalid,
+        commands.REJECTED: do_rejected
+        }
+
+    def enemy_turn(self):
+        # Enemy actions happen here.
+        world = self.world
+        say = self.say
+        # check enemy living status
+        if self.enemies_defeated == True:
+            return
+        if len(self.enemies) >= self.horde_size:
+            return self.horde_turn()
+
+        # Loop through the enemies present
+        for num, enemy in enumerate(self.enemies):
+            if enemy.health <= 0 :
+                pass
             else:
-                print("Invalid option submitted.....")
-            
-            # Enemy actions happen here.
-            # check enemy living status
-            living_enemies = []
-            for num, enemy in enumerate(enemies):
-                if enemy.stats['health'] <= 0 :
-                    living_enemies.append(False)
+                # roll dice to determine enemy action
+                action = utils.enemy_action(world.hero.hero_attribs, enemy, world.rng)
+                if self.journal is not None:
+                    self.journal_enemy_action(num + 1, action)
+                if action['defended']:
+                    # Move / take a defensive position
+                    say(" [-] Enemy {0} has moved or is taking up a defensive position.".format(num+1))
                 else:
-                    living_enemies.append(True)
-            if True not in living_enemies:
-                enemies_defeated = True
-            
-            if enemies_defeated == True:
-                continue
-
-            # Loop through the enemies present
-            for num, enemy in enumerate(enemies):
-                if enemy.stats['health'] <= 0 :
-                    pass
+                    if action['lucky_dodge']:
+                        say(" [-] You feel this fight in your bones and are determined to win.")
+                    if action['dagger_dodge']:
+                        say(" [-] The light weight of your dagger seems to almost make you faster!")
+                    if action['shield_dodge']:
+                        say(" [-] You put your shield up and defend yourself. Bracinging yourself for the onslought!")
+                    if action['died']:
+                        # Make sure the HUD sees the final blow before we go
+                        world.hero.store.flush()
+                        utils.youDied(say)
+                        self.over = "died"
+                        if self.journal is not None:
+                            self.journal.event(journal.END, self.location, journal.DIED)
+                        return
+                    elif action['damage'] is not None:
+                        say(" [!] You took {0} damage".format(action['damage']))
+                        say(" [!] Your health is now {0}".format(world.hero.hero_attribs['health']))
+            self.hero_changed()
+
+    def horde_turn(self):
+        # The whole room at once and one line about it instead of a few per enemy
+        world = self.world
+        say = self.say
+        turn = horde.horde_turn(world.hero.hero_attribs, self.state.living, world.rng)
+        say(horde.summary(turn))
+        if self.journal is not None:
+            self.journal.event(journal.HORDE, self.location, turn["acted"], turn["hits"], turn["damage"],
+                               journal.DIED if turn["died"] else 0)
+        if turn["died"]:
+            world.hero.store.flush()
+            utils.youDied(say)
+            self.over = "died"
+            if self.journal is not None:
+                self.journal.event(journal.END, self.location, journal.DIED)
+            return
+        if turn["hits"]:
+            say(" [!] Your health is now {0}".format(world.hero.hero_attribs['health']))
+        self.hero_changed()
+
+    def drop_loot(self, number):
+        # Enemy number just died, what it drops lands in the room's treasure
+        dropped = utils.loot_drop(self.world, self.space)
+        if not dropped:
+            return
+        self.treasure = self.space['treasure']
+        self.state.loot_dropped(self.space)
+        for item in dropped:
+            self.say(" [-] Enemy {0} dropped {1}".format(number, item))
+            if self.journal is not None:
+                name, value = item
+                if name in utils.WEAPON_IDS:
+                    self.journal.event(journal.LOOT, self.location, number, utils.WEAPON_IDS[name], value, journal.WEAPON)
+                elif name in utils.ARMOR_IDS:
+                    self.journal.event(journal.LOOT, self.location, number, utils.ARMOR_IDS[name], value, journal.ARMOR)
                 else:
-                    # roll dice to determine enemy action
-                    roll_result = utils.roll_dice()
-                    if roll_result[2] > 10:
-                        # Move / take a defensive position
-                        print(" [-] Enemy {0} has moved or is taking up a defensive position.".format(num+1))
-                    else:
-                        # Enemy Attack
-                        roll_result =  utils.roll_dice()
-                        weapons = enemy.stats['weapons']
-                        weapon_damage = 0
-                        for index,weapon in enumerate([weapons]):
-                            try:
-                                weapon_damage += weapons[index][1]
-                            except:
-                                weapon_damage = 0
-
-                        # Need to calculate:
-                        #   cumulative attack damage
-                        attack_damage = weapon_damage + roll_result[2]
-                        #   defensive amount
-                        armor = world.hero.hero_attribs['armor']
-                        defensive_value = 0
-                        defensive_value = armor[1]
-                        #   roll for dodge probability of player
-                        dodge = False
-                        lucky_dodge = utils.roll_dice()
-                        if lucky_dodge[2] >= 10:
-                            dodge = True
-                            print(" [-] You feel this fight in your bones and are determined to win.")
-                        #   check for hero dagger or shield perks
-                        if ('dagger' in world.hero.hero_attribs['weapons']):
-                            if utils.roll_dice()[2] > 8:
-                                dodge = True
-                                print(" [-] The light weight of your dagger seems to almost make you faster!")
-                        if ('shield' in world.hero.hero_attribs['armor']):
-                            if utils.roll_dice()[2] > 8:
-                                dodge = True
-                                print(" [-] You put your shield up and defend yourself. Bracinging yourself for the onslought!")
-                        if dodge == True:
-                            attack_damage = 0
-
-                        if attack_damage > 0:
-                            final_damage = attack_damage - defensive_value
-                            if final_damage < 0:
-                                final_damage = 0 
-                            # subtract the final calculated battle damage from player health.
-                            if (world.hero.hero_attribs['health'] - final_damage) > 0:
-                                print(" [!] You took {0} damage".format(final_damage))
-                                world.hero.hero_attribs['health'] = world.hero.hero_attribs['health'] - final_damage
-                                print(" [!] Your health is now {0}".format(world.hero.hero_attribs['health']))
-                            else:
-                                world.hero.hero_attribs['health'] = 0 
-                                utils.youDied()
-                                exit(0)
-                world.hero.write_hero_object_to_disk()    
-
-    return
-
-def rules():
-    print('''
+                    self.journal.event(journal.LOOT, self.location, number, -1, value, journal.HEART)
+
+    def journal_start(self):
+        world = self.world
+        seed = world.rng.seed
+        if not isinstance(seed, int) or seed < 0 or seed >= 2 ** 31:
+            seed = -1
+        self.journal.event(journal.START, self.location, len(world.dungeon), world.hero.health, seed)
+
+    def journal_enemy_action(self, number, action):
+        flags = 0
+        if action['defended']:
+            flags |= journal.DEFENDED
+        if action['lucky_dodge']:
+            flags |= journal.LUCKY_DODGE
+        if action['dagger_dodge']:
+            flags |= journal.DAGGER_DODGE
+        if action['shield_dodge']:
+            flags |= journal.SHIELD_DODGE
+        if action['died']:
+            flags |= journal.DIED
+        damage = action['damage']
+        if damage is None:
+            damage = -1
+        self.journal.event(journal.ENEMY, self.location, number, damage, self.world.hero.health, flags)
+
+def rules(say=print):
+    say('''
     ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
                                             Rules
     ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -392,7 +787,7 @@ def rules():
     ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
     ''')
 
-    print('''
+    say('''
     ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
                                             Decisions
     ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -410,37 +805,11 @@ def rules():
     6. 'look' : list the items and enemies visible in the room.
     7. 'attack' : ...
         a. attack <enemy number>
+    8. 'save' : save the game. The game also saves itself every time you enter a room.
 
     ''')
 
     return
 
-def display():
-    print('''
-                ...     ..      ..                            
-              x*8888x.:*8888: -"888:                .uef^"    
-             X   48888X `8888H  8888              :d88E       
-            X8x.  8888X  8888X  !888>       .u    `888E       
-            X8888 X8888  88888   "*8%-   ud8888.   888E .z8k  
-            '*888!X8888> X8888  xH8>   :888'8888.  888E~?888L 
-              `?8 `8888  X888X X888>   d888 '88%"  888E  888E 
-              -^  '888"  X888  8888>   8888.+"     888E  888E 
-               dx '88~x. !88~  8888>   8888L       888E  888E 
-             .8888Xf.888x:!    X888X.: '8888c. .+  888E  888E 
-            :""888":~"888"     `888*"   "88888%   m888N= 888> 
-                "~'    "~        ""       "YP'     `Y"   888  
-                                                        J88"  
-                                                        @%    
-                                                      :"      
-    ''')
-    print('''
-        ===============================================================
-        =          The Worlds most ok'est text based game             =
-        ===============================================================
-    ''')
-    return
-
-
-if __name__ == "__main__":
-    display()
-    main()
+# A recorded session that starts with this line replays with that seed
+SEED_LINE = "#seed "
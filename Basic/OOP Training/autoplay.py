@@ -0,0 +1,511 @@
+#!/usr/bin/python3
+
+# A bot that plays the stock dungeon well, for soak tests and as a difficulty baseline next to
+# balance.py's policies. Every turn it types one of the commands a player can (attack N, take enemy N
+# weapon X / armor X, take treasure key, heal, move forward/back) into OOP_Game_lab.GameSession,
+# picked by an expectimax search over the game's exact dice odds.
+#
+# The search doesn't play on the world itself. A State is the part of the world the rules look at, in
+# nested tuples: the location, the boss key, the hero (health, weapon, armor) and every room (its
+# enemies as (health, weapon 1, weapon 2, armor) records and whether the boss key lies there). States
+# never change, a move makes a new State that shares every room it didn't touch with the old one, so a
+# fork copies one room and a tuple of six references instead of the whole dungeon. Each State keeps
+# the hashes of its rooms next to them, so hashing a fork only hashes the room that changed.
+#
+# expand() knows the rules: for a State it lists the commands worth typing and, for each, every way the
+# dice can go with its probability (combat_odds.py's tables for the hero's attack and the enemies' turn,
+# which only matters through its total damage). Chance nodes average over those, the bot takes the best
+# command. At the search depth a State gets a heuristic value: GAMMA to the power of the commands the
+# rest of the game should take, times the odds of living through the next enemy turn either as things
+# stand or after healing (moving back to a cleared room, healing and coming back costs no enemy turn).
+# Values go in a transposition table keyed on the States themselves, so paths that meet (healing
+# forgets how hurt the hero was) are only worked out once.
+#
+#   python autoplay.py [games] [--depth N] [--seed N]    win rate against balance.py's policies on the same dungeons
+#   python autoplay.py check [commands]                  the search's rules against the real game
+#   python autoplay.py bench                             forking a State against deep-copying the world
+
+import copy
+import functools
+import random
+import sys
+import time
+
+import OOP_Game_lab
+import balance
+import combat_odds
+import dice
+import tuning
+import utils
+
+DEPTH = 1
+# Worth of a command: a State that's one command further from winning is worth GAMMA times as much
+GAMMA = 0.998
+# Chance outcomes less likely than this (along the whole path) aren't searched any deeper
+CUTOFF = 0.01
+# The transposition table starts over past this many entries
+TABLE_SIZE = 1000000
+# Rough cost of the damage taken on the way: a retreat, a heal and coming back for so much health
+HEAL_COMMANDS = 3
+HEAL_HEALTH = 80.0
+
+WON = "won"
+DIED = "died"
+
+# Enemy records
+HEALTH, WEAPON1_ID, WEAPON1_DAMAGE, WEAPON2_ID, WEAPON2_DAMAGE, ARMOR_ID, ARMOR_VALUE = range(7)
+# Hero records
+HERO_HEALTH, HERO_WEAPON_ID, HERO_WEAPON_DAMAGE, HERO_ARMOR_ID, HERO_ARMOR_VALUE = range(5)
+# Rooms
+ENEMIES, KEY_HERE = range(2)
+
+DAGGER_ID = utils.WEAPON_IDS.get("dagger")
+SHIELD_ID = utils.ARMOR_IDS.get("shield")
+
+
+class State:
+    # location, key (the boss key was taken), hero record, rooms and their hashes. Never changed
+    # after it's made, see the fork methods below.
+    __slots__ = ("location", "key", "hero", "rooms", "room_hashes", "hash")
+
+    def __init__(self, location, key, hero, rooms, room_hashes):
+        self.location = location
+        self.key = key
+        self.hero = hero
+        self.rooms = rooms
+        self.room_hashes = room_hashes
+        self.hash = hash((location, key, hero, room_hashes))
+
+    @classmethod
+    def from_world(cls, world, location):
+        rooms = tuple(room_record(room) for room in world.dungeon)
+        hero = world.hero
+        return cls(location, world.dungeon_boss_key_captured,
+                   (hero.health, hero.weapon_id, hero.weapon_damage, hero.armor_id, hero.armor_value),
+                   rooms, tuple(hash(room) for room in rooms))
+
+    def __hash__(self):
+        return self.hash
+
+    def __eq__(self, other):
+        # Rooms a fork didn't touch are the same tuples, tuple == skips those by identity
+        return (self.hash == other.hash and self.location == other.location and self.key == other.key
+                and self.hero == other.hero and self.rooms == other.rooms)
+
+    def room(self):
+        return self.rooms[self.location]
+
+    # Forks: a new State sharing everything but what changed
+    def with_hero(self, hero):
+        return State(self.location, self.key, hero, self.rooms, self.room_hashes)
+
+    def with_health(self, health):
+        return self.with_hero((health,) + self.hero[1:])
+
+    def with_room(self, room, hero=None, key=None):
+        location = self.location
+        return State(location, self.key if key is None else key, self.hero if hero is None else hero,
+                     self.rooms[:location] + (room,) + self.rooms[location + 1:],
+                     self.room_hashes[:location] + (hash(room),) + self.room_hashes[location + 1:])
+
+    def with_location(self, location):
+        return State(location, self.key, self.hero, self.rooms, self.room_hashes)
+
+
+def enemy_record(enemy):
+    return (enemy.health, enemy.weapon1_id, enemy.weapon1_damage, enemy.weapon2_id, enemy.weapon2_damage,
+            enemy.armor_id, enemy.armor_value)
+
+
+def room_record(room):
+    treasure = room["treasure"]
+    return (tuple(enemy_record(enemy) for enemy in room["enemies"]),
+            ["boss_key", True] in treasure)
+
+
+def living(room):
+    return [enemy for enemy in room[ENEMIES] if enemy[HEALTH] > 0]
+
+
+def enemy_threat(enemy):
+    # utils.Enemy.attack_damage(): only the first weapon attacks
+    if enemy[WEAPON1_ID] < 0:
+        return 0
+    return enemy[WEAPON1_DAMAGE]
+
+
+def enemy_armor(enemy):
+    if enemy[ARMOR_ID] < 0:
+        return 0
+    return enemy[ARMOR_VALUE]
+
+
+def replace(record, index, *values):
+    return record[:index] + values + record[index + len(values):]
+
+
+def perks(hero):
+    return hero[HERO_WEAPON_ID] == DAGGER_ID, hero[HERO_ARMOR_ID] == SHIELD_ID
+
+
+@functools.lru_cache(maxsize=None)
+def turn_table(threats, armor, dagger, shield):
+    # ((damage, probability), ...) of one enemy turn in total, threats is the living enemies'
+    # weapon damage, sorted
+    table = ((0, 1.0),)
+    for threat in threats:
+        table = combat_odds.combine(table, combat_odds.enemy_turn_table(threat, armor, dagger, shield))
+    return table
+
+
+@functools.lru_cache(maxsize=None)
+def turn_risk(threats, armor, dagger, shield, full_health):
+    # risk[h] = P(one enemy turn kills a hero with health h), and P(two turns in a row kill a hero
+    # who healed to full_health before them)
+    table = turn_table(threats, armor, dagger, shield)
+    risk = [1.0] * (full_health + 1)
+    for health in range(1, full_health + 1):
+        risk[health] = sum(p for damage, p in table if damage >= health)
+    twice = sum(p for damage, p in combat_odds.combine(table, table) if damage >= full_health)
+    return risk, twice
+
+
+def profile(hero, enemies):
+    # What turn_table() needs to know about a room's living enemies
+    dagger, shield = perks(hero)
+    return tuple(sorted(enemy_threat(enemy) for enemy in enemies)), hero[HERO_ARMOR_VALUE], dagger, shield
+
+
+@functools.lru_cache(maxsize=None)
+def mean_attack(weapon, armor):
+    return max(sum(damage * p for damage, p in combat_odds.hero_attack_table(weapon, armor)), 0.5)
+
+
+@functools.lru_cache(maxsize=None)
+def mean_turn(threat, armor, dagger, shield):
+    return sum(damage * p for damage, p in combat_odds.enemy_turn_table(threat, armor, dagger, shield))
+
+
+def enemy_turn(state, p, out):
+    # The enemies' turn after a command, into out as (probability, State or DIED)
+    room = state.room()
+    enemies = living(room)
+    if not enemies:
+        out.append((p, state))
+        return
+    health = state.hero[HERO_HEALTH]
+    died = 0.0
+    for damage, q in turn_table(*profile(state.hero, enemies)):
+        if damage >= health:
+            died += q
+        else:
+            out.append((p * q, state.with_health(health - damage)))
+    if died:
+        out.append((p * died, DIED))
+
+
+def expand(state):
+    # [(command, [(probability, State, WON or DIED), ...]), ...] for every command worth typing,
+    # the rules as GameSession.run_command() plays them
+    moves = []
+    location = state.location
+    hero = state.hero
+    room = state.room()
+    enemies = room[ENEMIES]
+    last = len(state.rooms) - 1
+    cleared = not living(room)
+
+    for num, enemy in enumerate(enemies):
+        if enemy[HEALTH] > 0:
+            out = []
+            for damage, p in combat_odds.hero_attack_table(hero[HERO_WEAPON_DAMAGE], enemy_armor(enemy)):
+                hurt = replace(enemy, HEALTH, max(enemy[HEALTH] - damage, 0))
+                enemy_turn(state.with_room((enemies[:num] + (hurt,) + enemies[num + 1:], room[KEY_HERE])), p, out)
+            moves.append(("attack {0}".format(num + 1), out))
+
+    for num, enemy in enumerate(enemies):
+        taken = set()
+        for slot, id_index in ((0, WEAPON1_ID), (1, WEAPON2_ID)):
+            weapon_id = enemy[id_index]
+            # enemy.weapon_index() finds the first slot holding it
+            if weapon_id < 0 or weapon_id in taken:
+                continue
+            taken.add(weapon_id)
+            emptied = replace(enemy, id_index, utils.EMPTY_SLOT, 0)
+            armed = replace(hero, HERO_WEAPON_ID, weapon_id, enemy[id_index + 1])
+            out = []
+            enemy_turn(state.with_room((enemies[:num] + (emptied,) + enemies[num + 1:], room[KEY_HERE]), hero=armed), 1.0, out)
+            moves.append(("take enemy {0} weapon {1}".format(num + 1, utils.WEAPON_CATALOG[weapon_id].name), out))
+        if enemy[ARMOR_ID] >= 0:
+            emptied = replace(enemy, ARMOR_ID, utils.EMPTY_SLOT, 0)
+            armored = replace(hero, HERO_ARMOR_ID, enemy[ARMOR_ID], enemy[ARMOR_VALUE])
+            out = []
+            enemy_turn(state.with_room((enemies[:num] + (emptied,) + enemies[num + 1:], room[KEY_HERE]), hero=armored), 1.0, out)
+            moves.append(("take enemy {0} armor {1}".format(num + 1, utils.ARMOR_CATALOG[enemy[ARMOR_ID]].name), out))
+
+    if room[KEY_HERE]:
+        out = []
+        enemy_turn(state.with_room((enemies, False), key=True), 1.0, out)
+        moves.append(("take treasure key", out))
+
+    if hero[HERO_HEALTH] < tuning.HERO_HEALTH:
+        out = []
+        enemy_turn(state.with_health(tuning.HERO_HEALTH), 1.0, out)
+        moves.append(("heal", out))
+
+    # Only moves that go somewhere, they cost no enemy turn
+    if cleared and location < last and (location != last - 1 or state.key):
+        moves.append(("move forward", [(1.0, state.with_location(location + 1))]))
+    if location > 1:
+        moves.append(("move back", [(1.0, state.with_location(location - 1))]))
+    elif location == 1 and not living(state.rooms[last]):
+        moves.append(("move back", [(1.0, WON)]))
+    return moves
+
+
+class Autoplayer:
+    # Call it with a GameSession for the next command. The transposition table and the counters
+    # carry over from one command (and game) to the next.
+    def __init__(self, depth=DEPTH, gamma=GAMMA, cutoff=CUTOFF, table_size=TABLE_SIZE):
+        self.depth = depth
+        self.gamma = gamma
+        self.cutoff = cutoff
+        self.table_size = table_size
+        self.table = {}
+        self.plans = {}
+        self.nodes = 0
+        self.hits = 0
+        self.decisions = 0
+        self.seconds = 0.0
+
+    def __call__(self, session):
+        start = time.perf_counter()
+        command = self.choose(State.from_world(session.world, session.location))
+        self.seconds += time.perf_counter() - start
+        self.decisions += 1
+        return command
+
+    def choose(self, state):
+        if len(self.table) + len(self.plans) > self.table_size:
+            self.table.clear()
+            self.plans.clear()
+        best = None
+        best_value = -1.0
+        for command, outcomes in expand(state):
+            value = self.average(outcomes, self.depth - 1, 1.0)
+            if value > best_value:
+                best, best_value = command, value
+        return best
+
+    def average(self, outcomes, depth, reach):
+        total = 0.0
+        for p, result in outcomes:
+            if result is WON:
+                total += p
+            elif result is not DIED:
+                total += p * self.value(result, depth if reach * p >= self.cutoff else 0, reach * p)
+        return total
+
+    def value(self, state, depth, reach):
+        key = (state, depth)
+        known = self.table.get(key)
+        if known is not None:
+            self.hits += 1
+            return known
+        self.nodes += 1
+        if depth <= 0:
+            result = self.estimate(state)
+        else:
+            result = 0.0
+            for command, outcomes in expand(state):
+                result = max(result, self.average(outcomes, depth - 1, reach))
+        self.table[key] = result
+        return result
+
+    def estimate(self, state):
+        # GAMMA ** (commands left) * the odds of getting through the next enemy turn. Only the second
+        # part depends on the hero's health, the rest comes from plans, kept per State at health 0.
+        key = state.with_health(0)
+        plan = self.plans.get(key)
+        if plan is None:
+            plan = self.plans[key] = self.plan(state)
+        worth, risk, healed = plan
+        if risk is None:
+            return worth
+        return worth * max(1.0 - risk[state.hero[HERO_HEALTH]], healed)
+
+    def plan(self, state):
+        # (GAMMA ** commands left, risk[health] of the next enemy turn, the odds after healing first)
+        gamma = self.gamma
+        hero = state.hero
+        rooms = state.rooms
+        location = state.location
+        last = len(rooms) - 1
+        if not living(rooms[last]):
+            # Walk out
+            return gamma ** location, None, None
+        dagger, shield = perks(hero)
+        armor = hero[HERO_ARMOR_VALUE]
+        commands = (last - location) + (last - 1) + 1
+        if not state.key:
+            commands += 1 + 2 * (location - 1)
+        damage = 0.0
+        fight = None
+        for ahead in range(location, last + 1):
+            enemies = living(rooms[ahead])
+            if not enemies:
+                continue
+            if fight is None:
+                fight = ahead, enemies
+            # One at a time, everyone still standing hits back meanwhile
+            threat = sum(mean_turn(enemy_threat(enemy), armor, dagger, shield) for enemy in enemies)
+            for enemy in enemies:
+                attacks = enemy[HEALTH] / mean_attack(hero[HERO_WEAPON_DAMAGE], enemy_armor(enemy))
+                commands += attacks
+                damage += attacks * threat
+                threat -= mean_turn(enemy_threat(enemy), armor, dagger, shield)
+        commands += HEAL_COMMANDS * damage / HEAL_HEALTH
+
+        ahead, enemies = fight
+        risk, twice = turn_risk(*profile(hero, enemies), tuning.HERO_HEALTH)
+        if ahead == location:
+            # Heal here and take two turns, or step back to heal for free
+            healed = gamma * (1.0 - twice)
+            if location > 1:
+                healed = max(healed, gamma ** HEAL_COMMANDS * (1.0 - risk[tuning.HERO_HEALTH]))
+        else:
+            # This room is cleared, healing here costs nothing but the command
+            healed = gamma * (1.0 - risk[tuning.HERO_HEALTH])
+        return gamma ** commands, risk, healed
+
+
+def new_game(seed):
+    world = OOP_Game_lab.scenario("autoplay", hero_file=None, rng=dice.GameRng(seed, block=balance.DICE_BLOCK))
+    return OOP_Game_lab.GameSession(world, say=utils.quiet)
+
+
+def play_game(seed, player, max_commands=balance.MAX_COMMANDS):
+    # (outcome, commands), outcome is "won", "died" or "stuck". player(session) is the next command.
+    session = new_game(seed)
+    commands = 0
+    while session.over is None and commands < max_commands:
+        session.handle(player(session))
+        commands += 1
+    return session.over or "stuck", commands
+
+
+def policy(name, heal_below=40):
+    def player(session):
+        return balance.next_command(session, name, heal_below)
+    return player
+
+
+def compare(games=200, seed=0, depth=DEPTH):
+    # The same dungeons (seeds seed .. seed + games - 1, stock starting loadouts) for every player
+    autoplayer = Autoplayer(depth)
+    players = (("fighter", policy("fighter")), ("careful", policy("careful")),
+               ("autoplay depth {0}".format(depth), autoplayer))
+    print(" [-] {0:18} {1:>6}  {2:>22}  {3:>7}  {4:>6}  {5:>9}".format(
+        "player", "games", "win rate (95% CI)", "died", "stuck", "commands"))
+    for label, player in players:
+        tally = {"won": 0, "died": 0, "stuck": 0}
+        commands = 0
+        start = time.perf_counter()
+        for game in range(games):
+            outcome, played = play_game(seed + game, player)
+            tally[outcome] += 1
+            commands += played
+        elapsed = time.perf_counter() - start
+        low, high = balance.wilson(tally["won"], games)
+        print(" [-] {0:18} {1:>6}  {2:6.1%} [{3:5.1%}, {4:5.1%}]  {5:>7.1%}  {6:>6}  {7:9.1f}   {8:.1f}s".format(
+            label, games, tally["won"] / games, low, high, tally["died"] / games, tally["stuck"],
+            commands / games, elapsed))
+    print(" [-] search: {0:,} nodes in {1:.1f}s, {2:,.0f} nodes/s, {3:.2f} ms per command, {4:.1%} transposition table hits".format(
+        autoplayer.nodes, autoplayer.seconds, autoplayer.nodes / autoplayer.seconds,
+        1000 * autoplayer.seconds / autoplayer.decisions, autoplayer.hits / max(autoplayer.hits + autoplayer.nodes, 1)))
+
+
+def check(commands=20000, seed=1, z_limit=4.0):
+    # Random commands from expand() typed into real games: what the game did has to be one of the
+    # outcomes expand() listed, and the hero's health afterwards has to average out to expand()'s odds
+    chooser = random.Random(seed)
+    game = 0
+    session = new_game(seed)
+    typed = 0
+    missed = 0
+    predicted = 0.0
+    observed = 0.0
+    variance = 0.0
+    while typed < commands:
+        if session.over is not None:
+            game += 1
+            session = new_game(seed + game)
+        state = State.from_world(session.world, session.location)
+        command, outcomes = chooser.choice(expand(state))
+        session.handle(command)
+        typed += 1
+        if session.over is not None:
+            result = WON if session.over == "won" else DIED
+        else:
+            result = State.from_world(session.world, session.location)
+        if not any(p > 0 and (other is result or isinstance(other, State) and isinstance(result, State) and other == result)
+                   for p, other in outcomes):
+            missed += 1
+            if missed <= 5:
+                print("[!] '{0}' at location {1} did something expand() didn't see coming".format(command, state.location))
+        healths = [(p, 0 if other is DIED else (tuning.HERO_HEALTH if other is WON else other.hero[HERO_HEALTH]))
+                   for p, other in outcomes]
+        mean = sum(p * health for p, health in healths)
+        predicted += mean
+        variance += sum(p * (health - mean) ** 2 for p, health in healths)
+        observed += 0 if result is DIED else (tuning.HERO_HEALTH if result is WON else result.hero[HERO_HEALTH])
+    z = 0.0 if variance == 0 else (observed - predicted) / variance ** 0.5
+    print(" [-] {0:,} commands in {1} games: hero health after a command {2:.2f} expected, {3:.2f} seen, z {4:+.2f}".format(
+        typed, game + 1, predicted / typed, observed / typed, z))
+    if missed or abs(z) > z_limit:
+        print("[!] expand() doesn't play by the game's rules ({0} commands went some other way)".format(missed))
+        exit(-1)
+    print(" [-] expand() plays by the game's rules")
+
+
+def bench(forks=100000):
+    # What a lookahead node costs to make: deep-copying the world's dungeon and the hero's stats,
+    # against forking a State (an attack: one enemy's and the hero's health change)
+    session = new_game(1)
+    world = session.world
+    copies = max(forks // 100, 100)
+    start = time.perf_counter()
+    for __ in range(copies):
+        copy.deepcopy((world.dungeon, dict(world.hero.hero_attribs)))
+    deep = (time.perf_counter() - start) / copies
+
+    state = State.from_world(world, world.location)
+    room = state.room()
+    enemies = room[ENEMIES]
+    start = time.perf_counter()
+    for health in range(forks):
+        hurt = replace(enemies[0], HEALTH, health)
+        state.with_room((hurt,) + enemies[1:], hero=replace(state.hero, HERO_HEALTH, health))
+    fork = (time.perf_counter() - start) / forks
+    print(" [-] copy.deepcopy() of the world {0:8.2f} us   State fork {1:6.2f} us   ({2:,.0f}x)".format(
+        1e6 * deep, 1e6 * fork, deep / fork))
+
+    start = time.perf_counter()
+    expanded = 0
+    for __ in range(1000):
+        for command, outcomes in expand(state):
+            expanded += len(outcomes)
+    elapsed = time.perf_counter() - start
+    print(" [-] expand() on the first room: {0:,.0f} outcomes/s".format(expanded / elapsed))
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args and args[0] == "check":
+        check(int(args[1]) if len(args) > 1 else 20000)
+    elif args and args[0] == "bench":
+        bench()
+    else:
+        depth = int(utils.option(args, "--depth", DEPTH))
+        seed = int(utils.option(args, "--seed", 0))
+        compare(int(args[0]) if args else 200, seed, depth)
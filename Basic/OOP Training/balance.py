@@ -0,0 +1,224 @@
+#!/usr/bin/python3
+
+# Win rates for starting loadouts. Plays whole games headless: the dungeon comes from
+# scenario.instantiateWorld(), every command goes through OOP_Game_lab.GameSession, and a policy
+# decides what the player types. Game i is played with seed + i and starting loadout i % pairs, where
+# pairs is every (weapon, armor) combination get_weapon() and get_armor() can hand out, so each pair
+# sees its own set of dungeons. Games are split into shards of consecutive seeds that a process pool
+# plays in parallel, results are merged as shards come back.
+#
+#   python balance.py [games] [--policy fighter|careful] [--heal-below N] [--seed N] [--processes N]
+#   python balance.py bench [games] [processes]     games per second for 1 .. all cores (or processes)
+
+import math
+import multiprocessing
+import sys
+import time
+
+import OOP_Game_lab
+import dice
+import dungeon_gen
+import room_state
+import utils
+
+SHARD_SIZE = 200
+MAX_COMMANDS = 2000
+# See server.py, every game has its own GameRng
+DICE_BLOCK = 32
+# 95% confidence
+Z = 1.96
+
+POLICIES = ("fighter", "careful")
+
+
+def loadouts():
+    pairs = []
+    for weapon in utils.WEAPON_CATALOG:
+        for armor in utils.ARMOR_CATALOG:
+            pairs.append((weapon.id, armor.id))
+    return pairs
+
+
+def next_command(session, policy, heal_below):
+    # What the player types next. Both policies clear every room, grab the boss key, push on to the
+    # last room and walk back out. "careful" also heals whenever health drops below heal_below.
+    world = session.world
+    if policy == "careful" and world.hero.health < heal_below:
+        return "heal"
+    for num, enemy in enumerate(session.enemies):
+        if enemy.health > 0:
+            return "attack {0}".format(num + 1)
+    if ["boss_key", True] in session.treasure:
+        return "take treasure key"
+    if room_state.of(world.dungeon[len(world.dungeon) - 1]).cleared():
+        return "move back"
+    return "move forward"
+
+
+def play_game(seed, weapon_id, armor_id, policy, heal_below):
+    # (outcome, location, commands), outcome is "won", "died" or "stuck"
+    world = OOP_Game_lab.scenario("balance", hero_file=None, rng=dice.GameRng(seed, block=DICE_BLOCK))
+    hero = world.hero
+    hero.weapon_id, hero.weapon_damage = weapon_id, utils.WEAPON_CATALOG[weapon_id].value
+    hero.armor_id, hero.armor_value = armor_id, utils.ARMOR_CATALOG[armor_id].value
+
+    def say(*args):
+        pass
+    session = OOP_Game_lab.GameSession(world, say=say)
+    commands = 0
+    while session.over is None and commands < MAX_COMMANDS:
+        session.handle(next_command(session, policy, heal_below))
+        commands += 1
+    return session.over or "stuck", session.location, commands
+
+
+def new_tally(rooms):
+    return {
+        "games": 0,
+        "won": 0,
+        "died": 0,
+        "stuck": 0,
+        "turns": 0,
+        "turns_sq": 0,
+        "death_rooms": [0] * rooms
+        }
+
+
+def play_shard(job):
+    # One shard: games first .. first + count - 1. Returns {pair: tally}.
+    first, count, seed, policy, heal_below = job
+    pairs = loadouts()
+    tallies = {}
+    for game in range(first, first + count):
+        pair = pairs[game % len(pairs)]
+        outcome, location, turns = play_game(seed + game, pair[0], pair[1], policy, heal_below)
+        tally = tallies.get(pair)
+        if tally is None:
+            tally = tallies[pair] = new_tally(dungeon_gen.ROOMS_PER_DUNGEON)
+        tally["games"] += 1
+        tally[outcome] += 1
+        tally["turns"] += turns
+        tally["turns_sq"] += turns * turns
+        if outcome == "died":
+            tally["death_rooms"][location] += 1
+    return tallies
+
+
+def merge(totals, tallies):
+    for pair, tally in tallies.items():
+        total = totals.get(pair)
+        if total is None:
+            totals[pair] = tally
+            continue
+        for key in ("games", "won", "died", "stuck", "turns", "turns_sq"):
+            total[key] += tally[key]
+        for room, deaths in enumerate(tally["death_rooms"]):
+            total["death_rooms"][room] += deaths
+
+
+def shards(games, seed, policy, heal_below):
+    jobs = []
+    for first in range(0, games, SHARD_SIZE):
+        jobs.append((first, min(SHARD_SIZE, games - first), seed, policy, heal_below))
+    return jobs
+
+
+def run(games, seed=0, policy="fighter", heal_below=40, processes=None, progress=False):
+    totals = {}
+    jobs = shards(games, seed, policy, heal_below)
+    done = 0
+    if processes == 1:
+        results = map(play_shard, jobs)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap_unordered(play_shard, jobs)
+    try:
+        for tallies in results:
+            merge(totals, tallies)
+            done += 1
+            if progress:
+                sys.stderr.write("\r [-] {0}/{1} shards".format(done, len(jobs)))
+                sys.stderr.flush()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    if progress:
+        sys.stderr.write("\n")
+    return totals
+
+
+def wilson(successes, n, z=Z):
+    # Confidence interval for a rate, 95% unless z says otherwise
+    if n == 0:
+        return 0.0, 0.0
+    p = successes / n
+    centre = p + z * z / (2 * n)
+    spread = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n))
+    scale = 1 + z * z / n
+    return (centre - spread) / scale, (centre + spread) / scale
+
+
+def report(totals):
+    print(" [-] {0:12} {1:13} {2:>6}  {3:>22}  {4:>7}  {5:>10}  {6:>16}".format(
+        "weapon", "armor", "games", "win rate (95% CI)", "died", "death room", "turns"))
+    for pair in sorted(totals):
+        tally = totals[pair]
+        n = tally["games"]
+        low, high = wilson(tally["won"], n)
+        mean = tally["turns"] / n
+        variance = max(tally["turns_sq"] / n - mean * mean, 0)
+        deaths = tally["death_rooms"]
+        room = "-" if tally["died"] == 0 else str(deaths.index(max(deaths)))
+        print(" [-] {0:12} {1:13} {2:>6}  {3:6.1%} [{4:5.1%}, {5:5.1%}]  {6:>7.1%}  {7:>10}  {8:7.1f} +- {9:5.1f}".format(
+            utils.WEAPON_CATALOG[pair[0]].name, utils.ARMOR_CATALOG[pair[1]].name, n,
+            tally["won"] / n, low, high, tally["died"] / n, room, mean, Z * math.sqrt(variance / n)))
+    games = sum(tally["games"] for tally in totals.values())
+    won = sum(tally["won"] for tally in totals.values())
+    stuck = sum(tally["stuck"] for tally in totals.values())
+    low, high = wilson(won, games)
+    print(" [-] all loadouts: {0:,} games, win rate {1:.1%} [{2:.1%}, {3:.1%}], {4} stuck".format(
+        games, won / games, low, high, stuck))
+
+
+def bench(games=4000, cores=None):
+    # Past the machine's core count the speedup can only show the pool's overhead
+    if cores is None:
+        cores = multiprocessing.cpu_count()
+    counts = [1]
+    while counts[-1] * 2 <= cores:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cores:
+        counts.append(cores)
+    single = None
+    for processes in counts:
+        start = time.perf_counter()
+        run(games, processes=processes)
+        rate = games / (time.perf_counter() - start)
+        if single is None:
+            single = rate
+        print(" [-] {0:3} processes: {1:8,.0f} games/s   speedup {2:5.2f}x   efficiency {3:5.1%}".format(
+            processes, rate, rate / single, rate / single / processes))
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args and args[0] == "bench":
+        bench(int(args[1]) if len(args) > 1 else 4000, int(args[2]) if len(args) > 2 else None)
+    else:
+        policy = utils.option(args, "--policy", "fighter")
+        if policy not in POLICIES:
+            print("[!] Unknown policy {0}, pick one of {1}".format(policy, ", ".join(POLICIES)))
+            exit(-1)
+        heal_below = int(utils.option(args, "--heal-below", 40))
+        seed = int(utils.option(args, "--seed", 0))
+        processes = utils.option(args, "--processes", None)
+        if processes is not None:
+            processes = int(processes)
+        games = int(args[0]) if args else 20000
+        start = time.perf_counter()
+        totals = run(games, seed, policy, heal_below, processes, progress=True)
+        elapsed = time.perf_counter() - start
+        report(totals)
+        print(" [-] {0:,} games in {1:.1f}s ({2:,.0f} games/s)".format(games, elapsed, games / elapsed))
@@ -0,0 +1,259 @@
+#!/usr/bin/python3
+
+# Benchmark suite for the game's hot paths. Every case uses a fixed seed so two runs do the same work,
+# and each one is timed several times in several processes, see run(), to keep out noise from the rest of the machine.
+# Runs are appended to BENCH_HISTORY so later changes can be compared with earlier ones.
+#
+#   python bench.py [case ...] [--label text] [--no-save]      run the cases (all by default)
+#   python bench.py compare [--threshold 10] [--against N]     latest run against the one before it
+#                                                              (or run N), regressions exit with -1
+#   python bench.py history                                    list the saved runs
+
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import OOP_Game_lab
+import dice
+import tuning
+import utils
+
+BENCH_HISTORY = "bench_history.json"
+SEED = 1234
+REPEATS = 5
+TIMING = 0.1
+# Every run is split over this many fresh processes, see run()
+WORKERS = 5
+# Percent slower than the run compared against before a case counts as a regression
+THRESHOLD = 10.0
+
+
+def bench_room_template(count):
+    rng = dice.GameRng(SEED)
+    for index in range(count):
+        utils.produce_room_template(index % 6, rng)
+
+def bench_instantiate_world(count):
+    world = OOP_Game_lab.scenario("bench", hero_file=None, seed=SEED)
+    for __ in range(count):
+        world.instantiateWorld()
+
+def bench_enemy(count):
+    rng = dice.GameRng(SEED)
+    for __ in range(count):
+        utils.Enemy(rng=rng)
+
+def bench_roll_dice(count):
+    rng = dice.GameRng(SEED)
+    for __ in range(count):
+        utils.roll_dice(rng)
+
+def bench_combat_round(count):
+    # One "attack 1" through the same GameSession main() plays, enemies' turn included.
+    # Everyone is put back to the health they started with each round so the fight never ends, which
+    # the room's room_state has to be told about.
+    world = OOP_Game_lab.scenario("bench", hero_file=None, seed=SEED)
+    session = OOP_Game_lab.GameSession(world, say=utils.quiet)
+    enemies = session.enemies
+    healths = [enemy.health for enemy in enemies]
+    hero = world.hero
+    for __ in range(count):
+        for enemy, health in zip(enemies, healths):
+            enemy.health = health
+        session.state.rebuild(session.space)
+        hero.health = tuning.HERO_HEALTH
+        session.handle("attack 1")
+
+def bench_hero_save_and_read(count):
+    # A synchronous save of a changed hero and the HUD reading it back
+    hero = utils.Hero("bench", write_behind=False)
+    for index in range(count):
+        hero.health = 1 + index % 100
+        hero.write_hero_object_to_disk()
+        utils.read_hero_stats()
+
+def bench_hud_frame(count):
+    hero_stats = utils.Hero("bench", write_behind=False).to_dict()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for __ in range(count):
+            utils.render_hud(hero_stats)
+
+
+CASES = {
+    "produce_room_template": bench_room_template,
+    "instantiate_world": bench_instantiate_world,
+    "enemy": bench_enemy,
+    "roll_dice": bench_roll_dice,
+    "combat_round": bench_combat_round,
+    "hero_save_and_read": bench_hero_save_and_read,
+    "hud_frame": bench_hud_frame,
+    }
+
+
+def timed(function, count):
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        function(count)
+        return time.perf_counter() - start
+    finally:
+        gc.enable()
+
+
+def calibrate(function):
+    # How many operations make one timing of about TIMING seconds, the way timeit.autorange() does it
+    count = 1
+    while timed(function, count) < TIMING / 10:
+        count *= 10
+    return max(1, int(count * TIMING / max(timed(function, count), 1e-9)))
+
+
+def run_worker(names):
+    # Best seconds per operation for each case in this process. The repeats go round-robin over all
+    # the cases rather than one case at a time, so a busy spell on the machine hits one sample of every
+    # case instead of every sample of one case. The garbage collector is held off while timing, like
+    # timeit does.
+    results = {}
+    cwd = os.getcwd()
+    # The hero cases write HeroObject.json, keep that away from a real game
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        try:
+            counts = {}
+            for name in names:
+                counts[name] = calibrate(CASES[name])
+            for __ in range(REPEATS):
+                for name in names:
+                    elapsed = timed(CASES[name], counts[name]) / counts[name]
+                    if name not in results or elapsed < results[name]:
+                        results[name] = elapsed
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def run(names):
+    # The same code can run 20-40% faster or slower from one process to the next (hash seeds, memory
+    # layout), more than any best-of-N inside one process can hide. So like pyperf the cases run in
+    # WORKERS fresh processes and the median of their results is kept, along with the lowest and highest
+    # for compare().
+    samples = {}
+    for worker in range(WORKERS):
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--worker"] + names,
+                                         universal_newlines=True)
+        for name, value in json.loads(output).items():
+            samples.setdefault(name, []).append(value)
+    results = {}
+    spread = {}
+    for name in names:
+        values = sorted(samples[name])
+        results[name] = values[len(values) // 2]
+        spread[name] = [values[0], values[-1]]
+        print(" [-] {0:24} {1:12.3f} us/op   ({2:.3f} .. {3:.3f})".format(
+            name, 1e6 * results[name], 1e6 * values[0], 1e6 * values[-1]))
+    return results, spread
+
+
+def load_history(path=BENCH_HISTORY):
+    if not os.path.exists(path):
+        return []
+    with open(path) as _rf:
+        return json.load(_rf)
+
+def save_history(history, path=BENCH_HISTORY):
+    with open(path, "w") as _wf:
+        json.dump(history, _wf, indent=2)
+
+
+def machine():
+    return "{0} / Python {1}".format(platform.platform(), platform.python_version())
+
+
+def overlap(new, old, name):
+    # Whether the two runs' worker results for a case overlap, in which case a difference between
+    # the medians may be no more than the machine being busier during one of them
+    if name not in new.get("spread", {}) or name not in old.get("spread", {}):
+        return False
+    new_low, new_high = new["spread"][name]
+    old_low, old_high = old["spread"][name]
+    return new_low <= old_high and old_low <= new_high
+
+
+def compare(history, latest, against, threshold):
+    # Returns the list of regressed case names. A case regressed when it is more than threshold
+    # percent slower and slower than anything the other run's workers saw.
+    new = history[latest]
+    old = history[against]
+    print(" [-] run {0} ({1}) against run {2} ({3})".format(latest, new["label"], against, old["label"]))
+    if new["machine"] != old["machine"]:
+        print(" [!] The runs come from different machines, the numbers may not be comparable.")
+    regressions = []
+    for name in CASES:
+        if name not in new["results"] or name not in old["results"]:
+            continue
+        before = old["results"][name]
+        after = new["results"][name]
+        change = 100.0 * (after - before) / before
+        flag = ""
+        if change > threshold and overlap(new, old, name):
+            flag = "  slower? (within noise)"
+        elif change > threshold:
+            flag = "  <-- slower"
+            regressions.append(name)
+        elif change < -threshold:
+            flag = "  faster"
+        print(" [-] {0:24} {1:12.3f} {2:12.3f} us/op {3:+8.1f}%{4}".format(name, 1e6 * before, 1e6 * after, change, flag))
+    if regressions:
+        print(" [!] {0} case(s) regressed more than {1:.0f}%: {2}".format(len(regressions), threshold, ", ".join(regressions)))
+    else:
+        print(" [-] No regressions beyond {0:.0f}%.".format(threshold))
+    return regressions
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args and args[0] == "compare":
+        args = args[1:]
+        threshold = float(utils.option(args, "--threshold", THRESHOLD))
+        history = load_history()
+        if len(history) < 2:
+            print("[!] Need at least two saved runs in {0} to compare.".format(BENCH_HISTORY))
+            exit(-1)
+        against = int(utils.option(args, "--against", len(history) - 2))
+        if compare(history, len(history) - 1, against, threshold):
+            exit(-1)
+    elif args and args[0] == "--worker":
+        print(json.dumps(run_worker(args[1:])))
+    elif args and args[0] == "history":
+        for index, entry in enumerate(load_history()):
+            print(" [-] {0:3} {1}  {2}  {3}".format(index, entry["time"], entry["label"], entry["machine"]))
+    else:
+        label = utils.option(args, "--label", "")
+        save = "--no-save" not in args
+        if not save:
+            args.remove("--no-save")
+        for name in args:
+            if name not in CASES:
+                print("[!] Unknown case {0}, pick from: {1}".format(name, ", ".join(CASES)))
+                exit(-1)
+        results, spread = run(args or list(CASES))
+        if save:
+            history = load_history()
+            history.append({
+                "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "label": label,
+                "machine": machine(),
+                "seed": SEED,
+                "results": results,
+                "spread": spread
+                })
+            save_history(history)
+            print(" [-] Saved as run {0} in {1}".format(len(history) - 1, BENCH_HISTORY))
@@ -0,0 +1,192 @@
+#!/usr/bin/python3
+
+# The item catalog: every weapon and piece of armor the game can hand out, loaded once at import.
+# An item is an Item tuple (name, value, slot, id) where id is its index within its slot, and each
+# name has exactly one (interned) Item, so items can be compared and shared freely. Lookups by id and
+# by name are a tuple index and a dict get, items can be listed by slot and by value range, and a
+# draw is one randint() plus a tuple index.
+#
+# When ITEM_FILE exists next to the game the catalog is read from it instead of the built-in items:
+#   {"weapon": [["short_sword", 15], ...], "armor": [["breast_plate", 10], ...]}
+# Draw order is file order, the same way the built-in items below are in the order the game always used.
+# Item values in tuning.py's TUNING_FILE replace the ones here, by name.
+#
+#   python catalog.py                       draws per second against the old get_weapon()/get_armor()
+#   python catalog.py generate N [file]     write a catalog with N items per slot to try it out
+
+import json
+import os
+import sys
+import time
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+import dice
+import tuning
+
+ITEM_FILE = "items.json"
+
+WEAPON = "weapon"
+ARMOR = "armor"
+SLOTS = (WEAPON, ARMOR)
+
+# savegame.py and dungeon_gen.py store item ids as signed 16 bit numbers
+MAX_ITEMS = 32767
+
+BUILT_IN_ITEMS = {
+    WEAPON: [
+        ["short_sword", 15],
+        ["long_sword", 20],
+        ["dagger", 5],
+        ["spear", 20]
+        ],
+    ARMOR: [
+        ["breast_plate", 10],
+        ["helmet", 5],
+        ["shield", 10],
+        ["greaves", 5],
+        ["gauntlets", 5]
+        ]
+    }
+
+Item = namedtuple("Item", ("name", "value", "slot", "id"))
+
+
+class CatalogError(Exception):
+    pass
+
+
+class Catalog():
+    def __init__(self, slots):
+        # slots is {slot: [[name, value], ...]} like BUILT_IN_ITEMS
+        self.items = {}
+        self.names = {}
+        self.by_value = {}
+        for slot in SLOTS:
+            entries = slots.get(slot)
+            if not entries:
+                raise CatalogError("the catalog has no {0} items".format(slot))
+            if len(entries) > MAX_ITEMS:
+                raise CatalogError("the catalog has more than {0} {1} items".format(MAX_ITEMS, slot))
+            items = []
+            limit = tuning.item_limit(slot)
+            for name, value in entries:
+                name = sys.intern(str(name))
+                if name in self.names:
+                    raise CatalogError("{0} is in the catalog twice".format(name))
+                if not 0 <= int(value) <= limit:
+                    raise CatalogError("{0} has to be worth 0 to {1} so the save game can hold it".format(name, limit))
+                item = Item(name, int(value), slot, len(items))
+                items.append(item)
+                self.names[name] = item
+            self.items[slot] = tuple(items)
+            # Sorted by value for in_range()
+            ordered = tuple(sorted(items, key=lambda item: item.value))
+            self.by_value[slot] = ([item.value for item in ordered], ordered)
+
+    def __len__(self):
+        return len(self.names)
+
+    def get(self, slot, item_id):
+        return self.items[slot][item_id]
+
+    def find(self, name, slot=None):
+        # The Item called name, None when there is none (in that slot)
+        item = self.names.get(name)
+        if item is None or (slot is not None and item.slot != slot):
+            return None
+        return item
+
+    def in_range(self, slot, low, high):
+        # Items of a slot with low <= value <= high, lowest value first
+        values, ordered = self.by_value[slot]
+        return ordered[bisect_left(values, low):bisect_right(values, high)]
+
+    def draw(self, slot, rng=None):
+        # One item of the slot, every item equally likely
+        if rng is None:
+            rng = dice.default_rng
+        items = self.items[slot]
+        return items[rng.randint(0, len(items) - 1)]
+
+
+def retuned(slots):
+    # slots with tuning.ITEM_VALUES in place of the values they have
+    values = tuning.ITEM_VALUES
+    if not values:
+        return slots
+    return {slot: [[name, values.get(name, value)] for name, value in entries] for slot, entries in slots.items()}
+
+
+def load(path=ITEM_FILE):
+    # The catalog in path, the built-in items when there is no such file
+    if path is None or not os.path.exists(path):
+        return Catalog(retuned(BUILT_IN_ITEMS))
+    try:
+        with open(path) as _rf:
+            return Catalog(retuned(json.load(_rf)))
+    except (ValueError, TypeError, AttributeError) as ex:
+        raise CatalogError("{0} is not a valid item catalog: {1}".format(path, ex))
+
+
+CATALOG = load()
+
+
+def made_up_items(count):
+    # count items per slot, for trying the game and the benchmark with a large catalog
+    slots = {}
+    for slot in SLOTS:
+        slots[slot] = [["{0}_{1}".format(slot, index), 5 + index % 20] for index in range(count)]
+    return slots
+
+def write_catalog(path, count):
+    with open(path, "w") as _wf:
+        json.dump(made_up_items(count), _wf, indent=1)
+
+
+def legacy_draw(entries, rng):
+    # get_weapon()/get_armor() before the catalog: build the dict, then walk it to a random index
+    items = dict(entries)
+    item_number = rng.randint(0, len(items) - 1)
+    for index, value in enumerate(items.keys()):
+            if index == item_number:
+                    return [value,items[value]]
+
+
+def bench_catalog(label, catalog, draws):
+    rng = dice.GameRng(1)
+    entries = [(item.name, item.value) for item in catalog.items[WEAPON]]
+    start = time.perf_counter()
+    for __ in range(draws):
+        legacy_draw(entries, rng)
+    legacy = draws / (time.perf_counter() - start)
+
+    draw = catalog.draw
+    start = time.perf_counter()
+    for __ in range(draws):
+        draw(WEAPON, rng)
+    catalog_draws = draws / (time.perf_counter() - start)
+
+    names = [item.name for item in catalog.items[WEAPON]]
+    start = time.perf_counter()
+    for index in range(draws):
+        catalog.find(names[index % len(names)])
+    lookups = draws / (time.perf_counter() - start)
+
+    print(" [-] {0:18} old draw {1:12,.0f}/s   catalog draw {2:12,.0f}/s ({3:6.1f}x)   lookup by name {4:12,.0f}/s".format(
+        label, legacy, catalog_draws, catalog_draws / legacy, lookups))
+
+
+def bench():
+    bench_catalog("built-in items", CATALOG, 500000)
+    for count in (100, 5000):
+        bench_catalog("{0:,} items/slot".format(count), Catalog(made_up_items(count)), 500000 if count < 1000 else 2000)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "generate":
+        path = sys.argv[3] if len(sys.argv) > 3 else ITEM_FILE
+        write_catalog(path, int(sys.argv[2]))
+        print(" [-] wrote {0} items per slot to {1}".format(sys.argv[2], path))
+    else:
+        bench()
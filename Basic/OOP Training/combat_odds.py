@@ -0,0 +1,309 @@
+#!/usr/bin/python3
+
+# Exact combat odds. A fight here is the one combat_sim.py plays: every turn the hero attacks the first
+# living enemy (utils.hero_attack) and, unless that cleared the room, every living enemy takes its turn
+# (utils.enemy_action) until the hero or the last enemy is dead. All of it runs on 2d6 and a handful of
+# fixed damage and armor values, so instead of sampling fights the distributions are worked out exactly:
+#
+#   - hero_attack_table / enemy_turn_table: the damage of one attack and of one enemy turn, dodges and
+#     the dagger/shield perks included (the weights from combat_sim.enemy_outcome_table)
+#   - kill_turns: how many attacks an enemy takes to die, by dynamic programming over its health
+#   - damage after k enemy turns, by dynamic programming over the hero's health
+#
+# The hero's rolls never depend on the hero's health and the enemies' rolls never depend on theirs, so
+# the fight splits into one segment per enemy: k attacks to kill it and, meanwhile, k enemy turns from
+# everyone still standing. fight_odds() joins the segments and is cached per loadout and enemy set.
+#
+#   python combat_odds.py           odds for every starting loadout against a stock room, and timings
+#   python combat_odds.py check     compare with fights sampled by combat_sim.simulate()
+
+import functools
+import math
+import sys
+import time
+
+import combat_sim
+import dice
+import tuning
+import utils
+from dice import DICE_SUMS
+
+DICE_WAYS = (1, 2, 3, 4, 5, 6, 5, 4, 3, 2, 1)
+MAX_TURNS = 1000
+# Probability left over when a distribution is cut short (the hero is as good as dead by then)
+EPSILON = 1e-12
+
+
+def hero_attack_table(weapon, enemy_armor):
+    # ((damage, probability), ...) for one hero attack
+    table = {}
+    for roll, ways in zip(DICE_SUMS, DICE_WAYS):
+        damage = max(weapon + roll - enemy_armor, 0)
+        table[damage] = table.get(damage, 0) + ways / 36
+    return tuple(sorted(table.items()))
+
+
+@functools.lru_cache(maxsize=None)
+def enemy_turn_table(enemy_weapon, hero_armor, dagger, shield):
+    # ((damage, probability), ...) the hero takes from one enemy turn. Damage 0 covers defending,
+    # every dodge and hits the armor soaks up.
+    outcomes, cum_weights = combat_sim.ENEMY_OUTCOMES[(int(dagger), int(shield))]
+    total = cum_weights[-1]
+    table = {}
+    previous = 0
+    for outcome, cum_weight in zip(outcomes, cum_weights):
+        if outcome == 0:
+            damage = 0
+        else:
+            damage = max(enemy_weapon + outcome - hero_armor, 0)
+        table[damage] = table.get(damage, 0) + (cum_weight - previous) / total
+        previous = cum_weight
+    return tuple(sorted(table.items()))
+
+
+def combine(first, second):
+    # Damage table of two turns taken one after the other
+    table = {}
+    for damage_a, p_a in first:
+        for damage_b, p_b in second:
+            table[damage_a + damage_b] = table.get(damage_a + damage_b, 0) + p_a * p_b
+    return tuple(sorted(table.items()))
+
+
+@functools.lru_cache(maxsize=None)
+def kill_turns(health, weapon, enemy_armor, turns):
+    # [P(the enemy dies on attack k) for k = 0 .. turns]; the rest of the mass is "still alive"
+    table = hero_attack_table(weapon, enemy_armor)
+    alive = [0.0] * (health + 1)
+    alive[health] = 1.0
+    killed = [0.0]
+    for __ in range(turns):
+        after = [0.0] * (health + 1)
+        died = 0.0
+        for damage, p in table:
+            # alive[h] moves to h - damage, anything at or below 0 is dead
+            died += p * sum(alive[1:damage + 1])
+            kept = alive[damage + 1:]
+            after[1:1 + len(kept)] = [a + p * b for a, b in zip(after[1:1 + len(kept)], kept)]
+        killed.append(died)
+        alive = after
+        if sum(alive) < EPSILON:
+            break
+    return killed
+
+
+def damage_powers(table, health, turns):
+    # powers[k][c] = P(k enemy turns of this table did c damage in total), c < health only:
+    # everything from health up is a dead hero. Stops early once the hero is surely dead.
+    current = [0.0] * health
+    current[0] = 1.0
+    powers = [current]
+    for __ in range(turns):
+        after = [0.0] * health
+        for damage, p in table:
+            if damage >= health:
+                continue
+            after[damage:] = [a + p * b for a, b in zip(after[damage:], current[:health - damage])]
+        powers.append(after)
+        current = after
+        if sum(current) < EPSILON:
+            break
+    return powers
+
+
+def cumulative(values):
+    # below[x] = sum(values[:x])
+    below = [0.0]
+    total = 0.0
+    for value in values:
+        total += value
+        below.append(total)
+    return below
+
+
+def dot(a, b):
+    return math.fsum(x * y for x, y in zip(a, b))
+
+
+class FightOdds():
+    def __init__(self, win, death, win_turns, death_turns, kill_turns, mean_damage):
+        self.win = win
+        self.death = death
+        # Fights the hero neither won nor lost within MAX_TURNS (or below EPSILON)
+        self.unfinished = max(1.0 - win - death, 0.0)
+        self.win_turns = win_turns
+        self.death_turns = death_turns
+        # kill_turns[m][k] = P(enemy m takes k attacks to kill)
+        self.kill_turns = kill_turns
+        self.mean_damage = mean_damage
+
+    def mean_turns(self):
+        return sum(turn * p for turn, p in self.win_turns.items()) + sum(turn * p for turn, p in self.death_turns.items())
+
+    def turns_variance(self):
+        mean = self.mean_turns()
+        second = sum(turn * turn * p for turn, p in self.win_turns.items()) + sum(turn * turn * p for turn, p in self.death_turns.items())
+        return second - mean * mean
+
+
+@functools.lru_cache(maxsize=4096)
+def fight_odds(weapon, armor, dagger, shield, health, enemies, max_turns=MAX_TURNS):
+    # weapon/armor: the hero's damage and armor values, dagger/shield: whether the perks apply.
+    # enemies: ((health, weapon damage, armor value), ...) for the living enemies in attack order.
+    win_turns = {}
+    death_turns = {}
+    if not enemies:
+        return FightOdds(1.0, 0.0, {0: 1.0}, death_turns, [], 0.0)
+    count = len(enemies)
+
+    # The enemy turns during segment m come from enemies m .. count - 1
+    tables = [enemy_turn_table(enemy[1], armor, dagger, shield) for enemy in enemies]
+    phases = [None] * count
+    phases[count - 1] = tables[count - 1]
+    for m in range(count - 2, -1, -1):
+        phases[m] = combine(tables[m], phases[m + 1])
+
+    # survivors[t][c]: alive, every enemy before segment m dead at turn t, c damage taken so far
+    survivors = {0: [1.0] + [0.0] * (health - 1)}
+    kills = []
+    win = 0.0
+    death = 0.0
+    win_damage = 0.0
+    for m in range(count):
+        powers = damage_powers(phases[m], health, max_turns)
+        below = [cumulative(power) for power in powers]
+        # In segment m the enemy turn j happens when enemy m survived j + offset attacks. In the first
+        # segment there's no enemy turn before the first attack, later ones start on the kill turn.
+        offset = 1 if m == 0 else 0
+        killed = kill_turns(enemies[m][0], weapon, enemies[m][2], len(powers) + offset)
+        kills.append(killed)
+        still_alive = [1.0 - sum(killed[:k + 1]) for k in range(len(killed))]
+        last = m == count - 1
+        next_survivors = {}
+
+        for t, alive in survivors.items():
+            # The hero dies during enemy turn j: below health after j turns, not after j + 1
+            for j in range(len(powers) - 1):
+                if j + offset >= len(still_alive) or t + j + offset > max_turns:
+                    break
+                p = still_alive[j + offset]
+                if p <= 0.0:
+                    break
+                crossing = [below[j][health - c] - below[j + 1][health - c] for c in range(health)]
+                dies = p * dot(alive, crossing)
+                if dies > 0.0:
+                    turn = t + j + offset
+                    death_turns[turn] = death_turns.get(turn, 0.0) + dies
+                    death += dies
+
+            # Enemy m dies on attack k, after k - offset enemy turns
+            for k in range(1, len(killed)):
+                p = killed[k]
+                if p <= 0.0 or k - offset >= len(powers) or t + k > max_turns:
+                    continue
+                power = powers[k - offset]
+                if last:
+                    survive = [below[k - offset][health - c] for c in range(health)]
+                    wins = p * dot(alive, survive)
+                    if wins > 0.0:
+                        win_turns[t + k] = win_turns.get(t + k, 0.0) + wins
+                        win += wins
+                        # Damage taken in fights that are won: what came in before plus this segment's
+                        first_moment = cumulative([x * value for x, value in enumerate(power)])
+                        win_damage += p * (dot([c * value for c, value in enumerate(alive)], survive)
+                                           + dot(alive, [first_moment[health - c] for c in range(health)]))
+                else:
+                    after = next_survivors.get(t + k)
+                    if after is None:
+                        after = next_survivors[t + k] = [0.0] * health
+                    for c, value in enumerate(alive):
+                        if value > 0.0:
+                            scale = p * value
+                            after[c:] = [a + scale * b for a, b in zip(after[c:], power[:health - c])]
+        survivors = next_survivors
+
+    # A dead hero has taken all of their health in damage (see combat_sim.simulate)
+    return FightOdds(win, death, win_turns, death_turns, kills, win_damage + death * health)
+
+
+def living_enemies(enemies):
+    # Enemy records to the tuple fight_odds() takes
+    return tuple((enemy.health, enemy.attack_damage(), combat_sim.enemy_armor_value(enemy))
+                 for enemy in enemies if enemy.health > 0)
+
+
+def odds_for(hero_attribs, enemies):
+    # fight_odds() for a classic hero_attribs dict and a room's enemies
+    return fight_odds(hero_attribs['weapons'][1], hero_attribs['armor'][1],
+                      'dagger' in hero_attribs['weapons'], 'shield' in hero_attribs['armor'],
+                      hero_attribs['health'], living_enemies(enemies))
+
+
+def check(setups=12, fights=4000, seed=1, z_limit=4.0):
+    # Sample each setup many times with combat_sim.simulate() and compare the means with the exact ones
+    rng = dice.GameRng(seed)
+    chosen = combat_sim.random_setups(setups, rng)
+    batch = combat_sim.FightBatch()
+    for hero_attribs, enemies in chosen:
+        for __ in range(fights):
+            batch.add_fight(hero_attribs, enemies)
+    results = combat_sim.simulate(batch, rng=rng)
+
+    agree = True
+    worst = 0.0
+    print(" [-] {0:>5} {1:>10} {2:>10} {3:>10} {4:>10} {5:>10} {6:>10}".format(
+        "setup", "died", "sampled", "turns", "sampled", "damage", "sampled"))
+    for s, (hero_attribs, enemies) in enumerate(chosen):
+        odds = odds_for(hero_attribs, enemies)
+        rows = range(s * fights, (s + 1) * fights)
+        line = []
+        for exact, column in ((odds.death, results.died), (odds.mean_turns(), results.turns), (odds.mean_damage, results.damage_taken)):
+            mean, variance = combat_sim.mean_and_variance([column[f] for f in rows])
+            error = math.sqrt(variance / fights)
+            z = 0.0 if error == 0 else (mean - exact) / error
+            worst = max(worst, abs(z))
+            if abs(z) > z_limit:
+                agree = False
+            line.extend((exact, mean))
+        print(" [-] {0:>5} {1:10.4f} {2:10.4f} {3:10.3f} {4:10.3f} {5:10.2f} {6:10.2f}".format(s, *line))
+    print(" [-] largest |z| {0:.2f}".format(worst))
+    if agree:
+        print(" [-] Exact odds match the sampled fights.")
+    else:
+        print(" [!] Exact odds and sampled fights disagree.")
+    return agree
+
+
+def bench():
+    # Every starting loadout against one stock two-enemy room, the question combat_sim would
+    # need a few hundred thousand fights per loadout to answer to +-0.1%
+    room = ((tuning.ENEMY_HEALTH, 20, 10), (tuning.ENEMY_HEALTH, 15, 5))
+    loadouts = [(weapon, armor) for weapon in utils.WEAPON_CATALOG for armor in utils.ARMOR_CATALOG]
+
+    start = time.perf_counter()
+    answers = []
+    for weapon, armor in loadouts:
+        answers.append(fight_odds(weapon.value, armor.value, weapon.name == "dagger", armor.name == "shield", tuning.HERO_HEALTH, room))
+    cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for weapon, armor in loadouts:
+        fight_odds(weapon.value, armor.value, weapon.name == "dagger", armor.name == "shield", tuning.HERO_HEALTH, room)
+    warm = time.perf_counter() - start
+
+    print(" [-] {0:12} {1:13} {2:>8} {3:>8} {4:>8}".format("weapon", "armor", "win", "died", "turns"))
+    for (weapon, armor), odds in zip(loadouts, answers):
+        print(" [-] {0:12} {1:13} {2:8.2%} {3:8.2%} {4:8.2f}".format(weapon.name, armor.name, odds.win, odds.death, odds.mean_turns()))
+
+    # Monte Carlo fights needed for a 95% interval of +-0.1% on the worst case p = 0.5
+    needed = math.ceil((1.96 * 0.5 / 0.001) ** 2)
+    print(" [-] {0} loadouts exact: {1:.1f} ms, {2:.3f} ms cached".format(len(loadouts), 1000 * cold, 1000 * warm))
+    print(" [-] sampling to +-0.1% would take {0:,} fights per loadout, {1:,} in all".format(needed, needed * len(loadouts)))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "check":
+        if not check():
+            exit(-1)
+    else:
+        bench()
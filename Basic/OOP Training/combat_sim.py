@@ -0,0 +1,315 @@
+#!/usr/bin/python3
+
+# Headless combat engine. It applies the same rules main() uses (utils.hero_attack and utils.enemy_action)
+# to whole batches of fights at once. The fights are kept as columns (struct-of-arrays) instead of
+# Enemy objects and the dice are drawn in bulk blocks instead of one roll_dice() call at a time.
+# The game has no third party dependencies so the columns are stdlib arrays rather than NumPy.
+#
+# The player policy is the simple one: every command is "attack <first living enemy>".
+#
+#   python combat_sim.py            simulate a batch and print fights per second
+#   python combat_sim.py check      compare the engine against the interactive rules
+
+import copy
+import math
+import sys
+import time
+from array import array
+
+import dice
+import tuning
+import utils
+from dice import DICE_SUMS
+
+
+def enemy_outcome_table(dagger, shield):
+    # An enemy turn rolls up to five dice (action, attack, lucky dodge, dagger perk, shield perk) but the
+    # only thing that matters afterwards is whether an attack landed and what the attack roll was.
+    # This folds those dice into one exact distribution: outcome 0 is "no damage" (defended or dodged)
+    # and outcomes 2..12 are the attack roll of a hit. The weights are integers over 36^dice.
+    ways = dict(zip(DICE_SUMS, (1, 2, 3, 4, 5, 6, 5, 4, 3, 2, 1)))
+    attacks = 36 - 3        # action roll <= 10
+    no_lucky = 36 - 6       # lucky dodge roll < 10
+    no_perk = 36 - 10       # perk roll <= 8
+    dice = 3 + dagger + shield
+    weights = []
+    for roll in DICE_SUMS:
+        weights.append(attacks * ways[roll] * no_lucky * no_perk ** (dagger + shield))
+    outcomes = (0,) + DICE_SUMS
+    weights = [36 ** dice - sum(weights)] + weights
+    cum_weights = []
+    total = 0
+    for weight in weights:
+        total += weight
+        cum_weights.append(total)
+    return outcomes, tuple(cum_weights)
+
+ENEMY_OUTCOMES = {}
+for _dagger in (0, 1):
+    for _shield in (0, 1):
+        ENEMY_OUTCOMES[(_dagger, _shield)] = enemy_outcome_table(_dagger, _shield)
+
+
+class FightBatch:
+    # Hero columns have one row per fight. Enemy columns have one row per enemy and each
+    # fight owns the enemy rows first_enemy[f] .. first_enemy[f] + enemy_count[f] - 1.
+    def __init__(self):
+        self.hero_health = array('i')
+        self.hero_weapon = array('i')
+        self.hero_armor = array('i')
+        self.hero_dagger = array('b')
+        self.hero_shield = array('b')
+        self.first_enemy = array('i')
+        self.enemy_count = array('i')
+        self.enemy_health = array('i')
+        self.enemy_weapon = array('i')
+        self.enemy_armor = array('i')
+
+    def __len__(self):
+        return len(self.hero_health)
+
+    def add_fight(self, hero_attribs, enemies):
+        # Copy a classic hero_attribs dict and a room's Enemy list into the columns
+        self.hero_health.append(hero_attribs['health'])
+        self.hero_weapon.append(hero_attribs['weapons'][1])
+        self.hero_armor.append(hero_attribs['armor'][1])
+        self.hero_dagger.append('dagger' in hero_attribs['weapons'])
+        self.hero_shield.append('shield' in hero_attribs['armor'])
+        self.first_enemy.append(len(self.enemy_health))
+        self.enemy_count.append(len(enemies))
+        for enemy in enemies:
+            self.add_enemy(enemy.health, enemy.attack_damage(), enemy_armor_value(enemy))
+
+    def add_enemy(self, health, weapon_damage, armor_value):
+        self.enemy_health.append(health)
+        self.enemy_weapon.append(weapon_damage)
+        self.enemy_armor.append(armor_value)
+
+
+class FightResults:
+    def __init__(self, fights):
+        self.turns = array('i', bytes(4 * fights))
+        self.damage_taken = array('i', bytes(4 * fights))
+        self.died = array('b', bytes(fights))
+
+    def __len__(self):
+        return len(self.turns)
+
+    def summary(self):
+        fights = len(self)
+        return {
+            "fights": fights,
+            "mean_turns": sum(self.turns) / fights,
+            "mean_damage_taken": sum(self.damage_taken) / fights,
+            "death_rate": sum(self.died) / fights
+            }
+
+
+def enemy_armor_value(enemy):
+    # Same as hero_attack(): taken armor protects nothing
+    if enemy.armor_id < 0:
+        return 0
+    return enemy.armor_value
+
+
+def simulate(batch, max_turns=1000, rng=None):
+    # Run every fight in the batch to the end. The batch columns are left untouched.
+    if rng is None:
+        rng = dice.default_rng
+    fights = len(batch)
+    results = FightResults(fights)
+    turns = results.turns
+    damage_taken = results.damage_taken
+    died = results.died
+
+    hero_health = array('i', batch.hero_health)
+    enemy_health = array('i', batch.enemy_health)
+    hero_weapon = batch.hero_weapon
+    hero_armor = batch.hero_armor
+    hero_dagger = batch.hero_dagger
+    hero_shield = batch.hero_shield
+    enemy_weapon = batch.enemy_weapon
+    enemy_armor = batch.enemy_armor
+
+    # Enemies only ever take damage from the hero's target, so everything from the
+    # cursor to the end of the fight's rows is alive.
+    cursor = array('i', batch.first_enemy)
+    end = array('i', [batch.first_enemy[f] + batch.enemy_count[f] for f in range(fights)])
+
+    active = [f for f in range(fights) if cursor[f] < end[f]]
+    turn = 0
+    while active and turn < max_turns:
+        turn += 1
+
+        # Hero phase: one attack roll per active fight
+        still_fighting = []
+        for f, roll in zip(active, rng.sums(len(active))):
+            target = cursor[f]
+            damage = hero_weapon[f] + roll - enemy_armor[target]
+            if damage > 0:
+                health = enemy_health[target] - damage
+                if health <= 0:
+                    enemy_health[target] = 0
+                    cursor[f] = target + 1
+                    if target + 1 == end[f]:
+                        # Room cleared, main() skips the enemy phase
+                        turns[f] = turn
+                        continue
+                else:
+                    enemy_health[target] = health
+            still_fighting.append(f)
+
+        # Enemy phase: one outcome per living enemy, drawn in one block per dagger/shield combination
+        groups = {}
+        for f in still_fighting:
+            key = (hero_dagger[f], hero_shield[f])
+            if key in groups:
+                groups[key].append(f)
+            else:
+                groups[key] = [f]
+
+        active = []
+        for key, group in groups.items():
+            living = 0
+            for f in group:
+                living += end[f] - cursor[f]
+            outcomes, cum_weights = ENEMY_OUTCOMES[key]
+            rolls = rng.choices(outcomes, cum_weights=cum_weights, k=living)
+            r = 0
+            for f in group:
+                health = hero_health[f]
+                armor = hero_armor[f]
+                first = cursor[f]
+                last = end[f]
+                dead = False
+                for e in range(first, last):
+                    attack = rolls[r + e - first]
+                    if attack == 0:
+                        continue
+                    damage = enemy_weapon[e] + attack - armor
+                    if damage < 0:
+                        damage = 0
+                    if health - damage > 0:
+                        health -= damage
+                        damage_taken[f] += damage
+                    else:
+                        damage_taken[f] += health
+                        health = 0
+                        dead = True
+                        break
+                r += last - first
+                hero_health[f] = health
+                if dead:
+                    died[f] = 1
+                    turns[f] = turn
+                else:
+                    active.append(f)
+        active.sort()
+
+    for f in active:
+        turns[f] = turn
+    return results
+
+
+def reference_fight(hero_attribs, enemies, max_turns=1000, rng=None):
+    # The interactive path: the exact functions main() calls, one command at a time.
+    # Returns (turns, damage_taken, died) for comparison with simulate().
+    start_health = hero_attribs['health']
+    turn = 0
+    while turn < max_turns:
+        living = [enemy for enemy in enemies if enemy.health > 0]
+        if living == []:
+            break
+        turn += 1
+        utils.hero_attack(hero_attribs, living[0], rng)
+        for enemy in enemies:
+            if enemy.health <= 0:
+                continue
+            action = utils.enemy_action(hero_attribs, enemy, rng)
+            if action['died']:
+                return turn, start_health, True
+    return turn, start_health - hero_attribs['health'], False
+
+
+def random_setups(count, rng=None):
+    # Heroes and rooms drawn the way the game draws them (get_weapon/get_armor and produce_room_template)
+    if rng is None:
+        rng = dice.default_rng
+    setups = []
+    for __ in range(count):
+        hero_attribs = {
+            "name": "sim",
+            "health": tuning.HERO_HEALTH,
+            "armor": utils.get_armor(rng),
+            "weapons": utils.get_weapon(rng),
+            "boss_key": False
+            }
+        room = utils.produce_room_template(rng.randint(0, 4), rng)
+        setups.append((hero_attribs, room['enemies']))
+    return setups
+
+
+def batch_from_setups(setups):
+    batch = FightBatch()
+    for hero_attribs, enemies in setups:
+        batch.add_fight(hero_attribs, enemies)
+    return batch
+
+
+def check_equivalence(fights=20000, seed=None, z_limit=4.0):
+    # Run the same setups through the engine and through reference_fight() and compare the
+    # means of each outcome with a two-sample z test. Returns True when every outcome agrees.
+    rng = dice.GameRng(seed)
+    setups = random_setups(fights, rng)
+    engine = simulate(batch_from_setups(setups), rng=rng)
+
+    reference = FightResults(fights)
+    for f, (hero_attribs, enemies) in enumerate(setups):
+        turns, damage, died = reference_fight(dict(hero_attribs), copy.deepcopy(enemies), rng=rng)
+        reference.turns[f] = turns
+        reference.damage_taken[f] = damage
+        reference.died[f] = died
+
+    agree = True
+    print(" [-] {0:18} {1:>12} {2:>12} {3:>8}".format("outcome", "engine", "interactive", "z"))
+    for label, a, b in (("turns", engine.turns, reference.turns),
+                        ("damage_taken", engine.damage_taken, reference.damage_taken),
+                        ("died", engine.died, reference.died)):
+        mean_a, var_a = mean_and_variance(a)
+        mean_b, var_b = mean_and_variance(b)
+        error = math.sqrt(var_a / fights + var_b / fights)
+        z = 0.0 if error == 0 else (mean_a - mean_b) / error
+        if abs(z) > z_limit:
+            agree = False
+        print(" [-] {0:18} {1:12.4f} {2:12.4f} {3:8.2f}".format(label, mean_a, mean_b, z))
+    return agree
+
+def mean_and_variance(values):
+    count = len(values)
+    mean = sum(values) / count
+    return mean, sum((v - mean) ** 2 for v in values) / max(count - 1, 1)
+
+
+def bench(fights=200000):
+    setups = random_setups(min(fights, 5000))
+    batch = FightBatch()
+    while len(batch) < fights:
+        for hero_attribs, enemies in setups[:fights - len(batch)]:
+            batch.add_fight(hero_attribs, enemies)
+
+    start = time.perf_counter()
+    results = simulate(batch)
+    elapsed = time.perf_counter() - start
+    print(" [-] {0} fights in {1:.3f}s ({2:,.0f} fights/s)".format(fights, elapsed, fights / elapsed))
+    print(" [-] {0}".format(results.summary()))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "check":
+        if check_equivalence():
+            print(" [-] Engine matches the interactive rules.")
+        else:
+            print(" [!] Engine and interactive rules disagree.")
+            exit(-1)
+    else:
+        bench()
@@ -0,0 +1,249 @@
+#!/usr/bin/python3
+
+# The game's command layer. A typed command is compiled once into an Op tuple (kind, number, label,
+# item, text): the line is lowercased and split a single time, enemy numbers are turned into ints and
+# checked, and GameSession dispatches the op through its HANDLERS table by kind instead of working
+# the line through an if/elif chain. Compiled ops are cached, so a command typed again costs a dict
+# lookup.
+#
+# A line can hold several commands separated by ';' ("attack 1;attack 1;heal"), a batch. They run
+# one after the other, the game's output is kept until the batch is done and then handed over in one
+# go, and the hero and the save game are written once at the end instead of after every command.
+# A batch is checked before anything runs: when one of its commands doesn't make sense, none of them
+# are played.
+#
+#   python commands.py [commands]     commands per second one command at a time against batches
+#   python commands.py check          recorded sessions play the same game batched
+
+import functools
+import os
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+# number is the enemy number as an int, label the way it was typed, item the treasure or item name
+# and text the command as typed. Fields a kind doesn't use are None.
+Op = namedtuple("Op", ("kind", "number", "label", "item", "text"))
+
+HELP = "help"
+HEAL = "heal"
+NOTHING = "nothing"
+SAVE = "save"
+LOOK = "look"
+CHILL = "chill"
+MOVE_FORWARD = "move forward"
+MOVE_BACK = "move back"
+BAD_MOVE = "bad move"
+ATTACK = "attack"
+TAKE_TREASURE = "take treasure"
+TAKE_WEAPON = "take weapon"
+TAKE_ARMOR = "take armor"
+# take enemy N <anything but weapon or armor>
+TAKE_OTHER = "take other"
+BAD_TAKE = "bad take"
+# Two or more words the game doesn't know, nothing happens
+IGNORED = "ignored"
+# One word the game doesn't know, the enemies get their turn
+INVALID = "invalid"
+# A command that can't be played, label says why
+REJECTED = "rejected"
+
+# Commands that are one whole word (or ?)
+WORDS = {
+    "?": HELP,
+    "help": HELP,
+    "heal": HEAL,
+    "": NOTHING,
+    "save": SAVE,
+    "look": LOOK,
+    "chill": CHILL
+    }
+
+SEPARATOR = ";"
+CACHE_SIZE = 4096
+
+
+def rejected(text, reason):
+    return Op(REJECTED, None, reason, None, text)
+
+
+def enemy_number(word):
+    # The enemy number in word, None when it isn't one
+    try:
+        number = int(word)
+    except ValueError:
+        return None
+    if number < 1:
+        return None
+    return number
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def compile(text):
+    # The Op for one command. Words are split on single spaces and matched the way the game always has.
+    lower = text.lower()
+    kind = WORDS.get(lower)
+    if kind is not None:
+        return Op(kind, None, None, None, text)
+    words = text.split(" ")
+    if len(words) == 1:
+        return Op(INVALID, None, None, None, text)
+    verb = words[0].lower()
+    if verb == "move":
+        way = words[1].lower()
+        if way == "forward":
+            return Op(MOVE_FORWARD, None, None, None, text)
+        if way == "back" or way == "backward":
+            return Op(MOVE_BACK, None, None, None, text)
+        return Op(BAD_MOVE, None, None, None, text)
+    if verb == "attack":
+        number = enemy_number(words[1])
+        if number is None:
+            return rejected(text, "Attack which enemy? Give its number, like: attack 1")
+        return Op(ATTACK, number, words[1], None, text)
+    if verb == "take":
+        what = words[1].lower()
+        if what == "treasure":
+            if len(words) < 3:
+                return rejected(text, "Take which treasure? Like: take treasure key")
+            return Op(TAKE_TREASURE, None, None, words[2].lower(), text)
+        if what == "enemy":
+            number = enemy_number(words[2]) if len(words) > 2 else None
+            if number is None or len(words) < 4:
+                return rejected(text, "Take what from which enemy? Like: take enemy 1 weapon dagger")
+            if words[3] == "weapon" or words[3] == "armor":
+                if len(words) < 5:
+                    return rejected(text, "Take which {0}? Like: take enemy 1 {0} {1}".format(
+                        words[3], "dagger" if words[3] == "weapon" else "helmet"))
+                return Op(TAKE_WEAPON if words[3] == "weapon" else TAKE_ARMOR, number, words[2], words[4], text)
+            return Op(TAKE_OTHER, number, words[2], None, text)
+        return Op(BAD_TAKE, None, None, None, text)
+    return Op(IGNORED, None, None, None, text)
+
+
+def compile_line(line):
+    # The ops of a typed line, one per ';' separated command. Blank commands in a batch are dropped.
+    if SEPARATOR not in line:
+        return [compile(line)]
+    return [compile(part.strip()) for part in line.split(SEPARATOR) if part.strip()]
+
+
+class Batch():
+    # What a batch said, and whether it owes the hero or the save game a write
+    def __init__(self):
+        self.lines = []
+        self.hero = False
+        self.game = False
+
+    def say(self, *args):
+        # Same text as print(*args)
+        self.lines.append(" ".join(str(arg) for arg in args))
+
+    def text(self):
+        return "\n".join(self.lines)
+
+
+# The bench plays this over and over: fights, heals and moves without looking at the game,
+# like a script would
+BENCH_SCRIPT = ("look", "attack 1", "attack 2", "attack 1", "heal", "take treasure key", "move forward",
+                "attack 1", "chill", "attack 2", "heal", "move back")
+
+
+def end_game(world):
+    # Writes what the hero store still owes and lets go of the hero's files, so the next game or the
+    # scratch directory going away doesn't pull them out from under it
+    world.hero.store.close()
+    if world.hero.channel is not None:
+        world.hero.channel.close()
+
+
+def bench_play(commands, batch_size, scratch):
+    # Seconds to play commands commands through a GameSession with the hero file and the save game
+    # on disk and everything it says written to a file
+    import OOP_Game_lab
+    import dice
+    hero_file = os.path.join(scratch, "HeroObject.json")
+    save_file = os.path.join(scratch, "SaveGame.bin")
+    seed = 0
+    with open(os.path.join(scratch, "out.txt"), "w") as out:
+        def say(*args):
+            out.write(" ".join(str(arg) for arg in args) + "\n")
+
+        start = time.perf_counter()
+        world = None
+        session = None
+        played = 0
+        while played < commands:
+            if session is None or session.over is not None:
+                if world is not None:
+                    end_game(world)
+                seed += 1
+                world = OOP_Game_lab.scenario("bench", hero_file=hero_file, rng=dice.GameRng(seed))
+                session = OOP_Game_lab.GameSession(world, say=say, save_file=save_file)
+            count = min(batch_size, commands - played)
+            batch = [BENCH_SCRIPT[(played + i) % len(BENCH_SCRIPT)] for i in range(count)]
+            session.handle(SEPARATOR.join(batch))
+            # A terminal or a socket gets the output once per typed line
+            out.flush()
+            played += count
+        seconds = time.perf_counter() - start
+        end_game(world)
+        return seconds
+
+
+def bench(commands=20000, batch_sizes=(1, 10, 100)):
+    single = None
+    for batch_size in batch_sizes:
+        with tempfile.TemporaryDirectory() as scratch:
+            seconds = bench_play(commands, batch_size, scratch)
+        rate = commands / seconds
+        if single is None:
+            single = rate
+        print(" [-] {0:4} commands per line: {1:9,.0f} commands/s   {2:5.2f}x".format(batch_size, rate, rate / single))
+
+
+def play_recorded(name, commands, seed, batched):
+    # What the game says to a recorded session's commands, typed one at a time or as one batch
+    import OOP_Game_lab
+    import dice
+    batch = Batch()
+    world = OOP_Game_lab.scenario(name, hero_file=None, rng=dice.GameRng(seed))
+    session = OOP_Game_lab.GameSession(world, say=batch.say)
+    if batched:
+        session.handle(SEPARATOR.join(commands))
+    else:
+        for command in commands:
+            session.handle(command)
+    return batch.text()
+
+
+def check(seeds=(1, 2, 3)):
+    # The recorded sessions (sessions/) have to play the same game typed a command at a time and
+    # typed as one batch, and a batch with a command that makes no sense must not play at all
+    import replay
+    same = True
+    played = 0
+    for seed in seeds:
+        for session in replay.load_sessions(["sessions"]):
+            recorded_seed, lines = replay.session_seed(session)
+            # The hero's name and the enter at "When ready hit enter" go to main(), not the session
+            name, commands = lines[0], [command for command in lines[2:] if command]
+            if play_recorded(name, commands, seed, False) != play_recorded(name, commands, seed, True):
+                same = False
+                print("[!] {0} with seed {1} played differently as a batch".format(name, seed))
+            played += 1
+    print(" [-] {0} recorded sessions, one command at a time and batched: {1}".format(
+        played, "same games" if same else "different games"))
+    text = play_recorded("check", ["attack 1", "attack x", "heal"], 1, True)
+    untouched = "You did" not in text and "health is now" not in text
+    print(" [-] a batch with a bad command is turned down whole: {0}".format(untouched))
+    return same and untouched
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "check":
+        if not check():
+            exit(-1)
+    else:
+        bench(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,145 @@
+#!/usr/bin/python3
+
+# The game's random numbers. Each scenario owns a GameRng that world generation and combat draw from,
+# so a seed replays the same dungeon and the same fights. Dice faces and randint() ranges are drawn
+# BLOCK values at a time and handed out one by one instead of a random.randint() call per value.
+#
+#   python dice.py          rolls per second against the old random.randint() roll_dice()
+#   python dice.py check    same seed -> same game, replayed through replay.py
+
+import random
+import sys
+import time
+
+BLOCK = 4096
+
+# 2d6 sums and their cumulative weights, for drawing many sums in one random.choices() call
+DICE_SUMS = (2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12)
+DICE_CUM_WEIGHTS = (1, 3, 6, 10, 15, 21, 26, 30, 33, 35, 36)
+
+FACES = range(1, 7)
+
+
+class GameRng():
+    def __init__(self, seed=None, block=BLOCK):
+        # block is how many values are drawn at a time for each die and randint() range. Every range
+        # in use holds a block, so thousands of games in one process (server.py) want a small one.
+        self.seed = seed
+        self.block = block
+        self.random = random.Random(seed)
+        self.calls = 0
+        self._faces = []
+        self._face = 0
+        self._ranges = {}
+        self._floats = []
+        self._float = 0
+
+    def roll_dice(self):
+        # Same shape as utils.roll_dice(): [die1, die2, die1+die2]
+        self.calls += 1
+        face = self._face
+        faces = self._faces
+        if face + 2 > len(faces):
+            faces = self._faces = self.random.choices(FACES, k=self.block)
+            face = 0
+        self._face = face + 2
+        die1 = faces[face]
+        die2 = faces[face + 1]
+        return [die1, die2, die1+die2]
+
+    def randint(self, low, high):
+        # random.randint() but served from a block per (low, high)
+        self.calls += 1
+        block = self._ranges.get((low, high))
+        if block is None or block[1] == len(block[0]):
+            block = [self.random.choices(range(low, high + 1), k=self.block), 0]
+            self._ranges[(low, high)] = block
+        value = block[0][block[1]]
+        block[1] += 1
+        return value
+
+    def uniform(self):
+        # random.random() but served from a block, for loot.py
+        self.calls += 1
+        floats = self._floats
+        if self._float == len(floats):
+            rand = self.random.random
+            floats = self._floats = [rand() for __ in range(self.block)]
+            self._float = 0
+        value = floats[self._float]
+        self._float += 1
+        return value
+
+    def uniforms(self, count):
+        self.calls += count
+        rand = self.random.random
+        return [rand() for __ in range(count)]
+
+    def sums(self, count):
+        # count 2d6 sums at once
+        self.calls += count
+        return self.random.choices(DICE_SUMS, cum_weights=DICE_CUM_WEIGHTS, k=count)
+
+    def choices(self, population, cum_weights=None, k=1):
+        self.calls += k
+        return self.random.choices(population, cum_weights=cum_weights, k=k)
+
+
+# Used wherever no scenario RNG is passed in
+default_rng = GameRng()
+
+
+def legacy_roll_dice():
+    # utils.roll_dice() before GameRng
+    die1 = random.randint(1,6)
+    die2 = random.randint(1,6)
+    return [die1, die2, die1+die2]
+
+
+def bench(rolls=1000000):
+    start = time.perf_counter()
+    for __ in range(rolls):
+        legacy_roll_dice()
+    legacy = rolls / (time.perf_counter() - start)
+
+    rng = GameRng(1)
+    start = time.perf_counter()
+    for __ in range(rolls):
+        rng.roll_dice()
+    buffered = rolls / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    rng.sums(rolls)
+    bulk = rolls / (time.perf_counter() - start)
+
+    print(" [-] random.randint roll_dice: {0:12,.0f} rolls/s".format(legacy))
+    print(" [-] GameRng.roll_dice:        {0:12,.0f} rolls/s".format(buffered))
+    print(" [-] GameRng.sums (bulk):      {0:12,.0f} rolls/s".format(bulk))
+
+
+def check_determinism(seeds=(1, 2, 3)):
+    # The same recorded sessions played twice per seed must print exactly the same thing,
+    # and different seeds should give different games.
+    import replay
+    sessions = replay.load_sessions(["sessions"])
+    transcripts = {}
+    same = True
+    for seed in seeds:
+        first = [replay.run_session(session, seed=seed).output for session in sessions]
+        second = [replay.run_session(session, seed=seed).output for session in sessions]
+        if first != second:
+            same = False
+            print(" [!] seed {0} played two different games".format(seed))
+        transcripts[seed] = first
+    different = len(set(tuple(t) for t in transcripts.values())) == len(seeds)
+    print(" [-] identical seeds, identical games: {0}".format(same))
+    print(" [-] different seeds, different games: {0}".format(different))
+    return same and different
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "check":
+        if not check_determinism():
+            exit(-1)
+    else:
+        bench()
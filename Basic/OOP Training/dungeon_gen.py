@@ -0,0 +1,333 @@
+#!/usr/bin/python3
+
+# Bulk dungeon generation. generate_dungeons(n) builds n dungeons in one call as a struct-of-arrays
+# (one column per stat) using a handful of bulk random draws, instead of scenario.instantiateWorld()
+# calling produce_room_template() and Enemy() room by room. The draws follow the same distributions:
+#
+#   produce_room_template  1-2 enemies per room except the last room (one boss), boss key in room 4,
+#                          get_treasure() in rooms 0-3
+#   Enemy.__init__         health 100, 2 weapons 6 times in 10 otherwise 1, one armor piece,
+#                          a 15-20 roll out of 0-20 makes a non boss enemy special (health x3,
+#                          armor +5, weapon damage x2), all of these numbers as tuning.py has them
+#   get_treasure           the common chest table (loot.py), drawn for every chest in one draws() call
+#
+# Rooms are laid out like instantiateWorld(): location i of a dungeon holds room number 5 - i.
+# batch.dungeon(d) returns a DungeonView that only builds the classic room dicts and Enemy
+# objects for a location the first time the game asks for it.
+#
+#   python dungeon_gen.py           time bulk generation against instantiateWorld()
+#   python dungeon_gen.py check     compare the generated distributions, exits -1 when they differ
+
+import sys
+import time
+from array import array
+
+import dice
+import loot
+import tuning
+import utils
+
+ROOMS_PER_DUNGEON = 6
+
+# Treasure kinds stored in the treasure_kind column
+TREASURE_NONE = 0
+TREASURE_WEAPON = 1
+TREASURE_ARMOR = 2
+TREASURE_HEART = 3
+TREASURE_BOSS_KEY = 4
+
+# A missing second weapon, same as utils.NO_SLOT
+NO_ITEM = utils.NO_SLOT
+
+
+def treasure_item(kind, item_id, value):
+    # (kind, id, value) to the classic treasure list, None for TREASURE_NONE
+    if kind == TREASURE_WEAPON:
+        return [utils.WEAPON_CATALOG[item_id].name, value]
+    elif kind == TREASURE_ARMOR:
+        return [utils.ARMOR_CATALOG[item_id].name, value]
+    elif kind == TREASURE_HEART:
+        return ["heart", value]
+    elif kind == TREASURE_BOSS_KEY:
+        return ["boss_key", True]
+    return None
+
+def treasure_record(item):
+    # The classic treasure list to (kind, id, value)
+    name = item[0]
+    if name in utils.WEAPON_IDS:
+        return TREASURE_WEAPON, utils.WEAPON_IDS[name], item[1]
+    elif name in utils.ARMOR_IDS:
+        return TREASURE_ARMOR, utils.ARMOR_IDS[name], item[1]
+    elif name == "heart":
+        return TREASURE_HEART, 0, item[1]
+    elif name == "boss_key":
+        return TREASURE_BOSS_KEY, 0, 1
+    raise ValueError("unknown treasure: {0}".format(item))
+
+
+def zeros(typecode, count):
+    return array(typecode, bytes(array(typecode).itemsize * count))
+
+
+class DungeonBatch:
+    # Room columns have ROOMS_PER_DUNGEON rows per dungeon (row = dungeon * ROOMS_PER_DUNGEON + location).
+    # Enemy columns have one row per enemy, a room owns rows first_enemy[row] .. first_enemy[row] + enemy_count[row] - 1.
+    def __init__(self, dungeons):
+        self.dungeons = dungeons
+        rooms = dungeons * ROOMS_PER_DUNGEON
+        self.room_number = zeros('b', rooms)
+        self.first_enemy = zeros('i', rooms)
+        self.enemy_count = zeros('b', rooms)
+        self.treasure_kind = zeros('b', rooms)
+        self.treasure_id = zeros('h', rooms)
+        self.treasure_value = zeros('h', rooms)
+        self.enemy_room = array('i')
+        self.enemy_health = array('h')
+        self.enemy_final_boss = array('b')
+        self.enemy_special = array('b')
+        self.weapon1_id = array('h')
+        self.weapon1_damage = array('h')
+        self.weapon2_id = array('h')
+        self.weapon2_damage = array('h')
+        self.armor_id = array('h')
+        self.armor_value = array('h')
+
+    def __len__(self):
+        return self.dungeons
+
+    def dungeon(self, d):
+        return DungeonView(self, d)
+
+    def enemy_stats(self, e):
+        # Classic Enemy.stats values for enemy row e
+        weapons = [[utils.WEAPON_CATALOG[self.weapon1_id[e]].name, self.weapon1_damage[e]]]
+        if self.weapon2_id[e] != NO_ITEM:
+            weapons.append([utils.WEAPON_CATALOG[self.weapon2_id[e]].name, self.weapon2_damage[e]])
+        armor = [utils.ARMOR_CATALOG[self.armor_id[e]].name, self.armor_value[e]]
+        return self.enemy_health[e], weapons, armor
+
+    def treasure(self, row):
+        return treasure_item(self.treasure_kind[row], self.treasure_id[row], self.treasure_value[row])
+
+    def room(self, d, location):
+        # Materialize one classic room dict, the same shape produce_room_template() returns
+        row = d * ROOMS_PER_DUNGEON + location
+        room = {
+            "room_number": self.room_number[row],
+            "enemies": [],
+            "treasure": [],
+            "details": [],
+            }
+        first = self.first_enemy[row]
+        for e in range(first, first + self.enemy_count[row]):
+            room["enemies"].append(utils.Enemy.from_record(
+                self.enemy_health[e], self.weapon1_id[e], self.weapon1_damage[e], self.weapon2_id[e],
+                self.weapon2_damage[e], self.armor_id[e], self.armor_value[e], final_boss=bool(self.enemy_final_boss[e])))
+        treasure = self.treasure(row)
+        if treasure is not None:
+            room["treasure"].append(treasure)
+        return room
+
+
+class DungeonView:
+    # A list-like stand-in for scenario.dungeon. Rooms are built on first access and then kept,
+    # so the game's changes to enemies and treasure stick.
+    def __init__(self, batch, d):
+        self.batch = batch
+        self.d = d
+        self.rooms = {}
+
+    def __len__(self):
+        return ROOMS_PER_DUNGEON
+
+    def __getitem__(self, location):
+        if location < 0:
+            location += ROOMS_PER_DUNGEON
+        if location < 0 or location >= ROOMS_PER_DUNGEON:
+            raise IndexError("dungeon location out of range")
+        room = self.rooms.get(location)
+        if room is None:
+            room = self.batch.room(self.d, location)
+            self.rooms[location] = room
+        return room
+
+    def __iter__(self):
+        for location in range(ROOMS_PER_DUNGEON):
+            yield self[location]
+
+    def materialize(self):
+        return list(self)
+
+
+def generate_dungeons(count, rng=None):
+    if rng is None:
+        rng = dice.default_rng
+    batch = DungeonBatch(count)
+    choices = rng.choices
+
+    # Enemies per room. The last room (location 0, room 5) always holds a single boss.
+    variable_counts = choices((1, 2), k=count * (ROOMS_PER_DUNGEON - 1))
+    enemy_room = batch.enemy_room
+    enemy_final_boss = batch.enemy_final_boss
+    v = 0
+    for d in range(count):
+        for location in range(ROOMS_PER_DUNGEON):
+            row = d * ROOMS_PER_DUNGEON + location
+            room_number = ROOMS_PER_DUNGEON - 1 - location
+            batch.room_number[row] = room_number
+            batch.first_enemy[row] = len(enemy_room)
+            if room_number == 5:
+                enemies = 1
+            else:
+                enemies = variable_counts[v]
+                v += 1
+            batch.enemy_count[row] = enemies
+            final_boss = room_number >= 4
+            for __ in range(enemies):
+                enemy_room.append(row)
+                enemy_final_boss.append(final_boss)
+    enemy_total = len(enemy_room)
+
+    # Enemy stats, one bulk draw per column
+    two_weapons = choices((1, 0), cum_weights=(6, 10), k=enemy_total)
+    weapon1 = choices(range(len(utils.WEAPON_CATALOG)), k=enemy_total)
+    weapon2 = choices(range(len(utils.WEAPON_CATALOG)), k=enemy_total)
+    armor = choices(range(len(utils.ARMOR_CATALOG)), k=enemy_total)
+    special = choices((1, 0), cum_weights=(21 - tuning.SPECIAL_ROLL, 21), k=enemy_total)
+    special_health = tuning.ENEMY_HEALTH * tuning.SPECIAL_HEALTH
+
+    for e in range(enemy_total):
+        is_special = special[e] and not enemy_final_boss[e]
+        multiplier = tuning.SPECIAL_DAMAGE if is_special else 1
+        batch.enemy_special.append(is_special)
+        batch.enemy_health.append(special_health if is_special else tuning.ENEMY_HEALTH)
+        batch.weapon1_id.append(weapon1[e])
+        batch.weapon1_damage.append(utils.WEAPON_CATALOG[weapon1[e]].value * multiplier)
+        if two_weapons[e]:
+            batch.weapon2_id.append(weapon2[e])
+            batch.weapon2_damage.append(utils.WEAPON_CATALOG[weapon2[e]].value * multiplier)
+        else:
+            batch.weapon2_id.append(NO_ITEM)
+            batch.weapon2_damage.append(0)
+        batch.armor_id.append(armor[e])
+        batch.armor_value.append(utils.ARMOR_CATALOG[armor[e]].value + (tuning.SPECIAL_ARMOR if is_special else 0))
+
+    # Treasure: the boss key in room 4 and a chest in rooms 0-3
+    chests = loot.LOOT[loot.COMMON][loot.CHEST].draws(count * (ROOMS_PER_DUNGEON - 2), rng)
+    t = 0
+    for d in range(count):
+        for location in range(ROOMS_PER_DUNGEON):
+            row = d * ROOMS_PER_DUNGEON + location
+            room_number = batch.room_number[row]
+            if room_number == 4:
+                batch.treasure_kind[row] = TREASURE_BOSS_KEY
+            elif room_number < 4:
+                if chests[t] is not None:
+                    batch.treasure_kind[row], batch.treasure_id[row], batch.treasure_value[row] = treasure_record(chests[t])
+                t += 1
+    return batch
+
+
+def room_samples(rooms):
+    # What two generators are compared on, from classic room dicts: for every statistic one number per
+    # room or per enemy, so check() has both a mean and a spread to go on
+    weapon_names = utils.WEAPON_IDS
+    special_health = tuning.ENEMY_HEALTH * tuning.SPECIAL_HEALTH
+    samples = {
+        "enemies_per_room": [],
+        "special_rate": [],
+        "two_weapon_rate": [],
+        "mean_weapon_damage": [],
+        "mean_armor": [],
+        "weapon_treasure": [],
+        "armor_treasure": [],
+        "heart_treasure": [],
+        "boss_key": []
+        }
+    for room in rooms:
+        samples["enemies_per_room"].append(len(room["enemies"]))
+        for enemy in room["enemies"]:
+            samples["special_rate"].append(1 if enemy.stats["health"] == special_health else 0)
+            samples["two_weapon_rate"].append(1 if len(enemy.stats["weapons"]) == 2 else 0)
+            samples["mean_weapon_damage"].append(enemy.stats["weapons"][0][1])
+            samples["mean_armor"].append(enemy.stats["armor"][1])
+        treasure = {"weapon": 0, "armor": 0, "heart": 0, "boss_key": 0}
+        for item in room["treasure"]:
+            if item[0] in weapon_names:
+                treasure["weapon"] += 1
+            elif item[0] in ("heart", "boss_key"):
+                treasure[item[0]] += 1
+            else:
+                treasure["armor"] += 1
+        samples["weapon_treasure"].append(treasure["weapon"])
+        samples["armor_treasure"].append(treasure["armor"])
+        samples["heart_treasure"].append(treasure["heart"])
+        samples["boss_key"].append(treasure["boss_key"])
+    return samples
+
+
+def mean_variance(values):
+    mean = sum(values) / len(values)
+    return mean, sum((value - mean) ** 2 for value in values) / len(values)
+
+
+def templated_rooms(count):
+    # The rooms instantiateWorld() would have produced for count dungeons
+    rooms = []
+    for __ in range(count):
+        counter = ROOMS_PER_DUNGEON
+        while counter > 0:
+            counter -= 1
+            rooms.append(utils.produce_room_template(counter))
+    return rooms
+
+
+def check(count=20000, z_limit=4.0):
+    # Every statistic of the bulk dungeons has to match the templates' within z_limit standard errors
+    bulk = generate_dungeons(count)
+    bulk_rooms = []
+    for d in range(count):
+        bulk_rooms.extend(bulk.dungeon(d))
+    expected = room_samples(templated_rooms(count))
+    actual = room_samples(bulk_rooms)
+    print(" [-] {0:20} {1:>12} {2:>12} {3:>8}".format("", "templates", "bulk", "z"))
+    worst = 0.0
+    for key in expected:
+        expected_mean, expected_variance = mean_variance(expected[key])
+        actual_mean, actual_variance = mean_variance(actual[key])
+        error = (expected_variance / len(expected[key]) + actual_variance / len(actual[key])) ** 0.5
+        if error > 0:
+            z = (actual_mean - expected_mean) / error
+        elif actual_mean == expected_mean:
+            # Neither side varies (one boss key per dungeon), they have to be the same exactly
+            z = 0.0
+        else:
+            z = float("inf")
+        worst = max(worst, abs(z))
+        print(" [-] {0:20} {1:12.4f} {2:12.4f} {3:+8.2f}".format(key, expected_mean, actual_mean, z))
+    if worst > z_limit:
+        print("[!] The bulk dungeons don't match the templates, |z| = {0:.2f}".format(worst))
+        exit(-1)
+    print(" [-] The bulk dungeons match the templates (largest |z| {0:.2f})".format(worst))
+
+
+def bench(count=100000):
+    start = time.perf_counter()
+    generate_dungeons(count)
+    bulk = time.perf_counter() - start
+
+    templated = min(count, 20000)
+    start = time.perf_counter()
+    templated_rooms(templated)
+    per_object = (time.perf_counter() - start) * count / templated
+
+    print(" [-] generate_dungeons: {0:,.0f} dungeons/s".format(count / bulk))
+    print(" [-] produce_room_template: {0:,.0f} dungeons/s".format(count / per_object))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "check":
+        check()
+    else:
+        bench()
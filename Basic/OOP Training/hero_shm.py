@@ -0,0 +1,197 @@
+#!/usr/bin/python3
+
+# The hero's HUD stats in a small memory-mapped file next to HeroObject.json, so the HUD can follow the
+# game without a JSON write, a file read and a json.load() for every change. The file has one fixed
+# record:
+#
+#   offset 0   sequence   unsigned 64 bit, odd while the game is writing the record
+#   offset 8   health, armor id, armor value, weapon id, weapon damage   signed 32 bit each
+#   offset 28  boss key, name length, name (NAME_SIZE bytes of UTF-8)
+#   offset 94  CRC-32 of the 86 bytes from offset 8, unsigned 32 bit
+#
+# The game (HeroChannel.publish()) is the only writer. It bumps the sequence to odd, writes the record
+# and its checksum in place and bumps it back to even, a seqlock. A reader (HeroView.read()) takes the
+# sequence, copies the record and checksum out of the map and takes the sequence again; an odd or
+# changed sequence means it caught the game mid-write and it reads again. The sequence alone only
+# holds where the CPU keeps the writer's stores in order (x86 does, ARM doesn't have to), so the
+# reader also checks the copy against its checksum and reads again when they don't match.
+#
+#   python hero_shm.py check [reads]    a writer process hammering the record, a reader checking every read
+
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+
+HERO_SHM_FILE = "HeroObject.shm"
+NAME_SIZE = 64
+SEQUENCE = struct.Struct("<Q")
+RECORD = struct.Struct("<iiiii?B{0}s".format(NAME_SIZE))
+CHECKSUM = struct.Struct("<I")
+RECORD_OFFSET = SEQUENCE.size
+CHECKSUM_OFFSET = RECORD_OFFSET + RECORD.size
+SIZE = CHECKSUM_OFFSET + CHECKSUM.size
+# How many times read() tries before giving up on a writer that never finishes
+READ_RETRIES = 100000
+
+
+def shm_path(hero_file):
+    # HeroObject.json -> HeroObject.shm
+    return os.path.splitext(hero_file)[0] + ".shm"
+
+
+def open_map(path, access):
+    with open(path, "r+b" if access == mmap.ACCESS_WRITE else "rb") as _f:
+        return mmap.mmap(_f.fileno(), SIZE, access=access)
+
+
+class HeroChannel:
+    # The game's side. Creates the file when it's missing or the wrong size, otherwise carries on from
+    # the sequence that's in it so a HUD that's already running sees the new game.
+    def __init__(self, path=HERO_SHM_FILE):
+        self.path = path
+        if not os.path.exists(path) or os.path.getsize(path) != SIZE:
+            # Sequence 0 and an empty record with a checksum that matches it
+            record = RECORD.pack(0, 0, 0, 0, 0, False, 0, b"")
+            with open(path, "wb") as _wf:
+                _wf.write(SEQUENCE.pack(0) + record + CHECKSUM.pack(zlib.crc32(record)))
+        self.map = open_map(path, mmap.ACCESS_WRITE)
+        self.sequence = SEQUENCE.unpack_from(self.map, 0)[0]
+        if self.sequence & 1:
+            # A game died half way through a write
+            self.sequence += 1
+        self.published = None
+        self.publishes = 0
+
+    def publish(self, hero):
+        # Writes hero's record in place, nothing when it hasn't changed since the last publish
+        snapshot = hero.snapshot()
+        if snapshot == self.published:
+            return False
+        name = hero.name.encode("utf-8")[:NAME_SIZE]
+        self.sequence += 1
+        SEQUENCE.pack_into(self.map, 0, self.sequence)
+        record = RECORD.pack(hero.health, hero.armor_id, hero.armor_value, hero.weapon_id,
+                             hero.weapon_damage, hero.boss_key, len(name), name)
+        self.map[RECORD_OFFSET:CHECKSUM_OFFSET] = record
+        CHECKSUM.pack_into(self.map, CHECKSUM_OFFSET, zlib.crc32(record))
+        self.sequence += 1
+        SEQUENCE.pack_into(self.map, 0, self.sequence)
+        self.published = snapshot
+        self.publishes += 1
+        return True
+
+    def close(self):
+        self.map.close()
+
+
+class HeroView:
+    # The HUD's side, read only
+    def __init__(self, path=HERO_SHM_FILE):
+        self.path = path
+        self.map = open_map(path, mmap.ACCESS_READ)
+        # Reads that caught the game mid-write and went again
+        self.retries = 0
+        # Of those, the ones only the checksum caught
+        self.bad_checksums = 0
+
+    def sequence(self):
+        # Cheap enough to call every few milliseconds: has anything changed?
+        return SEQUENCE.unpack_from(self.map, 0)[0]
+
+    def read(self):
+        # (sequence, (health, armor id, armor value, weapon id, weapon damage, boss key, name))
+        for __ in range(READ_RETRIES):
+            before = SEQUENCE.unpack_from(self.map, 0)[0]
+            if not before & 1:
+                record = self.map[RECORD_OFFSET:CHECKSUM_OFFSET]
+                checksum = CHECKSUM.unpack_from(self.map, CHECKSUM_OFFSET)[0]
+                if SEQUENCE.unpack_from(self.map, 0)[0] == before:
+                    if checksum == zlib.crc32(record):
+                        health, armor_id, armor_value, weapon_id, weapon_damage, boss_key, name_length, name = RECORD.unpack(record)
+                        return before, (health, armor_id, armor_value, weapon_id, weapon_damage, boss_key,
+                                        name[:name_length].decode("utf-8", errors="replace"))
+                    self.bad_checksums += 1
+            self.retries += 1
+            # Let the writer finish, on one CPU it can't while we spin
+            time.sleep(0)
+        raise TimeoutError("{0} is stuck mid-write".format(self.path))
+
+    def close(self):
+        self.map.close()
+
+
+class TestHero:
+    # Just enough of a utils.Hero for publish(): every number is the same, so a torn read shows
+    __slots__ = ("name", "health", "armor_id", "armor_value", "weapon_id", "weapon_damage", "boss_key")
+
+    def __init__(self, value):
+        self.name = "check"
+        self.set(value)
+
+    def set(self, value):
+        self.health = self.armor_id = self.armor_value = self.weapon_id = self.weapon_damage = value
+        self.boss_key = value & 1 == 1
+
+    def snapshot(self):
+        return (self.name, self.health, self.armor_id, self.armor_value, self.weapon_id, self.weapon_damage, self.boss_key)
+
+
+def writer(path, seconds):
+    channel = HeroChannel(path)
+    hero = TestHero(0)
+    value = 0
+    stop = time.perf_counter() + seconds
+    while time.perf_counter() < stop:
+        value += 1
+        hero.set(value)
+        channel.publish(hero)
+    channel.close()
+    print(value)
+
+
+def check(reads=1000000):
+    # A writer process publishes as fast as it can while this process reads; every read has to be one
+    # whole record, and they have to come in order
+    import subprocess
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as scratch:
+        path = os.path.join(scratch, HERO_SHM_FILE)
+        HeroChannel(path).close()
+        process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--writer", path, "30"],
+                                   stdout=subprocess.PIPE, universal_newlines=True)
+        view = HeroView(path)
+        while view.sequence() == 0:
+            time.sleep(0.001)
+        torn = 0
+        last = 0
+        changed = 0
+        for __ in range(reads):
+            sequence, record = view.read()
+            health, armor_id, armor_value, weapon_id, weapon_damage, boss_key, name = record
+            if not health == armor_id == armor_value == weapon_id == weapon_damage or boss_key != (health & 1 == 1) or health < last:
+                torn += 1
+            if health != last:
+                changed += 1
+            last = health
+        process.kill()
+        process.wait()
+        view.close()
+    print(" [-] {0:,} reads, {1:,} saw a new record, {2:,} went again after catching the writer mid-write ({3:,} on the checksum)".format(
+        reads, changed, view.retries, view.bad_checksums))
+    if torn:
+        print("[!] {0:,} reads came back torn or out of order".format(torn))
+        exit(-1)
+    print(" [-] No torn reads")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 3 and sys.argv[1] == "--writer":
+        writer(sys.argv[2], float(sys.argv[3]))
+    elif len(sys.argv) > 1 and sys.argv[1] == "check":
+        check(int(sys.argv[2]) if len(sys.argv) > 2 else 1000000)
+    else:
+        print("usage: python hero_shm.py check [reads]")
@@ -0,0 +1,165 @@
+#!/usr/bin/python3
+
+# Horde rooms: rooms with so many enemies that GameSession.enemy_turn() resolves their turn in one go
+# instead of calling utils.enemy_action() and printing a few lines for every enemy. horde_turn() gives
+# each living enemy the outcome of a whole enemy_action() (held back, dodged, or a hit with its attack
+# roll) from one exact outcome table in a single rng.choices() call, works out the damage for all of
+# them in one pass, and finds the enemy that would land the killing blow with a running total and a
+# bisect. The odds are the same as enemy_action()'s (see 'check' below), the dice come out of the rng
+# in a different order, so a seed plays differently once a room turns into a horde.
+#
+# The game has no third party dependencies, so the batch is stdlib lists and itertools rather than NumPy.
+#
+#   python OOP_Game_lab.py --horde N    start the game in a room with a horde of N enemies
+#   python horde.py                     enemy turn latency for 10, 1,000 and 100,000 enemies, one at a time and as a horde
+#   python horde.py check               compare horde_turn() with enemy_action()
+
+import math
+import sys
+import time
+from bisect import bisect_left
+from itertools import accumulate
+
+import dice
+import utils
+from dice import DICE_SUMS
+
+# Rooms with at least this many enemies fight as a horde
+HORDE_SIZE = 10
+
+DEFENDED = -1
+DODGED = 0
+
+
+def horde_outcome_table(dagger, shield):
+    # One enemy_action() folded into one draw: DEFENDED, DODGED, or the attack roll 2..12 of a hit.
+    # The weights are whole numbers over 36 ** (3 + dagger + shield), the dice enemy_action() rolls.
+    ways = dict(zip(DICE_SUMS, (1, 2, 3, 4, 5, 6, 5, 4, 3, 2, 1)))
+    perks = dagger + shield
+    defended = 3 * 36 ** (2 + perks)             # action roll > 10
+    # No lucky dodge (roll < 10) and no perk that fires (roll <= 8)
+    not_dodged = 30 * 26 ** perks
+    dodged = 33 * 36 * (36 ** (1 + perks) - not_dodged)
+    outcomes = [DEFENDED, DODGED]
+    weights = [defended, dodged]
+    for roll in DICE_SUMS:
+        outcomes.append(roll)
+        weights.append(33 * ways[roll] * not_dodged)
+    return tuple(outcomes), tuple(accumulate(weights))
+
+HORDE_OUTCOMES = {}
+for _dagger in (0, 1):
+    for _shield in (0, 1):
+        HORDE_OUTCOMES[(_dagger, _shield)] = horde_outcome_table(_dagger, _shield)
+
+
+def horde_turn(hero_attribs, enemies, rng=None):
+    # Every living enemy's turn against the hero, in room order, stopping at the blow that kills him.
+    # The hero's health is updated in place and the turn is summed up for the caller to narrate.
+    if rng is None:
+        rng = dice.default_rng
+    weapons = [enemy.weapon1_damage if enemy.weapon1_id >= 0 else 0 for enemy in enemies if enemy.health > 0]
+    armor = hero_attribs['armor'][1]
+    outcomes, cum_weights = HORDE_OUTCOMES[('dagger' in hero_attribs['weapons'], 'shield' in hero_attribs['armor'])]
+    rolls = rng.choices(outcomes, cum_weights=cum_weights, k=len(weapons))
+    damage = [weapon + roll - armor if roll > 0 and weapon + roll > armor else 0 for weapon, roll in zip(weapons, rolls)]
+    # A running total of the damage, the first enemy that takes it to the hero's health kills him
+    total = list(accumulate(damage))
+    health = hero_attribs['health']
+    acted = bisect_left(total, health) + 1
+    died = acted <= len(total)
+    if not died:
+        acted = len(total)
+    if died:
+        taken = health
+        rolls = rolls[:acted]
+    else:
+        taken = total[-1] if total else 0
+    hero_attribs['health'] = health - taken
+    defended = rolls.count(DEFENDED)
+    dodged = rolls.count(DODGED)
+    return {
+        "enemies": len(weapons),
+        "acted": acted,
+        "defended": defended,
+        "dodged": dodged,
+        "hits": acted - defended - dodged,
+        "damage": taken,
+        "died": died
+        }
+
+
+def summary(turn):
+    return " [-] The horde attacks! {0} enemies: {1} held back, you dodged {2}, {3} hit you for {4} damage".format(
+        turn["acted"], turn["defended"], turn["dodged"], turn["hits"], turn["damage"])
+
+
+def make_horde(count, rng=None):
+    return [utils.Enemy(rng=rng) for __ in range(count)]
+
+
+def check(turns=20000, seed=1, z_limit=4.0):
+    # Damage per turn, horde_turn() against enemy_action() one enemy at a time, for every dagger/shield
+    # combination. The hero has health to spare so no turn is cut short.
+    rng = dice.GameRng(seed)
+    enemies = make_horde(5, rng)
+    worst = 0.0
+    for weapon, armor in ((["short_sword", 15], ["helmet", 5]), (["dagger", 5], ["helmet", 5]),
+                          (["short_sword", 15], ["shield", 10]), (["dagger", 5], ["shield", 10])):
+        samples = {"one at a time": [], "horde": []}
+        for __ in range(turns):
+            hero_attribs = {"health": 10 ** 9, "weapons": weapon, "armor": armor}
+            for enemy in enemies:
+                utils.enemy_action(hero_attribs, enemy, rng)
+            samples["one at a time"].append(10 ** 9 - hero_attribs["health"])
+            hero_attribs = {"health": 10 ** 9, "weapons": weapon, "armor": armor}
+            horde_turn(hero_attribs, enemies, rng)
+            samples["horde"].append(10 ** 9 - hero_attribs["health"])
+        means = {}
+        variances = {}
+        for label, values in samples.items():
+            means[label] = sum(values) / len(values)
+            variances[label] = sum((value - means[label]) ** 2 for value in values) / (len(values) - 1)
+        z = (means["horde"] - means["one at a time"]) / math.sqrt((variances["horde"] + variances["one at a time"]) / turns)
+        worst = max(worst, abs(z))
+        print(" [-] {0:12} {1:13} damage per turn: one at a time {2:6.2f}  horde {3:6.2f}   z {4:+5.2f}".format(
+            weapon[0], armor[0], means["one at a time"], means["horde"], z))
+    if worst > z_limit:
+        print("[!] horde_turn() doesn't match enemy_action(), |z| = {0:.2f}".format(worst))
+        exit(-1)
+    print(" [-] horde_turn() matches enemy_action() (largest |z| {0:.2f})".format(worst))
+
+
+def bench(sizes=(10, 1000, 100000)):
+    # GameSession.enemy_turn() in a room of each size, the classic way and as a horde. What the game
+    # says goes to a list (like server.py) so formatting counts but the terminal doesn't.
+    from OOP_Game_lab import GameSession, scenario
+
+    lines = []
+    def say(*args):
+        lines.append(" ".join(str(arg) for arg in args))
+
+    for size in sizes:
+        results = []
+        for horde_size in (size + 1, HORDE_SIZE):
+            world = scenario("bench", hero_file=None, seed=1)
+            world.dungeon[world.location]["enemies"] = make_horde(size, world.rng)
+            session = GameSession(world, say=say)
+            session.horde_size = horde_size
+            turns = 0
+            start = time.perf_counter()
+            while turns < 3 or (time.perf_counter() - start < 1.0 and turns < 10000):
+                world.hero.health = 10 ** 9
+                lines.clear()
+                session.enemy_turn()
+                turns += 1
+            results.append((time.perf_counter() - start) / turns)
+        print(" [-] {0:>7,} enemies   one at a time {1:10.3f} ms/turn   horde {2:8.3f} ms/turn   ({3:,.0f}x)".format(
+            size, 1000 * results[0], 1000 * results[1], results[0] / results[1]))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "check":
+        check()
+    else:
+        bench()
@@ -0,0 +1,259 @@
+#!/usr/bin/python3
+
+# Update latency and idle cost of the HUD modes in utils.watch_hero(). The HUD loop runs in a thread
+# and the main thread plays the game's part, changing the hero and saving him (HeroObject.json and
+# HeroObject.shm). Runs in a temporary directory so a real HeroObject.json is left alone.
+#
+#   python hud_bench.py [shm|poll|watch|notify ...] [--write-behind]
+#                                          --write-behind saves the hero the way the game does, through
+#                                          the HeroStore's write delay, instead of synchronously
+#   python hud_bench.py frames [count]     frames/s and CPU per frame, old full redraw against utils.HudScreen
+#   python hud_bench.py cpu [count]        CPU per hero update in the game and in the HUD, JSON file against shared memory
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import hero_shm
+import utils
+
+IDLE_SECONDS = 3
+
+
+def sync_hero(write_behind=False):
+    # Synchronous saves unless asked otherwise, so the write time below is the time the file changed
+    return utils.Hero("bench", write_behind=write_behind)
+
+
+def measure(mode, updates, write_behind=False):
+    hero = sync_hero(write_behind)
+
+    seen = {}
+    def on_change(hero_stats):
+        seen.setdefault(hero_stats["health"], time.perf_counter())
+
+    stop = threading.Event()
+    counters = {}
+    hud = threading.Thread(target=utils.watch_hero, args=(mode, on_change, stop, counters))
+    hud.start()
+    time.sleep(0.5)
+
+    # Idle: nothing changes, count how often the HUD wakes up and what it costs
+    wakeups = counters["wakeups"]
+    cpu = time.process_time()
+    time.sleep(IDLE_SECONDS)
+    idle_wakeups = (counters["wakeups"] - wakeups) / IDLE_SECONDS
+    idle_cpu = (time.process_time() - cpu) / IDLE_SECONDS
+
+    # Updates: a new health value each time, latency is write to HUD callback
+    latencies = []
+    spacing = utils.HUD_POLL_INTERVAL / 4 if mode == "poll" else 0.1
+    for health in range(1, updates + 1):
+        hero.health = health
+        written = time.perf_counter()
+        hero.write_hero_object_to_disk()
+        deadline = written + utils.HUD_POLL_INTERVAL * 2
+        while health not in seen and time.perf_counter() < deadline:
+            time.sleep(0.001)
+        if health in seen:
+            latencies.append(seen[health] - written)
+        time.sleep(spacing)
+
+    stop.set()
+    utils.notify_hud()
+    hud.join()
+
+    latencies.sort()
+    print(" [-] {0:7} latency mean {1:8.2f} ms  p50 {2:8.2f} ms  max {3:8.2f} ms   idle {4:6.2f} wakeups/s  {5:6.3f} ms CPU/s".format(
+        mode,
+        1000 * sum(latencies) / len(latencies),
+        1000 * latencies[len(latencies) // 2],
+        1000 * latencies[-1],
+        idle_wakeups,
+        1000 * idle_cpu))
+
+
+def legacy_render_hud(hero_stats):
+    # utils.render_hud() before the art was formatted once at import
+    hero_pic = r"""
+     /\
+     ||
+     ||
+     ||
+     ||           {}
+     ||          .--.
+     ||         /.--.\
+     ||         |====|
+     ||         |`::`|
+    _||_    .-;`\..../`;_.-^-._
+     /\\   /  |...::..|`   :   `|
+     |:'\ |   /'''::''|   .:.   |
+      \ /\;-,/\   ::  |..:::::..|
+       \ <` >  >._::_.| ':::::' |
+        `""`  /   ^^  |   ':'   |
+              |       \    :    /
+              |        \   :   /
+              |___/\___|`-.:.-`
+               \_ || _/    `
+               <_ >< _>
+               |  ||  |
+               |  ||  |
+              _\.:||:./_
+             /____/\____\
+        """
+
+    stats = {
+        "Health": hero_stats["health"],
+        "Armor": hero_stats["armor"],
+        "Weapons": hero_stats["weapons"]
+    }
+
+
+    # This is what the dungeon layout will be
+
+
+    '''
+    +=============| |=============+
+    |                             |     Room number:
+    |                             |     Enemies:
+    |                             |     Treasure:
+    |                             |
+    |                             |
+    |                             |
+    |                             |
+    |                             |
+    +=============| |=============+
+    '''
+
+    # This line will present the knight and display derp.
+    # derp will be replaced by the health information
+    for index, lines in enumerate(hero_pic.split("\n")):
+        if index == 0:
+            print("{0:6}   Name: {1}{2:25}".format(lines, hero_stats["name"],''))
+        elif index == 1:
+            print("{0:5}  Health: {1}{2:25}".format(lines, stats["Health"],''))
+        elif index == 2:
+            print("{0:5}  Armor: {1:25}".format(lines, ''.join(stats["Armor"][0])))
+        elif index == 3:
+            print("{0:5}  Weapons: {1:25}".format(lines, ''.join(stats["Weapons"][0])))
+        else:
+            print("{0:30}".format(lines))
+
+
+def legacy_frame(hero_stats):
+    # A HUD frame before utils.HudScreen: a cls/clear process, then the whole picture
+    utils.clear_screen()
+    legacy_render_hud(hero_stats)
+
+
+def frame_stats(count):
+    # The hero as the game would save it, taking a hit every frame
+    hero_stats = utils.Hero("bench", write_behind=False, hero_file=None).to_dict()
+    frames = []
+    for index in range(count):
+        changed = dict(hero_stats)
+        changed["health"] = 100 - index % 100
+        frames.append(changed)
+    return frames
+
+
+def time_frames(draw, frames):
+    # (seconds, CPU seconds) for drawing every frame, CPU of child processes included
+    before = os.times()
+    start = time.perf_counter()
+    for hero_stats in frames:
+        draw(hero_stats)
+    elapsed = time.perf_counter() - start
+    after = os.times()
+    cpu = (after.user + after.system + after.children_user + after.children_system
+           - before.user - before.system - before.children_user - before.children_system)
+    return elapsed, cpu
+
+
+def bench_frames(count):
+    # Everything goes to os.devnull, including what the clear process writes, so the terminal's own
+    # drawing speed stays out of it
+    stdout_fd = os.dup(1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    sys.stdout.flush()
+    os.dup2(devnull, 1)
+    try:
+        # The old way forks a process per frame, a tenth of the frames is plenty
+        legacy_count = max(count // 10, 1)
+        legacy = time_frames(legacy_frame, frame_stats(legacy_count))
+        with open(os.devnull, "w") as out:
+            screen = utils.HudScreen(out)
+            frames = frame_stats(count + 1)
+            # The first frame draws everything, time the updates after it
+            screen.frame(frames[0])
+            first = screen.bytes_written
+            differential = time_frames(screen.frame, frames[1:])
+    finally:
+        sys.stdout.flush()
+        os.dup2(stdout_fd, 1)
+        os.close(stdout_fd)
+        os.close(devnull)
+    for label, (elapsed, cpu), frames in (("full redraw", legacy, legacy_count), ("HudScreen", differential, count)):
+        print(" [-] {0:12} {1:7,} frames  {2:12,.0f} frames/s  {3:10.1f} us CPU/frame".format(
+            label, frames, frames / elapsed, 1e6 * cpu / frames))
+    print(" [-] HudScreen: {0:,} bytes for the first frame, {1:.0f} bytes per frame after it".format(
+        first, (screen.bytes_written - first) / max(screen.frames - 1, 1)))
+
+
+def bench_cpu(count):
+    # Each side of an update on its own: the game saving the hero and the HUD reading him back, through
+    # HeroObject.json (a synchronous HeroStore write and the HUD ping, then read_hero_stats()) and through
+    # HeroObject.shm (Hero.publish_stats(), the same ping included, then HeroView.read() into the same dict)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        try:
+            hero = sync_hero()
+            view = hero_shm.HeroView(hero_shm.HERO_SHM_FILE)
+
+            def cpu(function):
+                start = time.process_time()
+                for index in range(count):
+                    # A different health every time so nothing is skipped as unchanged
+                    hero.health = 1 + index % 100
+                    function()
+                return (time.process_time() - start) / count
+
+            def read_shm():
+                utils.shm_hero_stats(view.read()[1])
+
+            results = (
+                ("HeroObject.json", cpu(hero.store.request), cpu(utils.read_hero_stats)),
+                ("HeroObject.shm", cpu(hero.publish_stats), cpu(read_shm)),
+                )
+            view.close()
+        finally:
+            os.chdir(cwd)
+    for label, game, hud in results:
+        print(" [-] {0:16} game {1:8.2f} us CPU/update   HUD {2:8.2f} us CPU/update   total {3:8.2f} us".format(
+            label, 1e6 * game, 1e6 * hud, 1e6 * (game + hud)))
+    print(" [-] shared memory uses {0:.0f}x less CPU per update".format(
+        (results[0][1] + results[0][2]) / (results[1][1] + results[1][2])))
+
+
+def main(modes, write_behind=False):
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        try:
+            for mode in modes:
+                measure(mode, 8 if mode == "poll" else 50, write_behind)
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "frames":
+        bench_frames(int(sys.argv[2]) if len(sys.argv) > 2 else 20000)
+    elif len(sys.argv) > 1 and sys.argv[1] == "cpu":
+        bench_cpu(int(sys.argv[2]) if len(sys.argv) > 2 else 10000)
+    else:
+        modes = [arg for arg in sys.argv[1:] if arg != "--write-behind"]
+        main(modes or ["shm", "poll", "watch", "notify"], "--write-behind" in sys.argv)
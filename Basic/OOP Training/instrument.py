@@ -0,0 +1,276 @@
+#!/usr/bin/python3
+
+# Opt-in instrumentation for the command loop. A GameSession made with stats=instrument.Stats() records
+# for every command:
+#   - how long it took, in a latency histogram per command type (attack, move, take, look, heal, ...)
+#   - where the time went: the command itself, the enemies' turn, printing (say), asking the hero
+#     store to save the hero, and autosaving the game
+#   - how many random numbers it drew (GameRng.calls)
+# along with the hero store's and the autosave's disk writes and bytes. stats.summary() returns all of
+# it as a dict, stats.dump() writes that to a JSON file, every DUMP_INTERVAL seconds while playing and
+# once at the end. A session without stats only pays an "is None" check or two per command.
+#
+#   python OOP_Game_lab.py --stats [file]      play with stats on, dumped to file (stats.json)
+#   python replay.py <sessions> --stats [file] the same for replayed sessions, printed at the end
+#   python instrument.py [file]                print a dump
+#   python instrument.py bench [commands]      what the instrumentation costs, off against on
+
+import json
+import sys
+import time
+
+import persistence
+
+STATS_FILE = "stats.json"
+DUMP_INTERVAL = 5.0
+
+# Latency buckets are log-linear in microseconds: exact below 4 us, then every power of two split in
+# 4 (4-5, 5-6, 6-7, 7-8, 8-10, 10-12, ...), so a percentile is off by at most a quarter. 128 buckets
+# go past an hour.
+BUCKETS = 128
+
+COMMAND_TYPES = ("attack", "move", "take", "look", "heal", "chill", "save", "help")
+# Times in "output", "hero_save" and "game_save" aren't counted again in the phase they happened in
+PHASES = ("command", "enemy_turn", "output", "hero_save", "game_save")
+
+
+def bucket(microseconds):
+    n = int(microseconds)
+    if n < 4:
+        return n
+    bits = n.bit_length()
+    return min(4 * (bits - 2) + ((n >> (bits - 3)) & 3), BUCKETS - 1)
+
+
+def bucket_top(index):
+    # The latency (us) where a bucket ends
+    if index < 4:
+        return index + 1
+    return (5 + index % 4) << (index // 4 - 1)
+
+
+def command_type(line):
+    # The histogram a typed line goes in
+    word = line.lower().split(" ")[0]
+    if word in COMMAND_TYPES:
+        return word
+    if word == "?":
+        return "help"
+    if word == "":
+        return "empty"
+    return "other"
+
+
+class Histogram():
+    def __init__(self):
+        self.buckets = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.low = None
+        self.high = 0.0
+
+    def add(self, seconds):
+        self.buckets[bucket(seconds * 1e6)] += 1
+        self.count += 1
+        self.total += seconds
+        if self.low is None or seconds < self.low:
+            self.low = seconds
+        if seconds > self.high:
+            self.high = seconds
+
+    def percentile(self, fraction):
+        # The top of the bucket the latency at fraction falls in, in microseconds, capped at the
+        # highest latency seen
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return min(bucket_top(index), self.high * 1e6)
+        return self.high * 1e6
+
+    def summary(self):
+        last = max([index for index, count in enumerate(self.buckets) if count] or [0])
+        return {
+            "count": self.count,
+            "mean_us": 1e6 * self.total / max(self.count, 1),
+            "min_us": 1e6 * (self.low or 0.0),
+            "p50_us": self.percentile(0.5),
+            "p90_us": self.percentile(0.9),
+            "p99_us": self.percentile(0.99),
+            "max_us": 1e6 * self.high,
+            # buckets[i] counts the commands that took under bucket_top(i) us and at least bucket_top(i - 1)
+            "buckets": self.buckets[:last + 1]
+            }
+
+
+class Stats():
+    def __init__(self, path=None, interval=DUMP_INTERVAL):
+        # path=None keeps the stats in memory only, see summary()
+        self.path = path
+        self.interval = interval
+        self.commands = {}
+        self.rng_calls = {}
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.game_saves = 0
+        self.game_save_bytes = 0
+        self.started = time.time()
+        self.next_dump = time.monotonic() + interval
+        self.rng = None
+        self.store = None
+        # Hero stores of sessions played before the current one
+        self.store_totals = {}
+        # The command being timed
+        self.phase = None
+        self.start = 0.0
+        self.mark = 0.0
+        self.leaf = 0.0
+        self.rng_before = 0
+
+    def attach(self, world):
+        # GameSession calls this with its world, one Stats can follow several sessions one after another
+        if self.store is not None:
+            self.fold_store()
+        self.rng = world.rng
+        self.store = world.hero.store
+
+    def fold_store(self):
+        for key, value in self.store.counters().items():
+            self.store_totals[key] = self.store_totals.get(key, 0) + value
+        self.store = None
+
+    def timed(self, phase, function):
+        # function, with its time booked to phase instead of the phase it was called from
+        phases = self.phases
+        perf_counter = time.perf_counter
+        def wrapper(*args):
+            start = perf_counter()
+            try:
+                return function(*args)
+            finally:
+                elapsed = perf_counter() - start
+                phases[phase] += elapsed
+                self.leaf += elapsed
+        return wrapper
+
+    def begin(self):
+        self.phase = "command"
+        self.leaf = 0.0
+        self.rng_before = self.rng.calls
+        self.start = self.mark = time.perf_counter()
+
+    def switch(self, phase):
+        now = time.perf_counter()
+        self.phases[self.phase] += now - self.mark - self.leaf
+        self.phase = phase
+        self.mark = now
+        self.leaf = 0.0
+
+    def end(self, line):
+        now = time.perf_counter()
+        self.phases[self.phase] += now - self.mark - self.leaf
+        kind = command_type(line)
+        histogram = self.commands.get(kind)
+        if histogram is None:
+            histogram = self.commands[kind] = Histogram()
+        histogram.add(now - self.start)
+        self.rng_calls[kind] = self.rng_calls.get(kind, 0) + self.rng.calls - self.rng_before
+        if self.path is not None and time.monotonic() >= self.next_dump:
+            self.dump()
+
+    def game_saved(self, written):
+        self.game_saves += 1
+        self.game_save_bytes += written
+
+    def summary(self):
+        store = dict(self.store_totals)
+        if self.store is not None:
+            for key, value in self.store.counters().items():
+                store[key] = store.get(key, 0) + value
+        command_types = {}
+        for kind, histogram in self.commands.items():
+            command_types[kind] = histogram.summary()
+            command_types[kind]["rng_calls"] = self.rng_calls[kind]
+        return {
+            "started": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started)),
+            "updated": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "commands": sum(histogram.count for histogram in self.commands.values()),
+            "command_types": command_types,
+            "phases_ms": dict((phase, 1000 * seconds) for phase, seconds in self.phases.items()),
+            "rng_calls": sum(self.rng_calls.values()),
+            "hero_store": store,
+            "game_saves": {"writes": self.game_saves, "bytes": self.game_save_bytes}
+            }
+
+    def dump(self, path=None):
+        self.next_dump = time.monotonic() + self.interval
+        persistence.write_atomic(path or self.path, json.dumps(self.summary(), indent=2))
+
+
+def print_report(summary):
+    print(" [-] {0:,} commands, {1:,} random numbers drawn ({2} .. {3})".format(
+        summary["commands"], summary["rng_calls"], summary["started"], summary["updated"]))
+    print(" [-] {0:8} {1:>8} {2:>10} {3:>10} {4:>10} {5:>10} {6:>10} {7:>8}".format(
+        "command", "count", "mean us", "p50 us", "p90 us", "p99 us", "max us", "rng/cmd"))
+    for kind, latency in sorted(summary["command_types"].items(), key=lambda item: -item[1]["count"]):
+        print(" [-] {0:8} {1:>8,} {2:10.1f} {3:10.0f} {4:10.0f} {5:10.0f} {6:10.1f} {7:8.2f}".format(
+            kind, latency["count"], latency["mean_us"], latency["p50_us"], latency["p90_us"],
+            latency["p99_us"], latency["max_us"], latency["rng_calls"] / latency["count"]))
+    phases = summary["phases_ms"]
+    total = max(sum(phases.values()), 1e-9)
+    print(" [-] time per phase: " + ", ".join("{0} {1:.1f} ms ({2:.0%})".format(
+        phase, phases[phase], phases[phase] / total) for phase in PHASES))
+    store = summary["hero_store"]
+    if store:
+        print(" [-] hero store: {0:,} save requests, {1:,} writes, {2:,} bytes, {3:.1f} ms writing".format(
+            store["requested"], store["performed"], store["bytes_written"], 1000 * store["write_seconds"]))
+    saves = summary["game_saves"]
+    print(" [-] autosaves: {0:,} writes, {1:,} bytes".format(saves["writes"], saves["bytes"]))
+
+
+def bench(commands=100000):
+    # The same seeded games with stats off and on. Games are played by balance.py's fighter policy.
+    import OOP_Game_lab
+    import balance
+    import dice
+    import utils
+
+    def play(stats):
+        seed = 0
+        played = 0
+        start = time.perf_counter()
+        while played < commands:
+            world = OOP_Game_lab.scenario("bench", hero_file=None, rng=dice.GameRng(seed, block=balance.DICE_BLOCK))
+            session = OOP_Game_lab.GameSession(world, say=utils.quiet, stats=stats)
+            while session.over is None and played < commands:
+                session.handle(balance.next_command(session, "fighter", 40))
+                played += 1
+            seed += 1
+        return (time.perf_counter() - start) / played
+
+    # Best of three, alternating
+    off = []
+    on = []
+    for __ in range(3):
+        off.append(play(None))
+        stats = Stats()
+        on.append(play(stats))
+    off = min(off)
+    on = min(on)
+    print(" [-] {0:,} commands: stats off {1:.2f} us/command, on {2:.2f} us/command ({3:+.1%})".format(
+        commands, 1e6 * off, 1e6 * on, on / off - 1))
+    print_report(stats.summary())
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        bench(int(sys.argv[2]) if len(sys.argv) > 2 else 100000)
+    else:
+        path = sys.argv[1] if len(sys.argv) > 1 else STATS_FILE
+        try:
+            with open(path) as _rf:
+                summary = json.load(_rf)
+        except (OSError, ValueError) as ex:
+            print("[!] Couldn't read {0}: {1}".format(path, ex))
+            exit(-1)
+        print_report(summary)
@@ -0,0 +1,375 @@
+#!/usr/bin/python3
+
+# An append-only journal of what happens in a game: attacks, the enemies' actions, items taken, room
+# moves, heals, saves and how the game ended. A GameSession made with journal=journal.Journal() logs
+# every event as a fixed-size RECORD (32 bytes) to its own file in JOURNAL_DIR, one file per session:
+#
+#   header  HEADER: magic, version, record size, session number, start time
+#   records time, command number, kind, flags, location, then a, b and c, whose meaning depends on
+#           the kind (see KINDS below)
+#
+# Records are packed into a buffer in memory. The buffer goes to the file when it's full, at the end
+# of a command once FLUSH_INTERVAL seconds went by since the last time, and when the session ends;
+# the file is fsync()ed every FSYNC_INTERVAL seconds and at the end. A crash loses at most the last
+# FLUSH_INTERVAL seconds, and a record cut in half at the end of a file is skipped when reading.
+#
+# read_events() streams the events back from any number of files or directories, a chunk at a time,
+# so a set of journals of any size is read in the same small amount of memory.
+#
+#   python OOP_Game_lab.py --journal [dir]         play with a journal in dir (journal)
+#   python replay.py <sessions> --journal [dir]    the same for replayed sessions, a file each
+#   python journal.py [dir or file ...] [--kind attack,move ...] [--session N ...] [--show]
+#                                                  events per kind and session, --show prints each one
+#   python journal.py bench [events]               writing while playing, then reading millions of events
+
+import os
+import struct
+import sys
+import time
+from collections import namedtuple
+
+JOURNAL_DIR = "journal"
+SESSION_FILE = "session-{0:06d}.mehj"
+MAGIC = b"MEHJ"
+VERSION = 1
+HEADER = struct.Struct("<4sHHId")
+RECORD = struct.Struct("<dIBBxxiiii")
+BUFFER_RECORDS = 4096
+FLUSH_INTERVAL = 0.2
+FSYNC_INTERVAL = 1.0
+# Records read_events() reads at a time
+CHUNK_RECORDS = 8192
+
+# Event kinds, and what location, a, b and c hold for each
+START = 1     # the room the game starts in, a: rooms in the dungeon, b: hero health, c: seed (-1 none or too big)
+MOVE = 2      # the room moved to, a: the room moved from
+ATTACK = 3    # a: enemy number, b: damage done, c: the enemy's health after; flags KILLED
+ENEMY = 4     # a: enemy number, b: damage taken (-1 when no blow landed), c: hero health after;
+              # flags DEFENDED, LUCKY_DODGE, DAGGER_DODGE, SHIELD_DODGE, DIED
+HORDE = 5     # a: enemies that acted, b: hits, c: damage taken; flags DIED
+TAKE = 6      # a: KEY, WEAPON, ARMOR or HEART, b: item id (-1 for a heart), c: its value; flags FROM_ENEMY
+HEAL = 7      # b: hero health
+SAVE = 8      # nothing else
+END = 9       # a: WON or DIED
+LOOT = 10     # a: number of the enemy that dropped it, b: item id (-1 for a heart), c: its value;
+              # flags WEAPON, ARMOR or HEART
+KINDS = {
+    START: "start",
+    MOVE: "move",
+    ATTACK: "attack",
+    ENEMY: "enemy",
+    HORDE: "horde",
+    TAKE: "take",
+    HEAL: "heal",
+    SAVE: "save",
+    END: "end",
+    LOOT: "loot",
+    }
+KIND_IDS = dict((name, kind) for kind, name in KINDS.items())
+
+# flags
+KILLED = 1
+DEFENDED = 1
+LUCKY_DODGE = 2
+DAGGER_DODGE = 4
+SHIELD_DODGE = 8
+DIED = 16
+FROM_ENEMY = 1
+
+# TAKE's a, LOOT's flags, END's a
+KEY = 0
+WEAPON = 1
+ARMOR = 2
+HEART = 3
+WON = 0
+
+Event = namedtuple("Event", "session time command kind flags location a b c")
+
+# directory -> the last session number this process gave out there, so a replay of thousands of
+# sessions doesn't list the directory for every one
+_last_session = {}
+
+
+class JournalError(Exception):
+    pass
+
+
+def session_numbers(directory):
+    numbers = []
+    for name in os.listdir(directory):
+        if name.startswith("session-") and name.endswith(".mehj"):
+            try:
+                numbers.append(int(name[len("session-"):-len(".mehj")]))
+            except ValueError:
+                pass
+    return numbers
+
+
+class Journal:
+    def __init__(self, directory=JOURNAL_DIR, flush_interval=FLUSH_INTERVAL, fsync_interval=FSYNC_INTERVAL):
+        os.makedirs(directory, exist_ok=True)
+        if directory in _last_session:
+            self.session = _last_session[directory] + 1
+        else:
+            self.session = max(session_numbers(directory) or [0]) + 1
+        # Another game may have taken the number in the meantime, "x" makes sure no file is shared
+        while True:
+            self.path = os.path.join(directory, SESSION_FILE.format(self.session))
+            try:
+                self.file = open(self.path, "xb", buffering=0)
+                break
+            except FileExistsError:
+                self.session += 1
+        _last_session[directory] = self.session
+        self.started = time.time()
+        self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, self.session, self.started))
+        self.buffer = bytearray(RECORD.size * BUFFER_RECORDS)
+        self.used = 0
+        self.command = 0
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.last_flush = time.monotonic()
+        self.last_sync = self.last_flush
+        self.events = 0
+        self.writes = 0
+        self.syncs = 0
+        self.bytes_written = HEADER.size
+
+    def event(self, kind, location, a=0, b=0, c=0, flags=0):
+        RECORD.pack_into(self.buffer, self.used, time.time(), self.command, kind, flags, location, a, b, c)
+        self.used += RECORD.size
+        self.events += 1
+        if self.used == len(self.buffer):
+            self.flush()
+
+    def begin_command(self):
+        self.command += 1
+
+    def end_command(self):
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self, sync=False):
+        if self.used:
+            self.file.write(memoryview(self.buffer)[:self.used])
+            self.bytes_written += self.used
+            self.writes += 1
+            self.used = 0
+        now = time.monotonic()
+        self.last_flush = now
+        if sync or now - self.last_sync >= self.fsync_interval:
+            os.fsync(self.file.fileno())
+            self.syncs += 1
+            self.last_sync = now
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush(sync=True)
+        self.file.close()
+
+
+def journal_files(paths):
+    # Every journal file in paths, directories in session order
+    for path in paths:
+        if os.path.isdir(path):
+            for number in sorted(session_numbers(path)):
+                yield os.path.join(path, SESSION_FILE.format(number))
+        else:
+            yield path
+
+
+def read_events(paths, kinds=None, sessions=None):
+    # Yields the Events in the journal files and directories in paths, a file at a time and
+    # CHUNK_RECORDS records at a time. kinds and sessions are optional sets to keep only those; a
+    # session that isn't wanted is skipped on its header alone.
+    if isinstance(paths, str):
+        paths = [paths]
+    for path in journal_files(paths):
+        with open(path, "rb") as _rf:
+            header = _rf.read(HEADER.size)
+            if len(header) < HEADER.size:
+                continue
+            magic, version, record_size, session, started = HEADER.unpack(header)
+            if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+                raise JournalError("{0} isn't a version {1} journal".format(path, VERSION))
+            if sessions is not None and session not in sessions:
+                continue
+            while True:
+                chunk = _rf.read(RECORD.size * CHUNK_RECORDS)
+                if not chunk:
+                    break
+                # Only the last chunk of a file can end in a partial record
+                whole = len(chunk) - len(chunk) % RECORD.size
+                for record in RECORD.iter_unpack(memoryview(chunk)[:whole]):
+                    if kinds is None or record[2] in kinds:
+                        yield Event(session, *record)
+
+
+def describe(event):
+    kind = event.kind
+    text = "session {0:4} command {1:5} room {2:4}  {3:6}".format(
+        event.session, event.command, event.location, KINDS.get(kind, kind))
+    if kind == START:
+        return text + " {0} rooms, hero health {1}, seed {2}".format(event.a, event.b, event.c)
+    if kind == MOVE:
+        return text + " from room {0}".format(event.a)
+    if kind == ATTACK:
+        return text + " enemy {0} took {1}, health {2}{3}".format(
+            event.a, event.b, event.c, " (killed)" if event.flags & KILLED else "")
+    if kind == ENEMY:
+        if event.flags & DEFENDED:
+            return text + " enemy {0} held back".format(event.a)
+        if event.b < 0:
+            return text + " you dodged enemy {0}, hero health {1}".format(event.a, event.c)
+        return text + " enemy {0} hit for {1}, hero health {2}{3}".format(
+            event.a, event.b, event.c, " (died)" if event.flags & DIED else "")
+    if kind == HORDE:
+        return text + " {0} acted, {1} hits for {2}{3}".format(
+            event.a, event.b, event.c, " (died)" if event.flags & DIED else "")
+    if kind == TAKE:
+        return text + " {0} {1} worth {2}{3}".format(
+            ("key", "weapon", "armor", "heart")[event.a], event.b, event.c, " from an enemy" if event.flags & FROM_ENEMY else "")
+    if kind == LOOT:
+        return text + " enemy {0} dropped {1} {2} worth {3}".format(
+            event.a, ("key", "weapon", "armor", "heart")[event.flags], event.b, event.c)
+    if kind == HEAL:
+        return text + " hero health {0}".format(event.b)
+    if kind == END:
+        return text + " " + ("won" if event.a == WON else "died")
+    return text
+
+
+def summarize(events):
+    # Counts per kind and per session in constant memory, however many events there are
+    kinds = {}
+    sessions = set()
+    count = 0
+    for event in events:
+        count += 1
+        kinds[event.kind] = kinds.get(event.kind, 0) + 1
+        sessions.add(event.session)
+    return count, kinds, sessions
+
+
+def bench(events=5000000):
+    # 1. Writing while playing: balance.py's fighter policy plays seeded games, journal off and on.
+    # 2. Writing events as fast as Journal.event() takes them.
+    # 3. Reading them all back, then only one kind, then only one session.
+    import tempfile
+
+    import OOP_Game_lab
+    import balance
+    import dice
+    import utils
+    from lazy_dungeon import memory
+
+    def play(directory, commands=50000):
+        # (seconds per command, seconds to open and close a session's journal, events logged, sessions)
+        seed = 0
+        played = 0
+        logged = 0
+        playing = 0.0
+        opening = 0.0
+        while played < commands:
+            world = OOP_Game_lab.scenario("bench", hero_file=None, rng=dice.GameRng(seed, block=balance.DICE_BLOCK))
+            start = time.perf_counter()
+            journal = None if directory is None else Journal(directory)
+            opened = time.perf_counter()
+            session = OOP_Game_lab.GameSession(world, say=utils.quiet, journal=journal)
+            while session.over is None and played < commands:
+                session.handle(balance.next_command(session, "fighter", 40))
+                played += 1
+            finished = time.perf_counter()
+            if journal is not None:
+                journal.close()
+                logged += journal.events
+            opening += opened - start + time.perf_counter() - finished
+            playing += finished - opened
+            seed += 1
+        return playing / played, opening / seed, logged, seed
+
+    with tempfile.TemporaryDirectory() as scratch:
+        # Best of five, alternating, the machine is noisy
+        off = None
+        on = None
+        for attempt in range(5):
+            result = play(None)
+            if off is None or result[0] < off[0]:
+                off = result
+            result = play(os.path.join(scratch, "play{0}".format(attempt)))
+            if on is None or result[0] < on[0]:
+                on = result
+        print(" [-] playing: journal off {0:.2f} us/command, on {1:.2f} us/command ({2:+.1%}), {3:,} events in {4:,} sessions".format(
+            1e6 * off[0], 1e6 * on[0], on[0] / off[0] - 1, on[2], on[3]))
+        print(" [-]          and {0:.2f} ms per session to create its file and fsync it at the end".format(1000 * on[1]))
+
+        # A big journal set: 100 sessions of the same size
+        directory = os.path.join(scratch, "big")
+        per_session = max(events // 100, 1)
+        start = time.perf_counter()
+        syncs = 0
+        for number in range(100):
+            journal = Journal(directory)
+            for index in range(per_session):
+                if index % 4 == 0:
+                    journal.begin_command()
+                journal.event(ATTACK if index % 3 else ENEMY, index % 6, 1, index % 40, 100 - index % 100)
+            journal.close()
+            syncs += journal.syncs
+        elapsed = time.perf_counter() - start
+        written = 100 * per_session
+        size = sum(os.path.getsize(path) for path in journal_files([directory]))
+        print(" [-] writing: {0:,} events in {1:.2f}s, {2:,.0f} events/s, {3:.1f} MB/s, {4} fsyncs".format(
+            written, elapsed, written / elapsed, size / elapsed / 2**20, syncs))
+
+        before = memory()
+        for label, kinds, sessions in (("reading everything", None, None), ("only 'enemy' events", set([ENEMY]), None),
+                                       ("only session 50", None, set([50]))):
+            start = time.perf_counter()
+            count = 0
+            for event in read_events(directory, kinds, sessions):
+                count += 1
+            elapsed = time.perf_counter() - start
+            now = memory()
+            print(" [-] {0:20} {1:>10,} events in {2:5.2f}s  {3:>12,.0f} events/s  ({4:.0f} MB of journals){5}".format(
+                label, count, elapsed, written / elapsed, size / 2**20,
+                "  RSS +{0:.1f} MB".format((now - before) / 2**20) if now and before else ""))
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args and args[0] == "bench":
+        bench(int(args[1]) if len(args) > 1 else 5000000)
+        exit(0)
+    kinds = None
+    sessions = None
+    show = "--show" in args
+    if show:
+        args.remove("--show")
+    if "--kind" in args:
+        index = args.index("--kind")
+        names = args.pop(index + 1).split(",")
+        args.remove("--kind")
+        for name in names:
+            if name not in KIND_IDS:
+                print("[!] Unknown event kind {0}, pick from: {1}".format(name, ", ".join(KIND_IDS)))
+                exit(-1)
+        kinds = set(KIND_IDS[name] for name in names)
+    while "--session" in args:
+        index = args.index("--session")
+        sessions = (sessions or set()) | set([int(args.pop(index + 1))])
+        args.remove("--session")
+    events = read_events(args or [JOURNAL_DIR], kinds, sessions)
+    try:
+        if show:
+            for event in events:
+                print(describe(event))
+        else:
+            count, per_kind, seen = summarize(events)
+            print(" [-] {0:,} events in {1:,} sessions".format(count, len(seen)))
+            for kind, kind_count in sorted(per_kind.items()):
+                print(" [-] {0:8} {1:>12,}".format(KINDS.get(kind, kind), kind_count))
+    except (OSError, JournalError) as ex:
+        print("[!] Couldn't read the journal: {0}".format(ex))
+        exit(-1)
@@ -0,0 +1,264 @@
+#!/usr/bin/python3
+
+# Dungeons of any length that only keep a few rooms in memory. A LazyDungeon is a list-like
+# scenario.dungeon (like savegame.SavedDungeon) whose rooms are made on first entry with
+# utils.produce_room_template() and a dice.GameRng seeded from the dungeon's seed and the room's
+# location, so room n is always the same room no matter the order rooms are visited in.
+#
+# At most budget rooms stay in memory, the least recently entered one goes when another comes in.
+# A room that changed since it was made or loaded (an enemy hurt, treasure taken, a weapon stolen)
+# is written to a RoomStore on its way out and read back from there the next time; an unchanged room
+# is simply made again from its seed. The store is a scratch file of fixed-size slots, one per
+# location, with a bitmap in memory saying which slots hold a room. A room too big for a slot (the
+# horde of 'OOP_Game_lab.py --rooms N --horde M') is pinned instead: it stays in memory for good,
+# outside the budget.
+#
+# The layout follows the stock six rooms: location 0 holds a lone final boss, location 1 the boss key
+# and its guards, the last location is behind the boss battle door, and the rooms in between are the
+# ordinary ones. With 6 rooms the rooms are the ones instantiateWorld() makes (from other dice).
+#
+# The game keeps SaveGame.bin saves for stock dungeons only; 'OOP_Game_lab.py --rooms N' plays a lazy
+# dungeon with saving turned off.
+#
+#   python lazy_dungeon.py [rooms] [budget]    walk a dungeon, room entry latency and memory
+
+import collections
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+
+import dice
+import dungeon_gen
+import loot
+import savegame
+import utils
+
+BUDGET = 64
+# Rooms draw a handful of numbers each, see dice.GameRng
+ROOM_DICE_BLOCK = 4
+
+# Slot: room number, enemy count, treasure count, then MAX_ENEMIES savegame.ENEMY and MAX_TREASURE
+# savegame.TREASURE records
+MAX_ENEMIES = 2
+MAX_TREASURE = loot.MAX_ROOM_TREASURE
+SLOT_HEADER = struct.Struct("<iBB")
+SLOT_SIZE = SLOT_HEADER.size + MAX_ENEMIES * savegame.ENEMY.size + MAX_TREASURE * savegame.TREASURE.size
+
+
+def room_template(location, rooms):
+    # The produce_room_template() room number that makes the room at location
+    if location == 0:
+        return 5
+    if location == 1:
+        return 4
+    return min(rooms - 1 - location, 3)
+
+
+def fits(room):
+    # Whether room fits a store slot, a horde (see horde.py) doesn't
+    return len(room["enemies"]) <= MAX_ENEMIES and len(room["treasure"]) <= MAX_TREASURE
+
+
+def pack_room(room):
+    if not fits(room):
+        raise ValueError("room {0} doesn't fit a store slot".format(room["room_number"]))
+    parts = [SLOT_HEADER.pack(room["room_number"], len(room["enemies"]), len(room["treasure"]))]
+    for enemy in room["enemies"]:
+        parts.append(savegame.ENEMY.pack(enemy.health, enemy.final_boss, enemy.weapon1_id, enemy.weapon1_damage,
+                                         enemy.weapon2_id, enemy.weapon2_damage, enemy.armor_id, enemy.armor_value))
+    for item in room["treasure"]:
+        parts.append(savegame.TREASURE.pack(*dungeon_gen.treasure_record(item)))
+    return b"".join(parts)
+
+
+def unpack_room(data):
+    room_number, enemy_count, treasure_count = SLOT_HEADER.unpack_from(data, 0)
+    room = {
+        "room_number": room_number,
+        "enemies": [],
+        "treasure": [],
+        "details": [],
+        }
+    offset = SLOT_HEADER.size
+    for __ in range(enemy_count):
+        health, final_boss, weapon1_id, weapon1_damage, weapon2_id, weapon2_damage, armor_id, armor_value = savegame.ENEMY.unpack_from(data, offset)
+        room["enemies"].append(utils.Enemy.from_record(health, weapon1_id, weapon1_damage, weapon2_id, weapon2_damage,
+                                                      armor_id, armor_value, final_boss=final_boss))
+        offset += savegame.ENEMY.size
+    for __ in range(treasure_count):
+        room["treasure"].append(dungeon_gen.treasure_item(*savegame.TREASURE.unpack_from(data, offset)))
+        offset += savegame.TREASURE.size
+    return room
+
+
+class RoomStore:
+    # Fixed-size slots in a scratch file, slot n at n * SLOT_SIZE. The file is sparse where nothing was
+    # written and goes away when the store is closed.
+    def __init__(self, rooms, directory=None):
+        self.rooms = rooms
+        self.bitmap = bytearray((rooms + 7) // 8)
+        self.file = tempfile.TemporaryFile(prefix="meh-rooms-", dir=directory)
+        self.stored = 0
+        self.writes = 0
+        self.reads = 0
+
+    def __contains__(self, location):
+        return self.bitmap[location >> 3] & (1 << (location & 7)) != 0
+
+    def write(self, location, data):
+        self.file.seek(location * SLOT_SIZE)
+        self.file.write(data)
+        if location not in self:
+            self.bitmap[location >> 3] |= 1 << (location & 7)
+            self.stored += 1
+        self.writes += 1
+
+    def read(self, location):
+        self.file.seek(location * SLOT_SIZE)
+        self.reads += 1
+        return self.file.read(SLOT_SIZE)
+
+    def close(self):
+        self.file.close()
+
+
+class LazyDungeon:
+    def __init__(self, rooms, seed=None, budget=BUDGET, directory=None):
+        # budget is how many rooms stay in memory. The game holds on to the room the hero is in and
+        # looks at the last one, so it has to be at least 2.
+        if rooms < 3:
+            raise ValueError("a dungeon needs at least 3 rooms")
+        if budget < 2:
+            raise ValueError("the room budget has to be at least 2")
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.count = rooms
+        self.seed = seed
+        self.budget = budget
+        # location -> (room, the room packed when it came in), least recently entered first
+        self.resident = collections.OrderedDict()
+        # location -> room, for rooms that don't fit a store slot
+        self.pinned = {}
+        self.store = RoomStore(rooms, directory)
+        self.generated = 0
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, location):
+        if location < 0:
+            location += self.count
+        if location < 0 or location >= self.count:
+            raise IndexError("dungeon location out of range")
+        room = self.pinned.get(location)
+        if room is not None:
+            return room
+        entry = self.resident.get(location)
+        if entry is not None:
+            self.resident.move_to_end(location)
+            return entry[0]
+        if location in self.store:
+            data = self.store.read(location)
+            room = unpack_room(data)
+        else:
+            room = self.make_room(location)
+            data = pack_room(room)
+        self.resident[location] = (room, data)
+        if len(self.resident) > self.budget:
+            self.evict()
+        return room
+
+    def __iter__(self):
+        for location in range(self.count):
+            yield self[location]
+
+    def make_room(self, location):
+        rng = dice.GameRng((self.seed << 32) + location, block=ROOM_DICE_BLOCK)
+        room = utils.produce_room_template(room_template(location, self.count), rng)
+        room["room_number"] = self.count - 1 - location
+        self.generated += 1
+        return room
+
+    def evict(self):
+        location, (room, data) = self.resident.popitem(last=False)
+        if not fits(room):
+            self.pinned[location] = room
+            return
+        packed = pack_room(room)
+        if packed != data:
+            self.store.write(location, packed)
+
+    def close(self):
+        self.store.close()
+
+
+def memory():
+    # Resident memory of this process in bytes, None where /proc isn't available (see server.py)
+    try:
+        with open("/proc/self/statm") as _rf:
+            return int(_rf.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def bench(rooms=1000000, budget=BUDGET):
+    # Walks the whole dungeon through OOP_Game_lab.GameSession the way a player would: grab the key,
+    # then clear every room (the enemies are struck down outright) and move forward. Then walks back
+    # a stretch to time rooms coming back from the store.
+    # Latencies go in histograms, a list of a million of them would show up in the memory numbers
+    from OOP_Game_lab import GameSession, scenario
+    from instrument import Histogram
+
+    def report(label, latencies):
+        latency = latencies.summary()
+        print(" [-] {0:28} mean {1:6.1f} us   p50 {2:6.0f} us   p99 {3:6.0f} us   max {4:8.1f} us".format(
+            label, latency["mean_us"], latency["p50_us"], latency["p99_us"], latency["max_us"]))
+
+    before = memory()
+    dungeon = LazyDungeon(rooms, seed=1, budget=budget)
+    world = scenario("bench", dungeon=dungeon, hero_file=None, seed=1)
+    session = GameSession(world, say=utils.quiet)
+    session.handle("take treasure key")
+    checkpoints = set([rooms // 100, rooms // 10, rooms // 2, rooms - 1])
+    latencies = Histogram()
+    start = time.perf_counter()
+    while session.location < rooms - 1:
+        for enemy in session.enemies:
+            health_before = enemy.health
+            enemy.health = 0
+            session.state.damaged(enemy, health_before)
+        entered = time.perf_counter()
+        session.handle("move forward")
+        latencies.add(time.perf_counter() - entered)
+        if session.location in checkpoints:
+            now = memory()
+            print(" [-] room {0:>9,}   {1:8,.0f} rooms/s   resident {2:3}   stored {3:>9,}   {4}".format(
+                session.location, session.location / (time.perf_counter() - start), len(dungeon.resident),
+                dungeon.store.stored, "RSS {0:.1f} MB (+{1:.1f} MB)".format(now / 2**20, (now - before) / 2**20) if now else ""))
+    report("entering new rooms", latencies)
+
+    latencies = Histogram()
+    for __ in range(min(10000, rooms - 2)):
+        entered = time.perf_counter()
+        session.handle("move back")
+        latencies.add(time.perf_counter() - entered)
+    report("moving back (from the store)", latencies)
+    print(" [-] {0:,} rooms made, {1:,} slot writes, {2:,} slot reads, store file {3:.1f} MB of which {4:.1f} MB used".format(
+        dungeon.generated, dungeon.store.writes, dungeon.store.reads,
+        os.fstat(dungeon.store.file.fileno()).st_size / 2**20, dungeon.store.stored * SLOT_SIZE / 2**20))
+
+    # The same rooms kept the way instantiateWorld() keeps them, a list of every room
+    eager_rooms = min(rooms, 100000)
+    before = memory()
+    eager = [dungeon.make_room(location) for location in range(eager_rooms)]
+    now = memory()
+    if now and before:
+        print(" [-] for scale: {0:,} rooms in a list take {1:.1f} MB".format(len(eager), (now - before) / 2**20))
+    dungeon.close()
+
+
+if __name__ == "__main__":
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000, int(sys.argv[2]) if len(sys.argv) > 2 else BUDGET)
@@ -0,0 +1,407 @@
+#!/usr/bin/python3
+
+# Loot: what a room's chest holds and what an enemy drops when it dies, drawn from weighted loot
+# tables. Every room tier has a "chest" table (rooms that have a chest) and a "drop" table, and an
+# entry is a classic treasure list ([weapon or armor name, value], ["heart", value]) or None for
+# "nothing". room_tier() says which tier a room is.
+#
+# A LootTable draws with the alias method (Vose), so a draw is two uniform numbers and two list
+# lookups however many entries the table has. The entries are split into blocks of BLOCK_SIZE with an
+# alias table each, and a small alias table over the blocks' total weights picks the block. Changing
+# one entry's weight (set_weight()) rebuilds its block and the table over the blocks, not the whole
+# table. draws() takes many at once, for a room full of enemies dying or dungeon_gen.py filling
+# thousands of chests.
+#
+# The built-in tables come from the item catalog: the common chest keeps get_treasure()'s old odds
+# (1/6 a weapon, 1/6 armor, 4/6 a heart worth 5-50), common enemies drop something one time in four
+# and the boss tier (the rooms of the final boss and his guards) drops more often and favours the
+# better items. When LOOT_FILE exists next to the game the tables are read from it instead:
+#   {"common": {"chest": [["short_sword", 15, 1.0], ["heart", 20, 0.5], ["nothing", 0, 3.0]], "drop": [...]}, "boss": {...}}
+# with [name, value, weight] entries. The game draws loot from the scenario's GameRng, so a seed still
+# plays the same game.
+#
+#   python loot.py            draws per second for tables of 100 to 100,000 entries, and weight changes
+#   python loot.py check      chi-square tests of sampled draws against the weights
+
+import json
+import math
+import os
+import sys
+import time
+
+import catalog
+import dice
+
+LOOT_FILE = "loot.json"
+BLOCK_SIZE = 256
+# Treasure a room can hold at once (a chest or the boss key and a drop from each of two enemies),
+# drops past it are lost. lazy_dungeon.py's store slots are this big.
+MAX_ROOM_TREASURE = 3
+
+CHEST = "chest"
+DROP = "drop"
+COMMON = "common"
+BOSS = "boss"
+TIERS = (COMMON, BOSS)
+NOTHING = "nothing"
+HEART = "heart"
+HEARTS = range(5, 51)
+
+
+class LootError(Exception):
+    pass
+
+
+def build_alias(weights):
+    # Vose's alias method: (prob, alias) so that entry i is drawn by picking a column c uniformly
+    # and keeping it with probability prob[c], taking alias[c] otherwise
+    count = len(weights)
+    total = float(sum(weights))
+    prob = [1.0] * count
+    alias = list(range(count))
+    if total <= 0:
+        return prob, alias
+    scaled = [weight * count / total for weight in weights]
+    small = [index for index, value in enumerate(scaled) if value < 1.0]
+    large = [index for index, value in enumerate(scaled) if value >= 1.0]
+    while small and large:
+        less = small.pop()
+        more = large[-1]
+        prob[less] = scaled[less]
+        alias[less] = more
+        scaled[more] = scaled[more] + scaled[less] - 1.0
+        if scaled[more] < 1.0:
+            small.append(large.pop())
+    # Whatever is left is 1 give or take rounding
+    return prob, alias
+
+
+def alias_odds(prob, alias):
+    # The distribution an alias table actually draws, for check()
+    count = len(prob)
+    odds = [value / count for value in prob]
+    for column, value in enumerate(prob):
+        odds[alias[column]] += (1.0 - value) / count
+    return odds
+
+
+class LootTable:
+    def __init__(self, entries, weights, block_size=BLOCK_SIZE):
+        if len(entries) != len(weights) or not entries:
+            raise LootError("a loot table needs one weight per entry and at least one entry")
+        self.entries = list(entries)
+        self.weights = [float(weight) for weight in weights]
+        self.block_size = block_size
+        self.rebuild()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def rebuild(self):
+        # Every block from scratch
+        size = self.block_size
+        self.blocks = []
+        self.totals = []
+        for first in range(0, len(self.weights), size):
+            weights = self.weights[first:first + size]
+            self.blocks.append(build_alias(weights))
+            self.totals.append(math.fsum(weights))
+        self.rebuild_top()
+
+    def rebuild_top(self):
+        self.total = math.fsum(self.totals)
+        if self.total <= 0:
+            raise LootError("a loot table needs an entry with a weight above 0")
+        self.top = build_alias(self.totals)
+
+    def set_weight(self, index, weight):
+        # Only index's block and the table over the blocks are built again
+        if weight < 0:
+            raise LootError("loot weights can't be negative")
+        self.weights[index] = float(weight)
+        block = index // self.block_size
+        first = block * self.block_size
+        weights = self.weights[first:first + self.block_size]
+        self.blocks[block] = build_alias(weights)
+        self.totals[block] = math.fsum(weights)
+        self.rebuild_top()
+
+    def odds(self, index):
+        return self.weights[index] / self.total
+
+    def pick(self, first, second):
+        # The entry index for two uniform numbers in [0, 1)
+        prob, alias = self.top
+        column = first * len(prob)
+        block = int(column)
+        if column - block >= prob[block]:
+            block = alias[block]
+        prob, alias = self.blocks[block]
+        column = second * len(prob)
+        index = int(column)
+        if column - index >= prob[index]:
+            index = alias[index]
+        return block * self.block_size + index
+
+    def draw(self, rng=None):
+        # One entry, None for nothing. Item lists are copies, the room gets its own.
+        if rng is None:
+            rng = dice.default_rng
+        entry = self.entries[self.pick(rng.uniform(), rng.uniform())]
+        if entry is None:
+            return None
+        return list(entry)
+
+    def draws(self, count, rng=None):
+        # count entries in one go, pick() written out in the loop
+        if rng is None:
+            rng = dice.default_rng
+        numbers = rng.uniforms(2 * count)
+        entries = self.entries
+        size = self.block_size
+        blocks = self.blocks
+        top_prob, top_alias = self.top
+        columns = len(top_prob)
+        drawn = []
+        append = drawn.append
+        for index in range(0, 2 * count, 2):
+            column = numbers[index] * columns
+            block = int(column)
+            if column - block >= top_prob[block]:
+                block = top_alias[block]
+            prob, alias = blocks[block]
+            column = numbers[index + 1] * len(prob)
+            entry = int(column)
+            if column - entry >= prob[entry]:
+                entry = alias[entry]
+            entry = entries[block * size + entry]
+            append(None if entry is None else list(entry))
+        return drawn
+
+
+def item_entries(items, share):
+    # share of the weight spread evenly over items
+    return [([item.name, item.value], share / len(items)) for item in items]
+
+
+def valued_entries(items, share):
+    # share of the weight spread over items by value, the better the likelier
+    total = float(sum(item.value for item in items))
+    return [([item.name, item.value], share * item.value / total) for item in items]
+
+
+def heart_entries(share):
+    return [([HEART, value], share / len(HEARTS)) for value in HEARTS]
+
+
+def table(parts):
+    entries = []
+    weights = []
+    for part in parts:
+        for entry, weight in part:
+            entries.append(entry)
+            weights.append(weight)
+    return LootTable(entries, weights)
+
+
+def built_in_tables(items=catalog.CATALOG):
+    weapons = items.items[catalog.WEAPON]
+    armor = items.items[catalog.ARMOR]
+    return {
+        COMMON: {
+            CHEST: table([item_entries(weapons, 1), item_entries(armor, 1), heart_entries(4)]),
+            DROP: table([[(None, 18)], item_entries(weapons, 1), item_entries(armor, 1), heart_entries(4)])
+            },
+        BOSS: {
+            CHEST: table([valued_entries(weapons, 2), valued_entries(armor, 2), heart_entries(2)]),
+            DROP: table([[(None, 3)], valued_entries(weapons, 2), valued_entries(armor, 2), heart_entries(2)])
+            }
+        }
+
+
+def load(path=LOOT_FILE, items=catalog.CATALOG):
+    # The tables in path, the built-in ones when there is no such file
+    if path is None or not os.path.exists(path):
+        return built_in_tables(items)
+    try:
+        with open(path) as _rf:
+            tiers = json.load(_rf)
+        tables = {}
+        for tier in TIERS:
+            tables[tier] = {}
+            for kind in (CHEST, DROP):
+                entries = []
+                weights = []
+                for name, value, weight in tiers[tier][kind]:
+                    if name == NOTHING:
+                        entries.append(None)
+                    elif name == HEART or items.find(name) is not None:
+                        entries.append([sys.intern(str(name)), int(value)])
+                    else:
+                        raise LootError("{0} isn't in the item catalog".format(name))
+                    weights.append(float(weight))
+                tables[tier][kind] = LootTable(entries, weights)
+        return tables
+    except (ValueError, TypeError, KeyError) as ex:
+        raise LootError("{0} is not a valid loot file: {1}".format(path, ex))
+
+
+LOOT = load()
+
+
+def room_tier(room):
+    # The final boss's room and his guards' are the boss tier, every other room is common
+    for enemy in room["enemies"]:
+        if enemy.final_boss:
+            return BOSS
+    return COMMON
+
+
+def chest(tier=COMMON, rng=None):
+    return LOOT[tier][CHEST].draw(rng)
+
+
+def drop(room, count=1, rng=None):
+    # Loot for count enemies of room dying, into the room's treasure as long as there's space.
+    # Returns what was dropped.
+    table = LOOT[room_tier(room)][DROP]
+    if count == 1:
+        drawn = [table.draw(rng)]
+    else:
+        drawn = table.draws(count, rng)
+    treasure = room["treasure"]
+    dropped = []
+    for item in drawn:
+        if item is not None and len(treasure) < MAX_ROOM_TREASURE:
+            treasure.append(item)
+            dropped.append(item)
+    return dropped
+
+
+def chi_square(counts, odds, draws):
+    # (statistic, degrees of freedom, p-value) of counts against odds. The p-value uses the
+    # Wilson-Hilferty normal approximation of the chi-square distribution.
+    statistic = 0.0
+    cells = 0
+    for count, p in zip(counts, odds):
+        if p > 0:
+            expected = p * draws
+            statistic += (count - expected) ** 2 / expected
+            cells += 1
+        elif count:
+            return float("inf"), cells, 0.0
+    freedom = max(cells - 1, 1)
+    z = ((statistic / freedom) ** (1.0 / 3) - (1 - 2.0 / (9 * freedom))) / math.sqrt(2.0 / (9 * freedom))
+    return statistic, freedom, 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def sample(loot, draws, rng, batch):
+    counts = [0] * len(loot)
+    pick = loot.pick
+    if batch:
+        numbers = rng.uniforms(2 * draws)
+        for index in range(0, 2 * draws, 2):
+            counts[pick(numbers[index], numbers[index + 1])] += 1
+    else:
+        for __ in range(draws):
+            counts[pick(rng.uniform(), rng.uniform())] += 1
+    return counts
+
+
+def random_table(entries, rng):
+    # Made up entries with weights from 0 to 1000 (a few of them 0)
+    weights = [rng.randint(0, 1000) for __ in range(entries)]
+    return LootTable([["heart", index] for index in range(entries)], weights)
+
+
+def check(draws=2000000, seed=1, p_limit=1e-4):
+    # Each table's draws against its weights, and the same after changing weights one at a time
+    rng = dice.GameRng(seed)
+    tests = []
+    for tier in TIERS:
+        for kind in (CHEST, DROP):
+            tests.append(("{0} {1}".format(tier, kind), LOOT[tier][kind], False))
+    tests.append(("5,000 made up entries", random_table(5000, rng), True))
+    changed = random_table(5000, rng)
+    for __ in range(500):
+        changed.set_weight(rng.randint(0, len(changed) - 1), rng.randint(0, 1000))
+    tests.append(("after 500 set_weight()", changed, True))
+
+    worst = 1.0
+    exact = True
+    for label, loot, batch in tests:
+        odds = [loot.odds(index) for index in range(len(loot))]
+        # The alias tables have to describe the weights exactly, then the dice have to follow them
+        top = alias_odds(*loot.top)
+        drawn = []
+        for block, (prob, alias) in enumerate(loot.blocks):
+            drawn.extend(top[block] * p for p in alias_odds(prob, alias))
+        error = max(abs(a - b) for a, b in zip(odds, drawn))
+        if error > 1e-9:
+            exact = False
+        counts = sample(loot, draws, rng, batch)
+        statistic, freedom, p = chi_square(counts, odds, draws)
+        worst = min(worst, p)
+        print(" [-] {0:24} {1:>6,} entries   chi-square {2:10.1f} on {3:>5,} df   p {4:.3f}   largest odds error {5:.1e}".format(
+            label, len(loot), statistic, freedom, p, error))
+    if not exact or worst < p_limit:
+        print("[!] The draws don't follow the weights")
+        exit(-1)
+    print(" [-] The draws follow the weights (smallest p {0:.3f})".format(worst))
+
+
+def bench(draws=1000000):
+    # Draws per second for growing tables, one at a time and in batches, against random.choices()
+    # with cumulative weights (a bisect per draw) and a walk down the weights
+    rng = dice.GameRng(1)
+    for entries in (100, 10000, 100000):
+        loot = random_table(entries, rng)
+        start = time.perf_counter()
+        for __ in range(draws):
+            loot.draw(rng)
+        single = draws / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for __ in range(draws // 1000):
+            loot.draws(1000, rng)
+        batch = draws / (time.perf_counter() - start)
+
+        cum_weights = []
+        total = 0.0
+        for weight in loot.weights:
+            total += weight
+            cum_weights.append(total)
+        start = time.perf_counter()
+        rng.random.choices(loot.entries, cum_weights=cum_weights, k=draws)
+        bisect = draws / (time.perf_counter() - start)
+
+        walks = max(draws // entries, 100)
+        start = time.perf_counter()
+        for __ in range(walks):
+            left = rng.uniform() * total
+            for index, weight in enumerate(loot.weights):
+                left -= weight
+                if left < 0:
+                    break
+        walk = walks / (time.perf_counter() - start)
+
+        changes = 2000
+        start = time.perf_counter()
+        for __ in range(changes):
+            loot.set_weight(rng.randint(0, entries - 1), rng.randint(0, 1000))
+        incremental = (time.perf_counter() - start) / changes
+        start = time.perf_counter()
+        loot.rebuild()
+        full = time.perf_counter() - start
+
+        print(" [-] {0:>7,} entries   draw {1:10,.0f}/s   draws() {2:10,.0f}/s   random.choices {3:10,.0f}/s   walk {4:10,.0f}/s".format(
+            entries, single, batch, bisect, walk))
+        print(" [-] {0:>7}           set_weight() {1:8.1f} us   full rebuild {2:8.1f} us".format(
+            "", 1e6 * incremental, 1e6 * full))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "check":
+        check()
+    else:
+        bench()
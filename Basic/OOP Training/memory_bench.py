@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+
+# Bytes per enemy and per hero with the compact utils.Enemy/utils.Hero records against the old layout
+# (an object __dict__ holding a stats dict with a list of [name, damage] lists and an [name, value] list).
+#
+#   python memory_bench.py [enemies]
+
+import random
+import sys
+import tracemalloc
+
+import utils
+
+
+class LegacyEnemy:
+    # The layout utils.Enemy had before the records: same draws, nested dicts and lists
+    def __init__(self, final_boss=False):
+        self.final_boss = final_boss
+        self.stats = {
+            "health" : 100,
+            "weapons" : [utils.get_weapon() for __ in range(1 if random.randint(0,9) > 5 else 2)],
+            "armor" : utils.get_armor()
+            }
+        if self.final_boss == False and random.randint(0,20) >= 15:
+            self.stats["health"] = self.stats["health"] * 3
+            self.stats["armor"][1] = self.stats["armor"][1] + 5
+            for weapon in self.stats["weapons"]:
+                weapon[1] = weapon[1] * 2
+
+
+class LegacyHero:
+    def __init__(self, name):
+        self.name = name
+        self.hero_attribs = {
+            "name": name,
+            "health": 100,
+            "armor": utils.get_armor(),
+            "weapons": utils.get_weapon(),
+            "boss_key": False
+            }
+
+
+def compact_hero(name):
+    # utils.Hero without the HeroObject.json write
+    hero = utils.Hero.__new__(utils.Hero)
+    hero.name = name
+    hero.create_hero_json_object()
+    return hero
+
+
+def bytes_per_object(factory, count):
+    # Keep every object alive and divide the traced growth by the count
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [factory() for __ in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # the list holding them isn't part of the object's cost
+    return (after - before - sys.getsizeof(objects)) / len(objects)
+
+
+def main(count=100000):
+    legacy = bytes_per_object(LegacyEnemy, count)
+    compact = bytes_per_object(utils.Enemy, count)
+    print(" [-] Enemy  legacy: {0:8.1f} bytes   record: {1:8.1f} bytes   ({2:.1f}x smaller)".format(legacy, compact, legacy / compact))
+
+    legacy = bytes_per_object(lambda: LegacyHero("hero"), count)
+    compact = bytes_per_object(lambda: compact_hero("hero"), count)
+    print(" [-] Hero   legacy: {0:8.1f} bytes   record: {1:8.1f} bytes   ({2:.1f}x smaller)".format(legacy, compact, legacy / compact))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
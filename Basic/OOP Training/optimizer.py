@@ -0,0 +1,331 @@
+#!/usr/bin/python3
+
+# Tunes the game's numbers (tuning.py): weapon and armor values, hero and enemy health and the special
+# enemy rules, towards a target win rate and a target median of commands per room, and writes the
+# result to tuning.json where the game picks it up.
+#
+# The search starts from the numbers the game has now and goes a generation at a time: every
+# generation tries a few candidates, each the best numbers so far with one to three of them nudged,
+# and keeps the candidate closest to the targets. A candidate is judged on whole games played with
+# balance.py's policies, in shards of SHARD_SIZE games that a process pool plays, and every candidate
+# plays the same seeds so they're compared on the same dungeons. The candidates of a generation share
+# the pool a shard at a time, so after every shard a candidate can be dropped: once its win rate is
+# far enough from the targets that it couldn't beat the best numbers so far, the rest of its games
+# aren't played. Far enough means the near ends of confidence intervals for its win rate and its
+# median, at Z_STOP standard errors to allow for the many looks, still give a bigger loss.
+#
+# How close a candidate is, its loss, is
+#   ((win rate - target) / win tolerance)^2 + ((median commands per room - target) / turns tolerance)^2
+# where commands per room counts every command typed in a room, moving out of it included.
+#
+#   python optimizer.py [--win-rate 0.6] [--turns 10] [--generations 8] [--candidates 8] [--games 800]
+#                       [--policy careful] [--heal-below 40] [--seed N] [--processes N] [--no-early-stop]
+#                       [--out tuning.json]
+
+import math
+import multiprocessing
+import queue
+import random
+import sys
+import time
+
+import OOP_Game_lab
+import balance
+import dice
+import tuning
+import utils
+
+SHARD_SIZE = 100
+# The win rate interval a candidate is dropped on, about 3 in 1,000 per look of wrongly dropping one
+Z_STOP = 3.0
+WIN_TOLERANCE = 0.02
+TURNS_TOLERANCE = 0.5
+
+# What the search may try for each number, items go from ITEM_RANGE[slot][0] to ITEM_RANGE[slot][1]
+SEARCH_RANGE = {
+    "hero_health": (50, 250),
+    "enemy_health": (30, 250),
+    "special_roll": (10, 21),
+    "special_health": (1, 5),
+    "special_armor": (0, 15),
+    "special_damage": (1, 4)
+    }
+ITEM_RANGE = {"weapon": (1, 50), "armor": (0, 20)}
+
+# The numbers a worker process plays with now
+_applied = None
+
+
+def play_game(seed, policy, heal_below):
+    # (won, commands typed in each room the hero went into)
+    world = OOP_Game_lab.scenario("optimizer", hero_file=None, rng=dice.GameRng(seed, block=balance.DICE_BLOCK))
+    session = OOP_Game_lab.GameSession(world, say=utils.quiet)
+    turns = {}
+    commands = 0
+    while session.over is None and commands < balance.MAX_COMMANDS:
+        location = session.location
+        session.handle(balance.next_command(session, policy, heal_below))
+        turns[location] = turns.get(location, 0) + 1
+        commands += 1
+    return session.over == "won", turns.values()
+
+
+def play_shard(job):
+    # Games first .. first + count - 1 with params. Returns (games, won, {commands in a room: rooms}).
+    global _applied
+    params, first, count, seed, policy, heal_below = job
+    if params != _applied:
+        tuning.apply(params)
+        _applied = params
+    won = 0
+    histogram = {}
+    for game in range(first, first + count):
+        game_won, turns = play_game(seed + game, policy, heal_below)
+        won += game_won
+        for commands in turns:
+            histogram[commands] = histogram.get(commands, 0) + 1
+    return count, won, histogram
+
+
+def quantile(histogram, rank):
+    # The value with that rank (0 is the lowest) in the histogram's values
+    seen = 0
+    for value in sorted(histogram):
+        seen += histogram[value]
+        if seen > rank:
+            return value
+    return max(histogram) if histogram else 0
+
+
+def median(histogram):
+    return quantile(histogram, (sum(histogram.values()) - 1) // 2)
+
+
+def gap(low, high, target):
+    # How far target is from [low, high]
+    if target < low:
+        return low - target
+    if target > high:
+        return target - high
+    return 0
+
+
+def mutate(params, rng):
+    # A copy of params with one to three numbers or item values nudged by 5-30% (at least 1)
+    child = dict(params)
+    for slot in tuning.ITEM_SLOTS:
+        child[slot] = dict(params[slot])
+    keys = [(None, name) for name in SEARCH_RANGE]
+    for slot in tuning.ITEM_SLOTS:
+        keys.extend((slot, name) for name in params[slot])
+    for slot, name in rng.sample(keys, rng.randint(1, 3)):
+        values = child if slot is None else child[slot]
+        low, high = SEARCH_RANGE[name] if slot is None else ITEM_RANGE[slot]
+        value = values[name]
+        step = max(1, round(value * rng.uniform(0.05, 0.3)))
+        values[name] = min(high, max(low, value + rng.choice((-step, step))))
+    return child
+
+
+class Candidate:
+    def __init__(self, params):
+        self.params = params
+        self.games = 0
+        self.won = 0
+        self.histogram = {}
+        self.shards_done = 0
+        self.stopped = False
+
+    def add(self, result):
+        games, won, histogram = result
+        self.games += games
+        self.won += won
+        for value, rooms in histogram.items():
+            self.histogram[value] = self.histogram.get(value, 0) + rooms
+        self.shards_done += 1
+
+    def win_rate(self):
+        return self.won / self.games
+
+
+class Search:
+    def __init__(self, win_rate=0.6, turns=10, games=800, policy="careful", heal_below=40, seed=0,
+                 processes=None, early_stop=True, rng_seed=None):
+        self.win_rate = win_rate
+        self.turns = turns
+        self.games = games
+        self.policy = policy
+        self.heal_below = heal_below
+        self.seed = seed
+        self.processes = processes or multiprocessing.cpu_count()
+        self.early_stop = early_stop
+        self.rng = random.Random(rng_seed)
+        self.best = None
+        self.best_loss = float("inf")
+        # Totals over the whole search
+        self.candidates = 0
+        self.stopped = 0
+        self.played = 0
+        self.seconds = 0.0
+
+    def loss(self, candidate):
+        win_error = (candidate.win_rate() - self.win_rate) / WIN_TOLERANCE
+        turns_error = (median(candidate.histogram) - self.turns) / TURNS_TOLERANCE
+        return win_error * win_error + turns_error * turns_error
+
+    def hit(self, candidate):
+        return (abs(candidate.win_rate() - self.win_rate) <= WIN_TOLERANCE and
+                abs(median(candidate.histogram) - self.turns) <= TURNS_TOLERANCE)
+
+    def clearly_worse(self, candidate):
+        # True once the closest the candidate's win rate and median could really be to the targets
+        # still gives a bigger loss than the best so far
+        low, high = balance.wilson(candidate.won, candidate.games, Z_STOP)
+        win_gap = gap(low, high, self.win_rate) / WIN_TOLERANCE
+        # The median's interval comes from the ranks around the middle one. A game's rooms aren't
+        # independent, so the spread is taken as if every room of a game were the same one.
+        rooms = sum(candidate.histogram.values())
+        spread = Z_STOP * math.sqrt(rooms * rooms / candidate.games) / 2
+        low = quantile(candidate.histogram, max(0, int(rooms / 2 - spread)))
+        high = quantile(candidate.histogram, min(rooms - 1, int(rooms / 2 + spread)))
+        turns_gap = gap(low, high, self.turns) / TURNS_TOLERANCE
+        return win_gap * win_gap + turns_gap * turns_gap > self.best_loss
+
+    def evaluate(self, params_list, pool):
+        # Plays params_list's candidates side by side, lower shards first, and returns the Candidates.
+        # A stopped candidate's shards that are already in the pool still count as played.
+        candidates = [Candidate(params) for params in params_list]
+        jobs = []
+        for first in range(0, self.games, SHARD_SIZE):
+            for index, candidate in enumerate(candidates):
+                jobs.append((index, (candidate.params, first, min(SHARD_SIZE, self.games - first),
+                                     self.seed, self.policy, self.heal_below)))
+        jobs.reverse()
+        shards = len(jobs) // len(candidates)
+        done = queue.Queue()
+        in_flight = 0
+        # Enough shards in the pool to keep every process busy, and not many more, so a stopped
+        # candidate's shards mostly haven't gone out yet
+        most = 1 if pool is None else self.processes * 2
+        start = time.perf_counter()
+        while jobs or in_flight:
+            while jobs and in_flight < most:
+                index, job = jobs.pop()
+                if candidates[index].stopped:
+                    continue
+                if pool is None:
+                    done.put((index, play_shard(job)))
+                else:
+                    pool.apply_async(play_shard, (job,), callback=lambda result, index=index: done.put((index, result)),
+                                     error_callback=lambda ex: done.put((None, ex)))
+                in_flight += 1
+            if not in_flight:
+                break
+            index, result = done.get()
+            in_flight -= 1
+            if index is None:
+                raise result
+            candidate = candidates[index]
+            candidate.add(result)
+            self.played += result[0]
+            if candidate.stopped:
+                continue
+            if candidate.shards_done == shards:
+                loss = self.loss(candidate)
+                if loss < self.best_loss:
+                    self.best, self.best_loss = candidate, loss
+            elif self.early_stop and self.clearly_worse(candidate):
+                candidate.stopped = True
+                self.stopped += 1
+        self.seconds += time.perf_counter() - start
+        self.candidates += len(candidates)
+        return candidates
+
+    def run(self, start, generations, candidates, progress=True):
+        pool = None if self.processes == 1 else multiprocessing.Pool(self.processes)
+        try:
+            self.evaluate([start], pool)
+            if progress:
+                self.report_generation(0, 1, 0)
+            for generation in range(1, generations + 1):
+                if self.hit(self.best):
+                    break
+                stopped = self.stopped
+                self.evaluate([mutate(self.best.params, self.rng) for __ in range(candidates)], pool)
+                if progress:
+                    self.report_generation(generation, candidates, self.stopped - stopped)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        return self.best
+
+    def report_generation(self, generation, candidates, stopped):
+        best = self.best
+        low, high = balance.wilson(best.won, best.games)
+        print(" [-] generation {0:2}: {1:2} candidates, {2:2} stopped early   best loss {3:8.2f}  win rate {4:5.1%} [{5:5.1%}, {6:5.1%}]  median {7} commands/room".format(
+            generation, candidates, stopped, self.best_loss, best.win_rate(), low, high, median(best.histogram)))
+        sys.stdout.flush()
+
+    def report(self, start):
+        full = self.candidates * self.games
+        print(" [-] {0} candidates, {1:,} games in {2:.1f}s: {3:,.0f} games/s on {4} processes".format(
+            self.candidates, self.played, self.seconds, self.played / self.seconds, self.processes))
+        if self.early_stop:
+            print(" [-] early stopping dropped {0} of {1} candidates and played {2:,} of the {3:,} games a full look at every candidate takes, {4:.1%} less work".format(
+                self.stopped, self.candidates, self.played, full, 1 - self.played / full))
+        best = self.best
+        print(" [-] best: win rate {0:.1%} (target {1:.0%}), median {2} commands per room (target {3}){4}".format(
+            best.win_rate(), self.win_rate, median(best.histogram), self.turns,
+            "" if self.hit(best) else ", targets not reached"))
+        for name in SEARCH_RANGE:
+            if best.params[name] != start[name]:
+                print(" [-]   {0:16} {1:5} -> {2}".format(name, start[name], best.params[name]))
+        for slot in tuning.ITEM_SLOTS:
+            for name, value in best.params[slot].items():
+                if value != start[slot][name]:
+                    print(" [-]   {0:16} {1:5} -> {2}".format(name, start[slot][name], value))
+
+    def notes(self):
+        best = self.best
+        return {
+            "win_rate_target": self.win_rate,
+            "turns_target": self.turns,
+            "policy": self.policy,
+            "games": best.games,
+            "win_rate": round(best.win_rate(), 4),
+            "median_turns": median(best.histogram)
+            }
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    early_stop = "--no-early-stop" not in args
+    if not early_stop:
+        args.remove("--no-early-stop")
+    policy = utils.option(args, "--policy", "careful")
+    if policy not in balance.POLICIES:
+        print("[!] Unknown policy {0}, pick one of {1}".format(policy, ", ".join(balance.POLICIES)))
+        exit(-1)
+    processes = utils.option(args, "--processes", None)
+    seed = int(utils.option(args, "--seed", 0))
+    search = Search(win_rate=float(utils.option(args, "--win-rate", 0.6)),
+                    turns=float(utils.option(args, "--turns", 10)),
+                    games=int(utils.option(args, "--games", 800)),
+                    policy=policy,
+                    heal_below=int(utils.option(args, "--heal-below", 40)),
+                    seed=seed,
+                    processes=None if processes is None else int(processes),
+                    early_stop=early_stop,
+                    rng_seed=seed)
+    generations = int(utils.option(args, "--generations", 8))
+    candidates = int(utils.option(args, "--candidates", 8))
+    out = utils.option(args, "--out", tuning.TUNING_FILE)
+    if args:
+        print("[!] Unknown arguments: {0}".format(" ".join(args)))
+        exit(-1)
+    start = tuning.current()
+    search.run(start, generations, candidates)
+    search.report(start)
+    tuning.save(search.best.params, out, search.notes())
+    print(" [-] Wrote {0}".format(out))
@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+
+# Write-behind persistence for the hero. main() asks for a save after every enemy on every command;
+# HeroStore turns those requests into as few disk writes as possible:
+#   - dirty tracking: nothing is written when the hero's snapshot matches what's already on disk
+#   - write-behind: a background thread waits WRITE_DELAY seconds after the first request so a burst
+#     of requests becomes a single write
+#   - atomic replace: the JSON goes to a temp file next to the target and is os.replace()d over it,
+#     so a HUD never reads half a file
+#   - flush() writes anything pending right now, close() (also run at exit) flushes and stops the thread
+
+import atexit
+import json
+import os
+import threading
+import time
+
+WRITE_DELAY = 0.05
+REPLACE_RETRIES = 5
+
+
+def write_atomic(path, data):
+    # data is str for text files and bytes for binary ones (savegame.py)
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb" if isinstance(data, bytes) else "w") as _wf:
+        _wf.write(data)
+    # On Windows the replace fails while a reader has the target open, give it a moment
+    for attempt in range(REPLACE_RETRIES):
+        try:
+            os.replace(temp_path, path)
+            return len(data)
+        except PermissionError:
+            if attempt == REPLACE_RETRIES - 1:
+                raise
+            time.sleep(0.01)
+
+
+class HeroStore:
+    # hero must provide snapshot() (a cheap comparable value) and to_dict() (what goes in the file).
+    # path=None keeps the hero in memory only. background=False writes synchronously, still with
+    # dirty tracking and the atomic replace. on_write is called after every write that happened.
+    def __init__(self, hero, path, background=True, on_write=None):
+        self.hero = hero
+        self.path = path
+        self.background = background and path is not None
+        self.on_write = on_write
+        self.requested = 0
+        self.performed = 0
+        self.bytes_written = 0
+        self.write_seconds = 0.0
+        self._written = None
+        self._pending = False
+        self._closed = False
+        self._lock = threading.Condition()
+        self._thread = None
+
+    def counters(self):
+        return {
+            "requested": self.requested,
+            "performed": self.performed,
+            "bytes_written": self.bytes_written,
+            "write_seconds": self.write_seconds
+            }
+
+    def dirty(self):
+        return self.hero.snapshot() != self._written
+
+    def request(self):
+        # Ask for the hero to be saved. Returns without touching the disk when background is on.
+        with self._lock:
+            self.requested += 1
+            if self.path is None or self._pending or not self.dirty():
+                return
+            if not self.background or self._closed:
+                self._write_locked()
+                return
+            self._pending = True
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="HeroStore", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+            self._lock.notify()
+
+    def flush(self):
+        with self._lock:
+            self._pending = False
+            if self.path is not None and self.dirty():
+                self._write_locked()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._lock.notify()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+            # Closed now, exit doesn't have to do it again
+            atexit.unregister(self.close)
+        self.flush()
+
+    def _write_locked(self):
+        start = time.perf_counter()
+        snapshot = self.hero.snapshot()
+        data = json.dumps(self.hero.to_dict(), indent=4)
+        self.bytes_written += write_atomic(self.path, data)
+        self.write_seconds += time.perf_counter() - start
+        self.performed += 1
+        self._written = snapshot
+        if self.on_write is not None:
+            self.on_write()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._pending and not self._closed:
+                    self._lock.wait()
+                if self._closed:
+                    return
+            # Let the rest of the burst pile up, then write once
+            time.sleep(WRITE_DELAY)
+            with self._lock:
+                if self._pending:
+                    self._pending = False
+                    if self.dirty():
+                        self._write_locked()
@@ -0,0 +1,185 @@
+#!/usr/bin/python3
+
+# Replays recorded command streams through OOP_Game_lab.main() with no delays, screen clears, HUD
+# or files on disk, capturing what the game printed. A stream is one typed line per line of text,
+# starting with the hero's name and the enter at "When ready hit enter" (an empty line), exactly as
+# 'python OOP_Game_lab.py --record' writes it. A file can hold several sessions separated by "---".
+# A session whose first line is "#seed N" is played with that seed (see --seed on OOP_Game_lab.py),
+# --seed here overrides it for every session.
+#
+#   python replay.py <file or directory> ... [--repeat N] [--seed N] [--show] [--stats [file]] [--journal [dir]]
+#
+# --stats records every command with instrument.py, prints the report at the end and writes it to file
+# when one is given. --journal logs every session's events to a journal file of its own in dir (see
+# journal.py).
+
+import contextlib
+import io
+import os
+import sys
+import time
+
+import OOP_Game_lab
+import instrument
+import journal
+
+SESSION_SEPARATOR = "---"
+
+
+class ScriptedIO(OOP_Game_lab.TerminalIO):
+    hero_file = None
+    save_file = None
+
+    def __init__(self, commands):
+        OOP_Game_lab.TerminalIO.__init__(self)
+        self.commands = iter(commands)
+        self.count = 0
+
+    def input(self, prompt=''):
+        try:
+            command = next(self.commands)
+        except StopIteration:
+            raise EOFError
+        self.count += 1
+        # Echo like a terminal would so the transcript reads like a real session
+        print(prompt + command)
+        return command
+
+    def sleep(self, seconds):
+        pass
+
+    def clear(self):
+        pass
+
+    def launch_hud(self):
+        pass
+
+
+class Replay():
+    def __init__(self, output, commands, outcome):
+        self.output = output
+        self.commands = commands
+        self.outcome = outcome
+
+
+def session_seed(commands):
+    # (seed, commands) with a leading "#seed N" line taken off
+    if commands and commands[0].startswith(OOP_Game_lab.SEED_LINE):
+        return int(commands[0][len(OOP_Game_lab.SEED_LINE):]), commands[1:]
+    return None, commands
+
+
+def run_session(commands, seed=None, console_class=ScriptedIO, stats=None, journal_dir=None):
+    # Play one command stream to the end. outcome is "ended" when the stream ran out,
+    # "exit <code>" when the game quit (death, victory) and "crashed: <error>" when it blew up.
+    recorded_seed, commands = session_seed(commands)
+    if seed is None:
+        seed = recorded_seed
+    console = console_class(commands)
+    events = None
+    if journal_dir is not None:
+        events = journal.Journal(journal_dir)
+    buffer = io.StringIO()
+    with contextlib.redirect_stdout(buffer):
+        try:
+            OOP_Game_lab.main(console=console, seed=seed, stats=stats, events=events)
+            outcome = "ended"
+        except EOFError:
+            outcome = "ended"
+        except SystemExit as ex:
+            outcome = "exit {0}".format(ex.code)
+        except Exception as ex:
+            outcome = "crashed: {0!r}".format(ex)
+    return Replay(buffer.getvalue(), console.count, outcome)
+
+
+def read_sessions(path):
+    sessions = []
+    current = []
+    with open(path) as _rf:
+        for line in _rf:
+            line = line.rstrip("\n")
+            if line == SESSION_SEPARATOR:
+                sessions.append(current)
+                current = []
+            else:
+                current.append(line)
+    if current:
+        sessions.append(current)
+    return sessions
+
+
+def load_sessions(paths):
+    sessions = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(".txt"):
+                    sessions.extend(read_sessions(os.path.join(path, name)))
+        else:
+            sessions.extend(read_sessions(path))
+    return sessions
+
+
+def replay_all(sessions, repeat=1, show=False, seed=None, stats=None, journal_dir=None):
+    commands = 0
+    outcomes = {}
+    start = time.perf_counter()
+    for __ in range(repeat):
+        for session in sessions:
+            result = run_session(session, seed, stats=stats, journal_dir=journal_dir)
+            commands += result.commands
+            outcome = result.outcome.split(":")[0]
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            if show:
+                print(result.output)
+                print(" [-] {0}".format(result.outcome))
+    elapsed = time.perf_counter() - start
+    played = len(sessions) * repeat
+    print(" [-] {0} sessions, {1} commands in {2:.3f}s".format(played, commands, elapsed))
+    print(" [-] {0:,.0f} commands/s, {1:,.0f} sessions/min".format(commands / elapsed, 60 * played / elapsed))
+    print(" [-] outcomes: {0}".format(outcomes))
+    if stats is not None:
+        instrument.print_report(stats.summary())
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    repeat = 1
+    seed = None
+    show = False
+    if "--repeat" in args:
+        index = args.index("--repeat")
+        repeat = int(args[index + 1])
+        del args[index:index + 2]
+    if "--seed" in args:
+        index = args.index("--seed")
+        seed = int(args[index + 1])
+        del args[index:index + 2]
+    if "--show" in args:
+        show = True
+        args.remove("--show")
+    stats = None
+    if "--stats" in args:
+        index = args.index("--stats")
+        path = None
+        # The next argument is the stats file unless it's another flag, like startup.py reads it
+        if index + 1 < len(args) and not args[index + 1].startswith("--"):
+            path = args.pop(index + 1)
+        args.remove("--stats")
+        stats = instrument.Stats(path)
+    journal_dir = None
+    if "--journal" in args:
+        index = args.index("--journal")
+        journal_dir = journal.JOURNAL_DIR
+        # The next argument is the journal directory when it's new or already holds journals, otherwise
+        # it's sessions to replay
+        if index + 1 < len(args) and not args[index + 1].startswith("--"):
+            path = args[index + 1]
+            if not os.path.exists(path) or (os.path.isdir(path) and journal.session_numbers(path)):
+                journal_dir = args.pop(index + 1)
+        args.remove("--journal")
+    if not args:
+        print("usage: python replay.py <file or directory> ... [--repeat N] [--seed N] [--show] [--stats [file]] [--journal [dir]]")
+        exit(-1)
+    replay_all(load_sessions(args), repeat, show, seed, stats, journal_dir)
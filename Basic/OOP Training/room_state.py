@@ -0,0 +1,131 @@
+#!/usr/bin/python3
+
+# What the game keeps asking about a room (are the enemies all dead? is there treasure? did anything
+# change?) kept up to date as things happen instead of scanning the room's enemies every time.
+# room_state.of(room) builds a room's RoomState the first time it is asked for, one pass over the
+# enemies, and keeps it in the room dict under STATE_KEY. From then on GameSession tells it about
+# every change it makes to the room:
+#   damaged()        the hero hit an enemy, which may have died
+#   weapon_taken()   the hero took an enemy's weapon
+#   armor_taken()    the hero took an enemy's armor
+#   treasure_taken() the room's treasure changed
+#   loot_dropped()   an enemy dropped loot into the room's treasure (see loot.py)
+# and alive, threat, treasure and dirty are plain attributes to read.
+#
+# Code that changes enemies behind GameSession's back has to call rebuild() afterwards.
+#
+#   python room_state.py     per-command cost as rooms grow, with every enemy alive and with one left,
+#                            and what a kill costs while a room is fought down to nothing
+
+import random
+import time
+
+STATE_KEY = "state"
+
+
+class RoomState:
+    # living:   the room's living enemies in room order (horde.horde_turn() only looks at these), as
+    #           the keys of a dict so a kill takes its enemy out without a search through the room
+    # alive:    len(living)
+    # threat:   the living enemies' weapon damage added up
+    # treasure: whether there's treasure to take
+    # dirty:    whether the game changed the room since this state was built
+    __slots__ = ("living", "threat", "treasure", "dirty")
+
+    def __init__(self, room):
+        self.rebuild(room)
+
+    def rebuild(self, room):
+        self.living = dict.fromkeys(enemy for enemy in room["enemies"] if enemy.health > 0)
+        self.threat = sum(enemy.attack_damage() for enemy in self.living)
+        self.treasure = len(room["treasure"]) > 0
+        self.dirty = False
+
+    @property
+    def alive(self):
+        return len(self.living)
+
+    def cleared(self):
+        return not self.living
+
+    def damaged(self, enemy, health_before):
+        self.dirty = True
+        if health_before > 0 and enemy.health <= 0:
+            del self.living[enemy]
+            self.threat -= enemy.attack_damage()
+
+    def weapon_taken(self, enemy, damage_before):
+        self.dirty = True
+        if enemy.health > 0:
+            self.threat += enemy.attack_damage() - damage_before
+
+    def armor_taken(self):
+        self.dirty = True
+
+    def treasure_taken(self, room):
+        self.dirty = True
+        self.treasure = len(room["treasure"]) > 0
+
+    def loot_dropped(self, room):
+        self.dirty = True
+        self.treasure = len(room["treasure"]) > 0
+
+
+def of(room):
+    state = room.get(STATE_KEY)
+    if state is None:
+        state = room[STATE_KEY] = RoomState(room)
+    return state
+
+
+def bench(sizes=(10, 1000, 100000)):
+    # Commands in a horde room (see horde.py) of each size, first with every enemy alive, then with
+    # only the last one left. With everyone alive the enemies' turn itself is the cost; with one left
+    # a command should cost the same whatever the size of the room.
+    import OOP_Game_lab
+    import horde
+    import utils
+
+    for size in sizes:
+        for alive in ("all", "one"):
+            world = OOP_Game_lab.scenario("bench", hero_file=None, seed=1)
+            enemies = horde.make_horde(size, world.rng)
+            if alive == "one":
+                for enemy in enemies[:-1]:
+                    enemy.health = 0
+            # The last enemy can't be killed so the room never clears
+            enemies[-1].health = 10 ** 9
+            world.dungeon[world.location]["enemies"] = enemies
+            session = OOP_Game_lab.GameSession(world, say=utils.quiet)
+            results = []
+            for command in ("chill", "look", "attack {0}".format(size)):
+                count = 0
+                start = time.perf_counter()
+                while count < 3 or time.perf_counter() - start < 0.3:
+                    world.hero.health = 10 ** 9
+                    session.handle(command)
+                    count += 1
+                results.append((time.perf_counter() - start) / count)
+            print(" [-] {0:>7,} enemies, {1:3} alive:   chill {2:9.1f} us   look {3:9.1f} us   attack {4:9.1f} us".format(
+                size, alive, 1e6 * results[0], 1e6 * results[1], 1e6 * results[2]))
+
+    # Every enemy of the room killed one at a time in no particular order, the state told about each
+    # kill the way do_attack() tells it. A kill should cost the same whatever the size of the room.
+    for size in sizes:
+        world = OOP_Game_lab.scenario("bench", hero_file=None, seed=1)
+        room = {"enemies": horde.make_horde(size, world.rng), "treasure": []}
+        state = of(room)
+        order = list(room["enemies"])
+        random.Random(1).shuffle(order)
+        start = time.perf_counter()
+        for enemy in order:
+            health_before = enemy.health
+            enemy.health = 0
+            state.damaged(enemy, health_before)
+        elapsed = time.perf_counter() - start
+        print(" [-] {0:>7,} enemies, all killed:  {1:9.2f} us per kill, cleared {2}".format(
+            size, 1e6 * elapsed / size, state.cleared()))
+
+
+if __name__ == "__main__":
+    bench()
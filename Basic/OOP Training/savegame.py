@@ -0,0 +1,225 @@
+#!/usr/bin/python3
+
+# Binary snapshots of a running scenario: the dungeon with every enemy and treasure, the hero,
+# the current location and whether the boss key was captured. All numbers are little-endian.
+#
+#   header      magic "MEHS", format version, room count, enemy count, treasure count
+#   world       location, boss key captured
+#   hero        name length + utf-8 name, health, armor id/value, weapon id/damage, boss key
+#   rooms       ROOM records:     room number, first enemy, enemy count, first treasure, treasure count
+#   enemies     ENEMY records:    health, final boss, weapon 1 id/damage, weapon 2 id/damage, armor id/value
+#   treasure    TREASURE records: kind, id, value (dungeon_gen.TREASURE_*)
+#
+# The tables are fixed-size records, so load_world() maps the file with mmap and only unpacks
+# a room's records the first time the game asks for that room.
+#
+#   python savegame.py [rooms]      size and save/load times for the stock dungeon and a large one
+
+import mmap
+import struct
+import sys
+import time
+
+import dungeon_gen
+import persistence
+import utils
+
+SAVE_FILE = "SaveGame.bin"
+MAGIC = b"MEHS"
+# Version 2: item ids are 16 bit so catalogs from items.json (catalog.py) can hold more than 127 items
+VERSION = 2
+
+HEADER = struct.Struct("<4sHIII")
+WORLD = struct.Struct("<I?")
+NAME_LENGTH = struct.Struct("<H")
+HERO = struct.Struct("<hhhhh?")
+ROOM = struct.Struct("<iIHIH")
+ENEMY = struct.Struct("<h?hhhhhh")
+TREASURE = struct.Struct("<bhh")
+
+
+class SaveError(Exception):
+    pass
+
+
+def pack_world(world):
+    rooms = []
+    enemies = []
+    treasure = []
+    for room in world.dungeon:
+        rooms.append(ROOM.pack(room["room_number"], len(enemies), len(room["enemies"]), len(treasure), len(room["treasure"])))
+        for enemy in room["enemies"]:
+            enemies.append(ENEMY.pack(enemy.health, enemy.final_boss, enemy.weapon1_id, enemy.weapon1_damage,
+                                      enemy.weapon2_id, enemy.weapon2_damage, enemy.armor_id, enemy.armor_value))
+        for item in room["treasure"]:
+            treasure.append(TREASURE.pack(*dungeon_gen.treasure_record(item)))
+
+    hero = world.hero
+    name = hero.name.encode("utf-8")
+    return b"".join([
+        HEADER.pack(MAGIC, VERSION, len(rooms), len(enemies), len(treasure)),
+        WORLD.pack(world.location, world.dungeon_boss_key_captured),
+        NAME_LENGTH.pack(len(name)),
+        name,
+        HERO.pack(hero.health, hero.armor_id, hero.armor_value, hero.weapon_id, hero.weapon_damage, hero.boss_key),
+        b"".join(rooms),
+        b"".join(enemies),
+        b"".join(treasure)
+        ])
+
+
+def save_world(world, path=SAVE_FILE):
+    # Written to a temp file and renamed over the old save so a crash mid-save keeps the last one
+    data = pack_world(world)
+    if isinstance(world.dungeon, SavedDungeon):
+        # Packing touched every room, let go of the file we resumed from so it can be replaced
+        world.dungeon.release()
+    return persistence.write_atomic(path, data)
+
+
+class SavedDungeon:
+    # A list-like scenario.dungeon over a mapped save file. Rooms are unpacked on first access and kept.
+    def __init__(self, buffer, rooms, room_offset, enemy_offset, treasure_offset):
+        self.buffer = buffer
+        self.count = rooms
+        self.room_offset = room_offset
+        self.enemy_offset = enemy_offset
+        self.treasure_offset = treasure_offset
+        self.rooms = {}
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, location):
+        if location < 0:
+            location += self.count
+        if location < 0 or location >= self.count:
+            raise IndexError("dungeon location out of range")
+        room = self.rooms.get(location)
+        if room is None:
+            room = self.unpack_room(location)
+            self.rooms[location] = room
+        return room
+
+    def __iter__(self):
+        for location in range(self.count):
+            yield self[location]
+
+    def release(self):
+        # Unpack whatever is left and close the mapping
+        if self.buffer is not None:
+            for location in range(self.count):
+                self[location]
+            self.buffer.close()
+            self.buffer = None
+
+    def unpack_room(self, location):
+        room_number, first_enemy, enemy_count, first_treasure, treasure_count = ROOM.unpack_from(
+            self.buffer, self.room_offset + location * ROOM.size)
+        room = {
+            "room_number": room_number,
+            "enemies": [],
+            "treasure": [],
+            "details": [],
+            }
+        offset = self.enemy_offset + first_enemy * ENEMY.size
+        for __ in range(enemy_count):
+            health, final_boss, weapon1_id, weapon1_damage, weapon2_id, weapon2_damage, armor_id, armor_value = ENEMY.unpack_from(self.buffer, offset)
+            room["enemies"].append(utils.Enemy.from_record(health, weapon1_id, weapon1_damage, weapon2_id, weapon2_damage,
+                                                          armor_id, armor_value, final_boss=final_boss))
+            offset += ENEMY.size
+        offset = self.treasure_offset + first_treasure * TREASURE.size
+        for __ in range(treasure_count):
+            room["treasure"].append(dungeon_gen.treasure_item(*TREASURE.unpack_from(self.buffer, offset)))
+            offset += TREASURE.size
+        return room
+
+
+def load_world(path=SAVE_FILE, write_behind=True, hero_file=utils.HERO_FILE):
+    # Returns the pieces scenario.fromSave() needs: hero, dungeon, location, boss key
+    with open(path, "rb") as _rf:
+        try:
+            buffer = mmap.mmap(_rf.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise SaveError("{0} is empty".format(path))
+
+    try:
+        magic, version, rooms, enemies, treasure = HEADER.unpack_from(buffer, 0)
+    except struct.error:
+        raise SaveError("{0} is too short to be a save".format(path))
+    if magic != MAGIC:
+        raise SaveError("{0} is not a save file".format(path))
+    if version != VERSION:
+        raise SaveError("{0} is save format version {1}, this game reads version {2}".format(path, version, VERSION))
+
+    offset = HEADER.size
+    location, boss_key_captured = WORLD.unpack_from(buffer, offset)
+    offset += WORLD.size
+    (name_length,) = NAME_LENGTH.unpack_from(buffer, offset)
+    offset += NAME_LENGTH.size
+    name = bytes(buffer[offset:offset + name_length]).decode("utf-8")
+    offset += name_length
+    health, armor_id, armor_value, weapon_id, weapon_damage, boss_key = HERO.unpack_from(buffer, offset)
+    offset += HERO.size
+
+    room_offset = offset
+    enemy_offset = room_offset + rooms * ROOM.size
+    treasure_offset = enemy_offset + enemies * ENEMY.size
+    if len(buffer) != treasure_offset + treasure * TREASURE.size:
+        raise SaveError("{0} is truncated or damaged".format(path))
+
+    return {
+        "hero": utils.Hero.from_record(name, health, armor_id, armor_value, weapon_id, weapon_damage, boss_key,
+                                       write_behind=write_behind, hero_file=hero_file),
+        "dungeon": SavedDungeon(buffer, rooms, room_offset, enemy_offset, treasure_offset),
+        "location": location,
+        "boss_key_captured": boss_key_captured
+        }
+
+
+def bench_world(label, world, path, repeat):
+    start = time.perf_counter()
+    for __ in range(repeat):
+        size = save_world(world, path)
+    save_time = (time.perf_counter() - start) / repeat
+
+    start = time.perf_counter()
+    for __ in range(repeat):
+        loaded = load_world(path, hero_file=None)
+    open_time = (time.perf_counter() - start) / repeat
+
+    start = time.perf_counter()
+    for __ in loaded["dungeon"]:
+        pass
+    full_time = time.perf_counter() - start + open_time
+
+    print(" [-] {0:22} {1:>12,} bytes   save {2:9.3f} ms   open {3:9.3f} ms   open + every room {4:9.3f} ms".format(
+        label, size, 1000 * save_time, 1000 * open_time, 1000 * full_time))
+
+
+def bench(large_rooms=120000):
+    import os
+    import tempfile
+    from OOP_Game_lab import scenario
+
+    with tempfile.TemporaryDirectory() as scratch:
+        path = os.path.join(scratch, SAVE_FILE)
+        hero_file = os.path.join(scratch, utils.HERO_FILE)
+
+        stock = scenario("bench", hero_file=hero_file)
+        bench_world("stock 6 rooms", stock, path, 200)
+
+        # A long dungeon stitched together from bulk generated ones
+        batch = dungeon_gen.generate_dungeons(large_rooms // dungeon_gen.ROOMS_PER_DUNGEON)
+        rooms = []
+        for d in range(len(batch)):
+            rooms.extend(batch.dungeon(d))
+        large = scenario("bench", dungeon=rooms, hero_file=hero_file)
+        bench_world("{0:,} rooms".format(len(rooms)), large, path, 3)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        bench(int(sys.argv[1]))
+    else:
+        bench()
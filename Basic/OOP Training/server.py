@@ -0,0 +1,271 @@
+#!/usr/bin/python3
+
+# Hosts many players at once over TCP, telnet style: the player types a line, the server plays it
+# through that player's OOP_Game_lab.GameSession and sends back what the game said and the next prompt.
+# ';' separated commands on one line are played as one batch (see commands.py). Lines that arrive
+# together are still played one line at a time, only what they say goes back in one reply.
+# Every connection has its own scenario and hero in memory only, there's no HeroObject.json, save file
+# or HUD, so any number of players can share a directory. Connect with 'telnet localhost 4747' or 'nc'.
+#
+#   python server.py [--host H] [--port N]
+#   python server.py loadgen [connections ...] [--commands N] [--think S]
+#
+# loadgen starts a server in a child process, holds that many connections open at once, has every
+# player type commands with a random pause in between and reports command latency and server memory.
+
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+
+import OOP_Game_lab
+import dice
+import utils
+
+HOST = "127.0.0.1"
+PORT = 4747
+BACKLOG = 4096
+# Dice drawn ahead per range for each game, see dice.GameRng
+DICE_BLOCK = 32
+
+NAME_PROMPT = "What's your name great warrior? "
+# Bytes read from a player at a time
+READ_SIZE = 65536
+# The longest line a player can send (asyncio's own readline() limit), a player that sends more
+# without ending the line is hung up on
+MAX_LINE = 65536
+
+
+def telnet(text):
+    return text.replace("\n", "\r\n").encode("utf-8")
+
+
+async def read_command(reader):
+    # One typed line, None when the player hung up or the line was longer than readline() takes
+    try:
+        line = await reader.readline()
+    except ValueError:
+        return None
+    if not line:
+        return None
+    return line.decode("utf-8", "replace").rstrip("\r\n")
+
+
+async def read_commands(reader, pending):
+    # Every whole line the player has sent so far, at least one, None when the player hung up or
+    # sent a line longer than MAX_LINE. pending holds the start of a line that hasn't all come in yet.
+    while b"\n" not in pending:
+        if len(pending) > MAX_LINE:
+            return None
+        chunk = await reader.read(READ_SIZE)
+        if not chunk:
+            return None
+        pending.extend(chunk)
+    # Only the first line can have come in over several reads
+    if pending.index(b"\n") > MAX_LINE:
+        return None
+    end = pending.rindex(b"\n") + 1
+    lines = pending[:end].decode("utf-8", "replace").split("\n")[:-1]
+    del pending[:end]
+    return [line.rstrip("\r") for line in lines]
+
+
+async def serve_player(reader, writer):
+    lines = []
+    def say(*args):
+        lines.append(" ".join(str(arg) for arg in args))
+
+    try:
+        writer.write(telnet("\tWelcome to Meh! An ok dungeon crawler game designed to exist.\n\n\n" + NAME_PROMPT))
+        name = await read_command(reader)
+        if name is None:
+            return
+        world = OOP_Game_lab.scenario(name, hero_file=None, rng=dice.GameRng(block=DICE_BLOCK))
+        say("Old man -- Welcome {0}! The land is in great danger!".format(name))
+        say("Old man -- I've set aside what armor and weapons I could. I hope it helps!")
+        say(OOP_Game_lab.PARCHMENT)
+        session = OOP_Game_lab.GameSession(world, say=say)
+
+        pending = bytearray()
+        while True:
+            if session.over is not None:
+                writer.write(telnet("\n".join(lines) + "\n"))
+                await writer.drain()
+                return
+            writer.write(telnet("\n".join(lines) + "\n" + session.prompt()))
+            lines.clear()
+            await writer.drain()
+
+            commands = await read_commands(reader, pending)
+            if commands is None:
+                return
+            # Every line is its own command or batch, a line that's turned down or breaks doesn't take
+            # the ones that came with it down too
+            for command in commands:
+                try:
+                    session.handle(command)
+                except Exception as ex:
+                    # On the console a bad command ends the game, here it only costs the player a turn
+                    say(" [!] That didn't work: {0!r}".format(ex))
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host=HOST, port=PORT):
+    server = await asyncio.start_server(serve_player, host, port, backlog=BACKLOG)
+    print(" [-] Serving Meh on {0}:{1}".format(host, port))
+    sys.stdout.flush()
+    async with server:
+        await server.serve_forever()
+
+
+def raise_file_limit():
+    # Every connection is a file descriptor, ask for as many as we are allowed
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+# Load generator
+
+# Heal often enough that most players live through the run, the ones that die reconnect as someone new
+SCRIPT = ("look", "heal", "attack 1", "heal", "chill", "heal", "attack 2", "heal")
+
+
+def server_memory(pid):
+    # Resident memory of the server in bytes, None where /proc isn't available
+    try:
+        with open("/proc/{0}/statm".format(pid)) as _rf:
+            return int(_rf.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class Load():
+    def __init__(self, connections):
+        self.connections = connections
+        self.connected = 0
+        self.all_connected = asyncio.Event()
+        self.measuring = asyncio.Event()
+        self.latencies = []
+        self.deaths = 0
+        self.errors = 0
+
+
+async def join_game(port, name):
+    reader, writer = await asyncio.open_connection(HOST, port)
+    await reader.readuntil(NAME_PROMPT.encode())
+    prompt = "[{0}]> ".format(name).encode()
+    writer.write(telnet(name + "\n"))
+    await reader.readuntil(prompt)
+    return reader, writer, prompt
+
+
+async def player(load, port, index, commands, think, connecting):
+    rng = random.Random(index)
+    name = "p{0}".format(index)
+    try:
+        async with connecting:
+            reader, writer, prompt = await join_game(port, name)
+    except (OSError, asyncio.IncompleteReadError):
+        load.errors += 1
+        return
+    load.connected += 1
+    if load.connected == load.connections:
+        load.all_connected.set()
+    await load.measuring.wait()
+
+    lives = 0
+    for count in range(commands):
+        await asyncio.sleep(rng.uniform(0, 2 * think))
+        command = SCRIPT[(index + count) % len(SCRIPT)]
+        start = time.perf_counter()
+        writer.write(telnet(command + "\n"))
+        try:
+            await reader.readuntil(prompt)
+        except asyncio.IncompleteReadError:
+            # Died, come back as a new hero
+            load.deaths += 1
+            writer.close()
+            lives += 1
+            name = "p{0}x{1}".format(index, lives)
+            try:
+                reader, writer, prompt = await join_game(port, name)
+            except (OSError, asyncio.IncompleteReadError):
+                load.errors += 1
+                return
+            continue
+        except OSError:
+            load.errors += 1
+            return
+        load.latencies.append(time.perf_counter() - start)
+    writer.close()
+
+
+async def run_load(port, pid, connections, commands, think):
+    load = Load(connections)
+    before = server_memory(pid)
+    connecting = asyncio.Semaphore(200)
+    start = time.perf_counter()
+    tasks = [asyncio.ensure_future(player(load, port, index, commands, think, connecting)) for index in range(connections)]
+    while not load.all_connected.is_set() and load.connected + load.errors < connections:
+        await asyncio.sleep(0.1)
+    connect_time = time.perf_counter() - start
+    after = server_memory(pid)
+
+    start = time.perf_counter()
+    load.measuring.set()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(load.latencies)
+    print(" [-] {0:>6,} connections: {1:,} sustained in {2:.1f}s, {3} failed, {4} died and rejoined".format(
+        connections, load.connected, connect_time, load.errors, load.deaths))
+    if latencies:
+        print(" [-]        {0:,} commands at {1:,.0f}/s   latency p50 {2:.2f} ms   p99 {3:.2f} ms   max {4:.2f} ms".format(
+            len(latencies), len(latencies) / elapsed,
+            1000 * latencies[len(latencies) // 2],
+            1000 * latencies[int(len(latencies) * 0.99)],
+            1000 * latencies[-1]))
+    if before is not None and after is not None and load.connected:
+        print(" [-]        server memory {0:.1f} MB with everyone connected, {1:.1f} KB per session".format(
+            after / 2**20, (after - before) / 1024 / load.connected))
+
+
+def loadgen(counts, commands, think, port=PORT + 1):
+    raise_file_limit()
+    for connections in counts:
+        child = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--port", str(port)],
+                                 stdout=subprocess.PIPE, universal_newlines=True)
+        try:
+            # Wait for "Serving Meh on ..."
+            child.stdout.readline()
+            asyncio.run(run_load(port, child.pid, connections, commands, think))
+        finally:
+            child.terminate()
+            child.wait()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args and args[0] == "loadgen":
+        args = args[1:]
+        commands = int(utils.option(args, "--commands", 5))
+        think = float(utils.option(args, "--think", 2.0))
+        counts = [int(arg) for arg in args] or [1000, 10000]
+        loadgen(counts, commands, think)
+    else:
+        host = utils.option(args, "--host", HOST)
+        port = int(utils.option(args, "--port", PORT))
+        raise_file_limit()
+        try:
+            asyncio.run(serve(host, port))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,235 @@
+#!/usr/bin/python3
+
+# How the game starts from the command line. Loading OOP_Game_lab and the game's modules (utils, the
+# catalog, json, ...) takes longer than anything else before the first prompt, so 'python
+# OOP_Game_lab.py' hands over to run() before any of that: run() shows the banner and asks for the
+# hero's name while a GameLoader imports OOP_Game_lab on a thread, which then starts its
+# WorldLoader on the dungeon. Nothing here imports more than the standard library needs to print.
+#
+#   python startup.py [runs]     time to the first prompt and to the first room, stock, 1,000,000 rooms and a horde
+#   python startup.py check      which modules load before the first prompt
+
+import os
+import sys
+import threading
+import time
+
+# run()'s name prompt, the bench waits for it
+NAME_PROMPT = "What's your name great warrior? "
+# How long the bench takes to type the hero's name, about as fast as a person could
+TYPING = 0.5
+# Modules that mustn't load before the first prompt
+LATE_MODULES = ("OOP_Game_lab", "utils", "subprocess", "json", "catalog")
+
+
+class GameLoader():
+    # Imports OOP_Game_lab on a thread and, for a new game, starts building its world
+    def __init__(self, seed=None, rooms=None, horde_size=None, new_game=True):
+        self.seed = seed
+        self.rooms = rooms
+        self.horde_size = horde_size
+        self.new_game = new_game
+        self.game = None
+        self.world_loader = None
+        self.error = None
+        self.thread = threading.Thread(target=self.load, name="game-loader", daemon=True)
+        self.thread.start()
+
+    def load(self):
+        try:
+            import OOP_Game_lab
+            if self.new_game:
+                self.world_loader = OOP_Game_lab.WorldLoader(OOP_Game_lab.TerminalIO.hero_file, self.seed,
+                                                             self.rooms, self.horde_size)
+            self.game = OOP_Game_lab
+        except BaseException as ex:
+            self.error = ex
+
+    def wait(self):
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.game
+
+
+def display():
+    print('''
+                ...     ..      ..                            
+              x*8888x.:*8888: -"888:                .uef^"    
+             X   48888X `8888H  8888              :d88E       
+            X8x.  8888X  8888X  !888>       .u    `888E       
+            X8888 X8888  88888   "*8%-   ud8888.   888E .z8k  
+            '*888!X8888> X8888  xH8>   :888'8888.  888E~?888L 
+              `?8 `8888  X888X X888>   d888 '88%"  888E  888E 
+              -^  '888"  X888  8888>   8888.+"     888E  888E 
+               dx '88~x. !88~  8888>   8888L       888E  888E 
+             .8888Xf.888x:!    X888X.: '8888c. .+  888E  888E 
+            :""888":~"888"     `888*"   "88888%   m888N= 888> 
+                "~'    "~        ""       "YP'     `Y"   888  
+                                                        J88"  
+                                                        @%    
+                                                      :"      
+    ''')
+    print('''
+        ===============================================================
+        =          The Worlds most ok'est text based game             =
+        ===============================================================
+    ''')
+    return
+
+
+
+
+def option_value(flag, default):
+    # The value after flag on the command line, default when flag is last
+    index = sys.argv.index(flag)
+    if index + 1 < len(sys.argv) and not sys.argv[index + 1].startswith("--"):
+        return sys.argv[index + 1]
+    return default
+
+
+def run():
+    # python OOP_Game_lab.py [--resume [save file]] [--record [command file]] [--seed N] [--stats [file]] [--journal [dir]]
+    #                        [--rooms N] [--horde N]
+    seed = None
+    if "--seed" in sys.argv:
+        seed = int(option_value("--seed", 0))
+    rooms = None
+    if "--rooms" in sys.argv:
+        rooms = int(option_value("--rooms", 1000))
+    horde_size = None
+    if "--horde" in sys.argv:
+        horde_size = int(option_value("--horde", 1000))
+    loader = GameLoader(seed, rooms, horde_size, new_game="--resume" not in sys.argv)
+    display()
+
+    name = None
+    if "--resume" not in sys.argv:
+        print("\tWelcome to Meh! An ok dungeon crawler game designed to exist.\n\n")
+        try:
+            name = input(NAME_PROMPT)
+        except:
+            print("Since you can't get your name figured out You shouldn't embark on this quest. Bye.")
+            exit(-1)
+
+    game = loader.wait()
+    record = None
+    if "--record" in sys.argv:
+        # Everything typed is kept so replay.py can play the session back. A file that already holds
+        # sessions gets a separator first so this one is read as a session of its own.
+        import replay
+        record = open(option_value("--record", "commands.txt"), "a")
+        if record.tell() > 0:
+            record.write(replay.SESSION_SEPARATOR + "\n")
+        if seed is not None:
+            record.write("{0}{1}\n".format(game.SEED_LINE, seed))
+        if name is not None:
+            record.write(name + "\n")
+            record.flush()
+    stats = None
+    if "--stats" in sys.argv:
+        import instrument
+        stats = instrument.Stats(option_value("--stats", instrument.STATS_FILE))
+    events = None
+    if "--journal" in sys.argv:
+        events = game.journal.Journal(option_value("--journal", game.journal.JOURNAL_DIR))
+    console = game.TerminalIO(record)
+    if "--resume" in sys.argv:
+        game.main(resume_path=option_value("--resume", game.savegame.SAVE_FILE), console=console, stats=stats,
+                  events=events)
+    else:
+        game.main(console=console, seed=seed, stats=stats, rooms=rooms, horde_size=horde_size, name=name,
+                  loader=loader.world_loader, events=events)
+    exit(0)
+
+
+GAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "OOP_Game_lab.py")
+
+
+class PipeReader():
+    # Reads a process's output as it comes, until() waits for a piece of text
+    def __init__(self, pipe):
+        self.fd = pipe.fileno()
+        self.text = ""
+        self.seen = 0
+
+    def until(self, marker):
+        while True:
+            found = self.text.find(marker, self.seen)
+            if found >= 0:
+                self.seen = found + len(marker)
+                return time.perf_counter()
+            data = os.read(self.fd, 65536)
+            if not data:
+                raise EOFError("the game stopped before printing {0!r}".format(marker))
+            self.text += data.decode(errors="replace")
+
+
+def startup_times(args, game=GAME):
+    # Starts a game in a fresh process and plays it up to the first room through pipes. Returns how long
+    # the player waits in seconds: for the first prompt after starting it, after typing his name (which
+    # takes him TYPING seconds), and for the first room after hitting enter (the intro's own pauses left out).
+    import subprocess
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as scratch:
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, "-u", game, "--seed", "1"] + args, cwd=scratch,
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        output = PipeReader(process.stdout)
+        try:
+            first_prompt = output.until(NAME_PROMPT) - start
+            time.sleep(TYPING)
+            process.stdin.write(b"bench\n")
+            process.stdin.flush()
+            typed = time.perf_counter()
+            after_name = output.until("Old man -- Welcome") - typed
+            output.until("When ready hit enter.")
+            process.stdin.write(b"\n")
+            process.stdin.flush()
+            ready = time.perf_counter()
+            first_room = output.until("Narration - At the entrance") - ready
+            # After the narration's sleep
+            read = output.until("Narration - You pick it up")
+            first_room += output.until("[bench]> ") - read
+        finally:
+            process.kill()
+            process.wait()
+    return first_prompt, after_name, first_room
+
+
+def bench(runs=5, game=GAME):
+    for label, args in (("stock dungeon", []), ("1,000,000 rooms", ["--rooms", "1000000"]),
+                        ("horde of 50,000", ["--horde", "50000"])):
+        results = [startup_times(args, game) for __ in range(runs)]
+        medians = [sorted(column)[len(column) // 2] for column in zip(*results)]
+        print(" [-] {0:18} first prompt {1:6.1f} ms   after the name {2:6.1f} ms   first room {3:6.1f} ms".format(
+            label, 1000 * medians[0], 1000 * medians[1], 1000 * medians[2]))
+
+
+def check():
+    # What loads before the name prompt: a fresh interpreter imports this module and draws the banner
+    import subprocess
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    code = "import sys, startup; startup.display(); print(' '.join(sys.modules))"
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=here, universal_newlines=True)
+    loaded = set(output.strip().split("\n")[-1].split(" "))
+    early = [name for name in LATE_MODULES if name in loaded]
+    for module in ("startup", "OOP_Game_lab"):
+        # -X importtime writes the import's own and cumulative microseconds, the last line is the module
+        timing = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module], cwd=here,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+        cumulative = int(timing.stderr.strip().split("\n")[-1].split("|")[1])
+        print(" [-] import {0:13} {1:6.1f} ms".format(module, cumulative / 1000))
+    if early:
+        print("[!] Loaded before the first prompt: {0}".format(", ".join(early)))
+        exit(-1)
+    print(" [-] None of {0} load before the first prompt".format(", ".join(LATE_MODULES)))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "check":
+        check()
+    else:
+        bench(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,130 @@
+#!/usr/bin/python3
+
+# The game's balance numbers in one place: hero and enemy health, how special enemies come out and
+# what items are worth. The values below are the ones the game always had. When TUNING_FILE exists
+# next to the game (optimizer.py writes one) its values replace them at import:
+#   {"hero_health": 100, "enemy_health": 100, "special_roll": 15, "special_health": 3,
+#    "special_armor": 5, "special_damage": 2, "weapon": {"dagger": 5, ...}, "armor": {"helmet": 5, ...}}
+# Any of them can be left out. Item values go on top of the item catalog (catalog.py), by name.
+
+import json
+import os
+
+TUNING_FILE = "tuning.json"
+
+HERO_HEALTH = 100
+ENEMY_HEALTH = 100
+# An enemy other than the boss is special when randint(0, 20) comes up SPECIAL_ROLL or more
+SPECIAL_ROLL = 15
+# A special enemy has SPECIAL_HEALTH times the health, SPECIAL_ARMOR more armor and
+# SPECIAL_DAMAGE times the weapon damage
+SPECIAL_HEALTH = 3
+SPECIAL_ARMOR = 5
+SPECIAL_DAMAGE = 2
+# item name -> value, for items that aren't worth what the catalog says
+ITEM_VALUES = {}
+
+# The numbers above by their name in the file, with the smallest and largest value that still
+# makes a game
+NUMBERS = {
+    "hero_health": (1, 32767),
+    "enemy_health": (1, 10000),
+    "special_roll": (0, 21),
+    "special_health": (1, 100),
+    "special_armor": (0, 1000),
+    "special_damage": (1, 100)
+    }
+ITEM_SLOTS = ("weapon", "armor")
+# savegame.py keeps health, damage and armor as signed 16 bit numbers, so a special enemy's health,
+# damage and armor have to stay at or under this
+MAX_STORED = 32767
+
+
+class TuningError(Exception):
+    pass
+
+
+def current():
+    # This process's numbers as a dict in the file's shape, every item in the catalog included
+    import catalog
+    params = {}
+    for name in NUMBERS:
+        params[name] = globals()[name.upper()]
+    for slot in ITEM_SLOTS:
+        params[slot] = {item.name: item.value for item in catalog.CATALOG.items[slot]}
+    return params
+
+
+def item_limit(slot, numbers=None):
+    # The most an item of the slot can be worth so a special enemy's boosted copy still fits the
+    # save game. numbers is {name: value} like NUMBERS, this process's numbers when it's None.
+    if numbers is None:
+        numbers = {name: globals()[name.upper()] for name in NUMBERS}
+    if slot == "weapon":
+        return MAX_STORED // numbers["special_damage"]
+    return MAX_STORED - numbers["special_armor"]
+
+
+def set_numbers(params):
+    # Takes params' numbers and item values without touching anything built from them. Nothing
+    # changes when any of them is out of range.
+    global ITEM_VALUES
+    numbers = {}
+    for name, (low, high) in NUMBERS.items():
+        value = params.get(name, globals()[name.upper()])
+        if not isinstance(value, int) or isinstance(value, bool) or not low <= value <= high:
+            raise TuningError("{0} has to be a whole number from {1} to {2}, not {3!r}".format(name, low, high, value))
+        numbers[name] = value
+    if numbers["enemy_health"] * numbers["special_health"] > MAX_STORED:
+        raise TuningError("enemy_health times special_health has to be {0} or less for the save game, not {1}".format(
+            MAX_STORED, numbers["enemy_health"] * numbers["special_health"]))
+    values = {}
+    for slot in ITEM_SLOTS:
+        limit = item_limit(slot, numbers)
+        for name, value in params.get(slot, {}).items():
+            if not isinstance(value, int) or isinstance(value, bool) or not 0 <= value <= limit:
+                raise TuningError("{0} has to be worth a whole number from 0 to {1}, not {2!r}".format(name, limit, value))
+            values[name] = value
+    for name, value in numbers.items():
+        globals()[name.upper()] = value
+    ITEM_VALUES = values
+
+
+def load(path=TUNING_FILE):
+    if path is None or not os.path.exists(path):
+        return
+    try:
+        with open(path) as _rf:
+            params = json.load(_rf)
+        if not isinstance(params, dict):
+            raise TuningError("it holds a {0}, not an object".format(type(params).__name__))
+        set_numbers(params)
+    except (ValueError, AttributeError, TuningError) as ex:
+        raise TuningError("{0} is not a valid tuning file: {1}".format(path, ex))
+
+
+def apply(params):
+    # Play with params from now on in this process (optimizer.py's workers): the numbers, a catalog
+    # with the new item values and the loot tables built from it
+    import catalog
+    import loot
+    import utils
+    set_numbers(params)
+    catalog.CATALOG = catalog.load()
+    utils.use_catalog(catalog.CATALOG)
+    loot.LOOT = loot.load(items=catalog.CATALOG)
+
+
+def save(params, path=TUNING_FILE, notes=None):
+    # notes go in the file too, under "notes", the game doesn't read them
+    data = {name: params[name] for name in NUMBERS}
+    for slot in ITEM_SLOTS:
+        data[slot] = params[slot]
+    if notes is not None:
+        data["notes"] = notes
+    with open(path, "w") as _wf:
+        json.dump(data, _wf, indent=4)
+        _wf.write("\n")
+
+
+load()
@@ -1,10 +1,24 @@
 #!/usr/bin/python3
 
-import random
+import functools
 import os
+import sys
 import json
+from collections.abc import MutableMapping
 
-def produce_room_template(room_number):
+import catalog
+import dice
+import hero_shm
+import loot
+import persistence
+import tuning
+
+HERO_FILE = "HeroObject.json"
+
+def produce_room_template(room_number, rng=None):
+    # rng is the scenario's dice.GameRng, the shared default one when it isn't given
+    if rng is None:
+        rng = dice.default_rng
     #print("produce_room_template()")
     room = {
         "room_number": room_number,
@@ -14,19 +28,19 @@ def produce_room_template(room_number):
         }
     
     if room_number < 4:
-        room['treasure'].append(get_treasure())
-        num_of_enemies = random.randint(1,2)
+        room['treasure'].append(get_treasure(rng))
+        num_of_enemies = rng.randint(1,2)
         while num_of_enemies > 0:
             num_of_enemies -= 1
-            room["enemies"].append(Enemy())
+            room["enemies"].append(Enemy(rng=rng))
     elif room_number == 4:
         room['treasure'].append(["boss_key",True])
-        num_of_enemies = random.randint(1,2)
+        num_of_enemies = rng.randint(1,2)
         while num_of_enemies > 0:
             num_of_enemies -= 1
-            room["enemies"].append(Enemy(final_boss=True))
+            room["enemies"].append(Enemy(final_boss=True, rng=rng))
     elif room_number == 5:
-        room["enemies"].append(Enemy(final_boss=True))
+        room["enemies"].append(Enemy(final_boss=True, rng=rng))
     else:
         # This will be the final room... the Boss fight
         pass
@@ -35,118 +49,494 @@ def produce_room_template(room_number):
     #print()
     return room
 
-def loot_drop(scenario):
-    # this will be a general function to handle the dropping of loot in a space by an enemy of treasure chest.
-    pass
+def loot_drop(scenario, room, count=1):
+    # Loot for count enemies dying in room, from the room tier's drop table (see loot.py) with the
+    # scenario's dice. What drops goes in the room's treasure and is returned.
+    return loot.drop(room, count, scenario.rng)
+
+# Item catalogs in the order get_weapon() and get_armor() draw from (see catalog.py).
+# An item's id is its index here and WEAPON_CATALOG[id] is an Item(name, value, slot, id).
+WEAPON_CATALOG = catalog.CATALOG.items[catalog.WEAPON]
+ARMOR_CATALOG = catalog.CATALOG.items[catalog.ARMOR]
+
+WEAPON_IDS = {item.name: item.id for item in WEAPON_CATALOG}
+ARMOR_IDS = {item.name: item.id for item in ARMOR_CATALOG}
+
+def use_catalog(items):
+    # Point the tables above at another catalog (tuning.apply() after item values changed)
+    global WEAPON_CATALOG, ARMOR_CATALOG, WEAPON_IDS, ARMOR_IDS
+    WEAPON_CATALOG = items.items[catalog.WEAPON]
+    ARMOR_CATALOG = items.items[catalog.ARMOR]
+    WEAPON_IDS = {item.name: item.id for item in WEAPON_CATALOG}
+    ARMOR_IDS = {item.name: item.id for item in ARMOR_CATALOG}
+
+# Item id of a slot whose item was taken ([] in the classic lists) and of a weapon slot the enemy never had
+EMPTY_SLOT = -1
+NO_SLOT = -2
+
+def weapon_item(weapon_id, damage):
+    # The classic [name, damage] list for a weapon slot, [] when the slot is empty
+    if weapon_id < 0:
+        return []
+    return [WEAPON_CATALOG[weapon_id].name, damage]
+
+def armor_item(armor_id, value):
+    if armor_id < 0:
+        return []
+    return [ARMOR_CATALOG[armor_id].name, value]
+
+def item_ids(item, ids):
+    # [name, value] or [] back to (id, value)
+    if item == []:
+        return EMPTY_SLOT, 0
+    return ids[item[0]], item[1]
+
 
 class Enemy:
-    def __init__(self, final_boss=False):
+    # A compact enemy record. Items are stored as catalog ids plus their value (special enemies
+    # carry boosted values) instead of nested lists, and enemy.stats is a live mapping view that
+    # gives the classic {"health", "weapons", "armor"} shape to code that still wants it.
+    __slots__ = ("final_boss", "health", "weapon1_id", "weapon1_damage", "weapon2_id", "weapon2_damage",
+                 "armor_id", "armor_value")
+
+    def __init__(self, final_boss=False, rng=None):
+        if rng is None:
+            rng = dice.default_rng
         self.final_boss = final_boss
-        self.stats = {
-            "health" : 100,
-            "weapons" : self.get_weapons(),
-            "armor" : self.get_armor_meth()
-            }
+        self.health = tuning.ENEMY_HEALTH
+        # Same draws as get_weapons() and get_armor_meth(), straight to ids
+        draw = catalog.CATALOG.draw
+        number_of_weapons = rng.randint(0,9)
+        weapon = draw(catalog.WEAPON, rng)
+        self.weapon1_id, self.weapon1_damage = weapon.id, weapon.value
+        if number_of_weapons <= 5:
+            weapon = draw(catalog.WEAPON, rng)
+            self.weapon2_id, self.weapon2_damage = weapon.id, weapon.value
+        else:
+            self.weapon2_id, self.weapon2_damage = NO_SLOT, 0
+        armor = draw(catalog.ARMOR, rng)
+        self.armor_id, self.armor_value = armor.id, armor.value
 
         if self.final_boss == False:
-            determine_if_special = random.randint(0,20)
-            if determine_if_special >= 15:
-                self.stats["health"] = self.stats["health"] * 3
-                self.stats["armor"][1] = self.stats["armor"][1] + 5
-                for index, weapon in enumerate(self.stats["weapons"]):
-                    self.stats["weapons"][index][1] = self.stats["weapons"][index][1] * 2
-                    #print(self.stats["weapons"][index])
-
-   
-    def get_weapons(self):
-        number_of_weapons = random.randint(0,9)
+            determine_if_special = rng.randint(0,20)
+            if determine_if_special >= tuning.SPECIAL_ROLL:
+                self.health = self.health * tuning.SPECIAL_HEALTH
+                self.armor_value = self.armor_value + tuning.SPECIAL_ARMOR
+                self.weapon1_damage = self.weapon1_damage * tuning.SPECIAL_DAMAGE
+                self.weapon2_damage = self.weapon2_damage * tuning.SPECIAL_DAMAGE
+
+    @classmethod
+    def from_stats(cls, health, weapons, armor, final_boss=False):
+        # Build an enemy from classic stats values that were already drawn without rolling again
+        enemy = cls.__new__(cls)
+        enemy.final_boss = final_boss
+        enemy.health = health
+        enemy.set_weapons(weapons)
+        enemy.armor_id, enemy.armor_value = item_ids(armor, ARMOR_IDS)
+        return enemy
+
+    @classmethod
+    def from_record(cls, health, weapon1_id, weapon1_damage, weapon2_id, weapon2_damage, armor_id, armor_value, final_boss=False):
+        # Build an enemy straight from ids and values (see dungeon_gen.py)
+        enemy = cls.__new__(cls)
+        enemy.final_boss = final_boss
+        enemy.health = health
+        enemy.weapon1_id = weapon1_id
+        enemy.weapon1_damage = weapon1_damage
+        enemy.weapon2_id = weapon2_id
+        enemy.weapon2_damage = weapon2_damage
+        enemy.armor_id = armor_id
+        enemy.armor_value = armor_value
+        return enemy
+
+    @property
+    def stats(self):
+        return EnemyStats(self)
+
+    def get_weapons(self, rng=None):
+        if rng is None:
+            rng = dice.default_rng
+        number_of_weapons = rng.randint(0,9)
         weapons = []
         if number_of_weapons <= 5:
-            weapons.append(get_weapon())
-            weapons.append(get_weapon())
+            weapons.append(get_weapon(rng))
+            weapons.append(get_weapon(rng))
         else:
-            weapons.append(get_weapon())                           
+            weapons.append(get_weapon(rng))                           
 
         return weapons
 
-    def get_armor_meth(self):
-        return get_armor()
+    def get_armor_meth(self, rng=None):
+        return get_armor(rng)
 
+    def set_weapons(self, weapons):
+        self.weapon1_id, self.weapon1_damage = item_ids(weapons[0], WEAPON_IDS)
+        if len(weapons) > 1:
+            self.weapon2_id, self.weapon2_damage = item_ids(weapons[1], WEAPON_IDS)
+        else:
+            self.weapon2_id, self.weapon2_damage = NO_SLOT, 0
+
+    def weapon_slots(self):
+        if self.weapon2_id == NO_SLOT:
+            return 1
+        return 2
+
+    def weapon(self, index):
+        if index == 0:
+            return weapon_item(self.weapon1_id, self.weapon1_damage)
+        elif index == 1 and self.weapon2_id != NO_SLOT:
+            return weapon_item(self.weapon2_id, self.weapon2_damage)
+        raise IndexError("weapon slot out of range")
+
+    def set_weapon(self, index, item):
+        if index == 0:
+            self.weapon1_id, self.weapon1_damage = item_ids(item, WEAPON_IDS)
+        elif index == 1 and self.weapon2_id != NO_SLOT:
+            self.weapon2_id, self.weapon2_damage = item_ids(item, WEAPON_IDS)
+        else:
+            raise IndexError("weapon slot out of range")
+
+    def attack_damage(self):
+        # Only the first weapon is used to attack. A stolen weapon leaves the enemy with its fists.
+        if self.weapon1_id < 0:
+            return 0
+        return self.weapon1_damage
+
+    def weapon_index(self, weapon_id):
+        # The slot holding that weapon, None when the enemy doesn't carry it
+        if self.weapon1_id == weapon_id:
+            return 0
+        elif self.weapon2_id == weapon_id:
+            return 1
+        return None
+
+    def armor(self):
+        return armor_item(self.armor_id, self.armor_value)
+
+    def set_armor(self, item):
+        self.armor_id, self.armor_value = item_ids(item, ARMOR_IDS)
+
+
+class LiveItem(list):
+    # An item ([name, value], [] for an empty slot) read out of an Enemy or Hero record. Changing one
+    # of its two fields writes the item back through setter, so stats['weapons'][0][1] = 30 changes
+    # the enemy like it did when stats was a plain dict. An item can't grow or shrink, whatever tries
+    # gets a TypeError instead of changing a copy nobody looks at.
+    __slots__ = ("setter",)
+
+    def __init__(self, item, setter):
+        list.__init__(self, item)
+        self.setter = setter
+
+    def __setitem__(self, index, value):
+        item = list(self)
+        item[index] = value
+        self.setter(item)
+        list.__setitem__(self, index, value)
+
+    def _fixed(self, *args):
+        raise TypeError("an item is [name, value], it can't grow or shrink")
+
+    __delitem__ = __iadd__ = __imul__ = append = extend = insert = pop = remove = clear = sort = reverse = _fixed
+
+
+class WeaponSlots:
+    # enemy.stats['weapons']: reads give LiveItems, assigning a slot writes through to the record,
+    # e.g. stats['weapons'][0] = [] when the hero takes the weapon.
+    __slots__ = ("enemy",)
+
+    def __init__(self, enemy):
+        self.enemy = enemy
+
+    def __len__(self):
+        return self.enemy.weapon_slots()
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        return LiveItem(self.enemy.weapon(index), functools.partial(self.enemy.set_weapon, index))
+
+    def __setitem__(self, index, item):
+        if index < 0:
+            index += len(self)
+        self.enemy.set_weapon(index, item)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __eq__(self, other):
+        return list(self) == other
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class EnemyStats(MutableMapping):
+    # enemy.stats: the classic stats dict as a view over the Enemy record. Items come back as
+    # LiveItems, so stats['armor'][1] = 12 and stats['weapons'][0][1] = 30 write through.
+    __slots__ = ("enemy",)
+    keys_ = ("health", "weapons", "armor")
+
+    def __init__(self, enemy):
+        self.enemy = enemy
+
+    def __getitem__(self, key):
+        if key == "health":
+            return self.enemy.health
+        elif key == "weapons":
+            return WeaponSlots(self.enemy)
+        elif key == "armor":
+            return LiveItem(self.enemy.armor(), self.enemy.set_armor)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key == "health":
+            self.enemy.health = value
+        elif key == "weapons":
+            self.enemy.set_weapons(value)
+        elif key == "armor":
+            self.enemy.set_armor(value)
+        else:
+            raise KeyError(key)
 
-def get_weapon():
-    weapons = {
-        "short_sword": 15,
-        "long_sword": 20,
-        "dagger": 5,
-        "spear": 20
-        }
-    item_number = random.randint(0,3)
-    for index, value in enumerate(weapons.keys()):
-            if index == item_number:
-                    return [value,weapons[value]]
-               
-
-def get_armor():
-    armor = {
-        "breast_plate": 10,
-        "helmet": 5,
-        "shield": 10,
-        "greaves": 5,
-        "gauntlets": 5
-        }
-    item_number = random.randint(0,4)
-    for index, value in enumerate(armor.keys()):
-            if index == item_number:
-                    return [value,armor[value]]
+    def __delitem__(self, key):
+        raise TypeError("enemy stats can't be removed")
 
+    def __iter__(self):
+        return iter(self.keys_)
 
+    def __len__(self):
+        return len(self.keys_)
 
-def get_treasure():
-    coin_flip = random.randint(0,5)
-    if coin_flip == 0:  
-        return get_weapon()
-    elif coin_flip == 1:
-        return get_armor()
-    else:
-        heart = random.randint(5,50)
-        return ["heart", heart]
+    def __repr__(self):
+        return repr(dict(self))
+
+
+def get_weapon(rng=None):
+    item = catalog.CATALOG.draw(catalog.WEAPON, rng)
+    return [item.name, item.value]
 
+def get_armor(rng=None):
+    item = catalog.CATALOG.draw(catalog.ARMOR, rng)
+    return [item.name, item.value]
 
-def roll_dice():
-    die1 = random.randint(1,6)
-    die2 = random.randint(1,6)
 
-    return [die1, die2, die1+die2]
+def get_treasure(rng=None):
+    # A chest's treasure from the common chest table (see loot.py)
+    return loot.chest(loot.COMMON, rng)
+
+
+def roll_dice(rng=None):
+    # [die1, die2, die1+die2] from the pre-rolled dice in rng
+    if rng is None:
+        rng = dice.default_rng
+    return rng.roll_dice()
+
+def hero_attack(hero_attribs, enemy, rng=None):
+    # The hero's attack: weapon damage + 2d6 minus the enemy's armor, never below 0.
+    # The enemy's health is updated in place and the damage dealt is returned.
+    roll_result = roll_dice(rng)
+    attack_damage = hero_attribs['weapons'][1] + roll_result[2]
+
+    defensive_value = 0
+    if enemy.armor_id >= 0:
+        defensive_value = enemy.armor_value
+
+    final_damage = attack_damage - defensive_value
+    if final_damage < 0:
+        final_damage = 0
+
+    enemy.health = enemy.health - final_damage
+    if enemy.health < 0:
+        enemy.health = 0
+    return final_damage
+
+def enemy_action(hero_attribs, enemy, rng=None):
+    # One living enemy's turn against the hero. The dice are rolled in the same order main() always used:
+    # the action roll, then (when attacking) the attack roll, the lucky dodge and the dagger/shield perks.
+    # The hero's health is updated in place and the outcome is returned so the caller can narrate it.
+    result = {
+        "defended": False,
+        "lucky_dodge": False,
+        "dagger_dodge": False,
+        "shield_dodge": False,
+        "damage": None,
+        "died": False
+        }
+
+    if rng is None:
+        rng = dice.default_rng
+    roll_result = rng.roll_dice()
+    if roll_result[2] > 10:
+        # Move / take a defensive position
+        result["defended"] = True
+        return result
+
+    roll_result = rng.roll_dice()
+    attack_damage = enemy.attack_damage() + roll_result[2]
+    defensive_value = hero_attribs['armor'][1]
+
+    dodge = False
+    if rng.roll_dice()[2] >= 10:
+        dodge = True
+        result["lucky_dodge"] = True
+    if ('dagger' in hero_attribs['weapons']):
+        if rng.roll_dice()[2] > 8:
+            dodge = True
+            result["dagger_dodge"] = True
+    if ('shield' in hero_attribs['armor']):
+        if rng.roll_dice()[2] > 8:
+            dodge = True
+            result["shield_dodge"] = True
+    if dodge == True:
+        attack_damage = 0
+
+    if attack_damage > 0:
+        final_damage = attack_damage - defensive_value
+        if final_damage < 0:
+            final_damage = 0
+        result["damage"] = final_damage
+        if (hero_attribs['health'] - final_damage) > 0:
+            hero_attribs['health'] = hero_attribs['health'] - final_damage
+        else:
+            hero_attribs['health'] = 0
+            result["died"] = True
+    return result
 
 class Hero():
-    # need storage
-    def __init__(self, name):
+    # The hero's stats as a compact record. hero.hero_attribs is a live mapping view with the classic
+    # {"name", "health", "armor", "weapons", "boss_key"} shape, which is also what goes to HeroObject.json.
+    # Saving goes through a persistence.HeroStore: write_behind=False saves synchronously and
+    # hero_file=None keeps the hero in memory only. With a hero file the HUD's stats also go to a
+    # hero_shm.HeroChannel next to it, the moment a save is asked for.
+    __slots__ = ("name", "health", "armor_id", "armor_value", "weapon_id", "weapon_damage", "boss_key", "store", "channel")
+
+    def __init__(self, name, write_behind=True, hero_file=HERO_FILE, rng=None):
         self.name = name
-        self.create_hero_json_object()
+        self.create_hero_json_object(rng)
+        self.open_store(write_behind, hero_file)
+
+    @classmethod
+    def from_record(cls, name, health, armor_id, armor_value, weapon_id, weapon_damage, boss_key, write_behind=True, hero_file=HERO_FILE):
+        # Rebuild a saved hero (see savegame.py) without drawing new items
+        hero = cls.__new__(cls)
+        hero.name = name
+        hero.health = health
+        hero.armor_id = armor_id
+        hero.armor_value = armor_value
+        hero.weapon_id = weapon_id
+        hero.weapon_damage = weapon_damage
+        hero.boss_key = boss_key
+        hero.open_store(write_behind, hero_file)
+        return hero
+
+    def open_store(self, write_behind, hero_file):
+        self.store = persistence.HeroStore(self, hero_file, background=write_behind, on_write=notify_hud)
+        self.channel = None
+        if hero_file is not None:
+            self.channel = hero_shm.HeroChannel(hero_shm.shm_path(hero_file))
+        # The HUD reads the file as soon as it starts so the first save can't wait
         self.write_hero_object_to_disk()
+        self.store.flush()
+
+    def create_hero_json_object(self, rng=None):
+        weapon = catalog.CATALOG.draw(catalog.WEAPON, rng)
+        armor = catalog.CATALOG.draw(catalog.ARMOR, rng)
+        self.health = tuning.HERO_HEALTH
+        self.weapon_id, self.weapon_damage = weapon.id, weapon.value
+        self.armor_id, self.armor_value = armor.id, armor.value
+        self.boss_key = False
+
+    @property
+    def hero_attribs(self):
+        return HeroAttribs(self)
 
-    def create_hero_json_object(self):
-        weapons = get_weapon()
-        armor = get_armor()
-        hero_attribs = {
+    def snapshot(self):
+        return (self.name, self.health, self.armor_id, self.armor_value, self.weapon_id, self.weapon_damage, self.boss_key)
+
+    def to_dict(self):
+        return {
             "name": self.name,
-            "health": 100,
-            "armor": armor,
-            "weapons": weapons,
-            "boss_key": False
+            "health": self.health,
+            "armor": armor_item(self.armor_id, self.armor_value),
+            "weapons": weapon_item(self.weapon_id, self.weapon_damage),
+            "boss_key": self.boss_key
             }
-        self.hero_attribs = hero_attribs
 
     def write_hero_object_to_disk(self):
-        serializedHero = json.dumps(self.hero_attribs, indent=4)
-        with open("HeroObject.json", "w") as _wf:
-            _wf.write(serializedHero)
+        # Only a request, the store skips it when nothing changed and batches bursts into one write.
+        # The shared memory copy is updated in place right away.
+        self.publish_stats()
+        self.store.request()
+
+    def publish_stats(self):
+        # The HUD's copy in shared memory, and a ping for a HUD that's waiting for one
+        if self.channel is not None and self.channel.publish(self):
+            notify_hud()
+
+
+class HeroAttribs(MutableMapping):
+    # hero.hero_attribs: the classic dict as a view over the Hero record. 'weapons' and 'armor' come
+    # back as LiveItems, so hero_attribs['weapons'][1] = 30 writes through.
+    __slots__ = ("hero",)
+    keys_ = ("name", "health", "armor", "weapons", "boss_key")
+
+    def __init__(self, hero):
+        self.hero = hero
+
+    def __getitem__(self, key):
+        hero = self.hero
+        if key == "health":
+            return hero.health
+        elif key == "weapons":
+            return LiveItem(weapon_item(hero.weapon_id, hero.weapon_damage), self.set_weapons)
+        elif key == "armor":
+            return LiveItem(armor_item(hero.armor_id, hero.armor_value), self.set_armor)
+        elif key == "name":
+            return hero.name
+        elif key == "boss_key":
+            return hero.boss_key
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        hero = self.hero
+        if key == "health":
+            hero.health = value
+        elif key == "weapons":
+            hero.weapon_id, hero.weapon_damage = item_ids(value, WEAPON_IDS)
+        elif key == "armor":
+            hero.armor_id, hero.armor_value = item_ids(value, ARMOR_IDS)
+        elif key == "name":
+            hero.name = value
+        elif key == "boss_key":
+            hero.boss_key = value
+        else:
+            raise KeyError(key)
+
+    def set_weapons(self, item):
+        self.hero.weapon_id, self.hero.weapon_damage = item_ids(item, WEAPON_IDS)
 
+    def set_armor(self, item):
+        self.hero.armor_id, self.hero.armor_value = item_ids(item, ARMOR_IDS)
 
+    def __delitem__(self, key):
+        raise TypeError("hero attributes can't be removed")
 
-def youDied():
+    def __iter__(self):
+        return iter(self.keys_)
+
+    def __len__(self):
+        return len(self.keys_)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+
+def youDied(say=print):
     #os.system("cls")
-    print('''
+    say('''
 
 
                                                            ..          .                  ..       
@@ -169,23 +559,189 @@ def youDied():
     ''')
     return
 
-def LaunchHud():
+def quiet(*args):
+    # A say() that says nothing, for games the benches and checks play without a player
+    pass
+
+def option(args, flag, default):
+    # The value after flag in args, both taken out of args, default when flag isn't there
+    if flag in args:
+        index = args.index(flag)
+        value = args[index + 1]
+        del args[index:index + 2]
+        return value
+    return default
+
+# The HUD can follow the hero four ways:
+#   "shm"     like "notify", but the game pings the moment a save is asked for and the HUD reads the
+#             hero's record straight out of HeroObject.shm when its sequence number moved (see
+#             hero_shm.py), checking every HUD_SHM_FALLBACK seconds in case a datagram is lost
+#   "poll"    re-read HeroObject.json and re-print every 3 seconds (the original behavior)
+#   "watch"   stat() the file every HUD_WATCH_INTERVAL seconds and re-print when its mtime changes
+#   "notify"  sleep on a UDP socket until the game sends a datagram after each write (notify_hud()),
+#             with a stat() every HUD_NOTIFY_FALLBACK seconds in case a datagram is lost
+# In all but "poll" the HUD only re-prints when the hero's stats actually changed.
+# The game and its HUD both run in the game's directory and find each other on a UDP port picked from
+# it (hud_port()), so games in other directories don't ping this HUD. A HUD that can't have the port
+# (another HUD of the same game has it) watches HeroObject.json instead.
+HUD_HOST = "127.0.0.1"
+HUD_PORT_BASE = 47474
+HUD_PORTS = 1000
+HUD_POLL_INTERVAL = 3
+HUD_WATCH_INTERVAL = 0.05
+HUD_NOTIFY_FALLBACK = 5
+HUD_SHM_FALLBACK = 0.5
+_hud_socket = None
+_hud_address = None
+
+def hud_port(directory=None):
+    # The HUD's port for the game in directory, the current one when it isn't given
+    import zlib
+    if directory is None:
+        directory = os.getcwd()
+    return HUD_PORT_BASE + zlib.crc32(os.path.abspath(directory).encode("utf-8")) % HUD_PORTS
+
+def notify_hud():
+    # Tell a HUD running in "notify" mode that HeroObject.json changed. It's fine if nobody is listening.
+    global _hud_socket, _hud_address
+    try:
+        if _hud_socket is None:
+            import socket
+            _hud_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            _hud_socket.setblocking(False)
+            _hud_address = (HUD_HOST, hud_port())
+        _hud_socket.sendto(b"1", _hud_address)
+    except OSError:
+        pass
+
+def LaunchHud(mode="shm"):
     from subprocess import Popen
     #print(os.getcwd()+"\\"+"utils.py")
     #hud_process = Popen(["start","cmd.exe","\k","python",os.getcwd()+"\\"+"utils.py"], shell=True)
-    os.system("start cmd /c python "+os.getcwd()+"\\"+"utils.py")
+    # Popen doesn't wait for the shell like os.system() did, the first room shows up right away
+    Popen("start cmd /c python "+os.getcwd()+"\\"+"utils.py "+mode, shell=True)
     return
-    
-def Hud():
-    from time import sleep
 
-    while True:
-        # I need to read from the json object on disk to ascertain the details of what to print to screen
-        hero_stats = ''
-        with open("HeroObject.json", 'r') as _rf:
-            hero_stats = json.load(_rf)
+def clear_screen():
+    if os.name == "nt":
+        os.system("cls")
+    else:
+        os.system("clear")
+
+def read_hero_stats():
+    with open(HERO_FILE, 'r') as _rf:
+        return json.load(_rf)
+
+def shm_hero_stats(record):
+    # A hero_shm.HeroView.read() record as the dict read_hero_stats() gives
+    health, armor_id, armor_value, weapon_id, weapon_damage, boss_key, name = record
+    return {
+        "name": name,
+        "health": health,
+        "armor": armor_item(armor_id, armor_value),
+        "weapons": weapon_item(weapon_id, weapon_damage),
+        "boss_key": boss_key
+        }
+
+def hero_file_mtime():
+    try:
+        return os.stat(HERO_FILE).st_mtime_ns
+    except OSError:
+        return None
 
-        hero_pic = r"""
+def watch_hero(mode, on_change, stop=None, counters=None):
+    # Call on_change(hero_stats) whenever the HUD should re-print, following HeroObject.json the way
+    # mode says. stop is an optional threading.Event that ends the loop, counters an optional dict
+    # that gets "wakeups" and "renders" counts.
+    from time import sleep
+    if counters is None:
+        counters = {}
+    counters.setdefault("wakeups", 0)
+    counters.setdefault("renders", 0)
+
+    def wait(seconds):
+        if stop is None:
+            sleep(seconds)
+        else:
+            stop.wait(seconds)
+
+    def stopped():
+        return stop is not None and stop.is_set()
+
+    if mode == "poll":
+        while not stopped():
+            counters["wakeups"] += 1
+            counters["renders"] += 1
+            on_change(read_hero_stats())
+            wait(HUD_POLL_INTERVAL)
+        return
+
+    sock = None
+    if mode in ("notify", "shm"):
+        import select
+        import socket
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.bind((HUD_HOST, hud_port()))
+            sock.setblocking(False)
+        except OSError as ex:
+            print("[!] The HUD can't listen for the game ({0}), watching {1} instead".format(ex, HERO_FILE))
+            sock.close()
+            sock = None
+            mode = "watch"
+    elif mode != "watch":
+        raise ValueError("unknown HUD mode: {0}".format(mode))
+    fallback = HUD_SHM_FALLBACK if mode == "shm" else HUD_NOTIFY_FALLBACK
+
+    last_mtime = None
+    last_stats = None
+    view = None
+    last_sequence = 0
+    try:
+        while not stopped():
+            counters["wakeups"] += 1
+            if mode == "shm":
+                if view is None and os.path.exists(hero_shm.HERO_SHM_FILE):
+                    view = hero_shm.HeroView(hero_shm.HERO_SHM_FILE)
+                # The game never leaves the sequence at 0 once it has published a hero
+                if view is not None and view.sequence() != last_sequence:
+                    last_sequence, record = view.read()
+                    counters["renders"] += 1
+                    on_change(shm_hero_stats(record))
+                mtime = None
+            else:
+                mtime = hero_file_mtime()
+            if mtime is not None and mtime != last_mtime:
+                try:
+                    hero_stats = read_hero_stats()
+                except ValueError:
+                    # Caught the game half way through a write, the next change brings us back here
+                    hero_stats = None
+                if hero_stats is not None:
+                    last_mtime = mtime
+                    if hero_stats != last_stats:
+                        last_stats = hero_stats
+                        counters["renders"] += 1
+                        on_change(hero_stats)
+
+            if sock is None:
+                wait(HUD_WATCH_INTERVAL)
+            else:
+                # Sleep until the game pings us. To stop this mode set stop and then call notify_hud().
+                ready, __, __ = select.select([sock], [], [], fallback)
+                if ready:
+                    try:
+                        while True:
+                            sock.recv(64)
+                    except BlockingIOError:
+                        pass
+    finally:
+        if sock is not None:
+            sock.close()
+        if view is not None:
+            view.close()
+
+HERO_PIC = r"""
      /\
      ||
      ||
@@ -212,52 +768,82 @@ def Hud():
              /____/\____\
         """
 
-        stats = {
-            "Health": hero_stats["health"],
-            "Armor": hero_stats["armor"],
-            "Weapons": hero_stats["weapons"]
-        }
-
-
-        # This is what the dungeon layout will be 
-
-
-        '''
-        +=============| |=============+
-        |                             |     Room number: 
-        |                             |     Enemies:
-        |                             |     Treasure:
-        |                             |
-        |                             |
-        |                             |
-        |                             |
-        |                             |
-        +=============| |=============+
-        '''
-
-        # This line will present the knight and display derp. 
-        # derp will be replaced by the health information
-        for index, lines in enumerate(hero_pic.split("\n")):
-            if index == 0:
-                print("{0:6}   Name: {1}{2:25}".format(lines, hero_stats["name"],''))
-            elif index == 1:
-                print("{0:5}  Health: {1}{2:25}".format(lines, stats["Health"],''))
-            elif index == 2:
-                print("{0:5}  Armor: {1:25}".format(lines, ''.join(stats["Armor"][0])))
-            elif index == 3:
-                print("{0:5}  Weapons: {1:25}".format(lines, ''.join(stats["Weapons"][0])))
-            else:
-                print("{0:30}".format(lines))
-
-        sleep(3)
-        #os.system("clear")
-        os.system("cls")
-
-
+# This is what the dungeon layout will be
+#   +=============| |=============+
+#   |                             |     Room number:
+#   |                             |     Enemies:
+#   |                             |     Treasure:
+#   |                             |
+#   |                             |
+#   |                             |
+#   |                             |
+#   |                             |
+#   +=============| |=============+
+
+# The picture's first HUD_STAT_ROWS lines carry the hero's name, health, armor and weapons, the rest of
+# it never changes and is formatted once here
+HUD_PIC_LINES = HERO_PIC.split("\n")
+HUD_STAT_ROWS = 4
+HUD_ART = tuple("{0:30}".format(lines) for lines in HUD_PIC_LINES[HUD_STAT_ROWS:])
+
+def hud_stat_lines(hero_stats):
+    return (
+        "{0:6}   Name: {1}{2:25}".format(HUD_PIC_LINES[0], hero_stats["name"], ''),
+        "{0:5}  Health: {1}{2:25}".format(HUD_PIC_LINES[1], hero_stats["health"], ''),
+        "{0:5}  Armor: {1:25}".format(HUD_PIC_LINES[2], ''.join(hero_stats["armor"][0])),
+        "{0:5}  Weapons: {1:25}".format(HUD_PIC_LINES[3], ''.join(hero_stats["weapons"][0]))
+        )
+
+def render_hud(hero_stats):
+    # The knight with the hero's stats next to him
+    print("\n".join(hud_stat_lines(hero_stats) + HUD_ART))
+
+class HudScreen():
+    # Draws the HUD with ANSI escape codes instead of clearing the screen for every frame. The first
+    # frame clears the screen once and draws everything, after that only the stat lines that changed
+    # are rewritten in place. Each frame is a single write().
+    def __init__(self, out=None):
+        if out is None:
+            out = sys.stdout
+        self.out = out
+        self.shown = None
+        self.frames = 0
+        self.bytes_written = 0
+        if os.name == "nt":
+            # Turns on escape code handling in the Windows console
+            os.system("")
+
+    def frame(self, hero_stats):
+        lines = hud_stat_lines(hero_stats)
+        if self.shown is None:
+            # Clear, cursor home, then the whole HUD
+            text = "\x1b[2J\x1b[H" + "\n".join(lines + HUD_ART) + "\n"
+        else:
+            changes = []
+            for row, line in enumerate(lines):
+                if line != self.shown[row]:
+                    # Cursor to the start of the row, the new line, erase what's left of the old one
+                    changes.append("\x1b[{0};1H{1}\x1b[K".format(row + 1, line))
+            if not changes:
+                return
+            # Park the cursor under the picture again
+            changes.append("\x1b[{0};1H".format(len(lines) + len(HUD_ART) + 1))
+            text = "".join(changes)
+        self.out.write(text)
+        self.out.flush()
+        self.shown = lines
+        self.frames += 1
+        self.bytes_written += len(text)
+
+def Hud(mode="shm"):
+    screen = HudScreen()
+    watch_hero(mode, screen.frame)
     return
 
 
 if __name__ == "__main__":
-    Hud()
-
+    if len(sys.argv) > 1:
+        Hud(sys.argv[1])
+    else:
+        Hud()
 